@@ -0,0 +1,80 @@
+"""
+Benchmark of the combined scanner against running each expression on its own
+
+Usage:
+    python3 bin/benchmark_scanner.py <FOLDER_OR_FILE> [<FOLDER_OR_FILE> …]
+
+It loads every JS, HTML, CSS and TXT file found in the paths provided and
+checks that both approaches return exactly the same matches.
+"""
+
+import os
+import re
+import sys
+import time
+
+import neto.lib.scanner as scanner
+import neto.plugins.analysis.cryptojacking as cryptojacking
+import neto.plugins.analysis.entities as entities
+import neto.plugins.analysis.suspicious as suspicious
+
+TABLES = {
+    "entities": entities.REGEXPS,
+    "suspicious": suspicious.REGEXPS,
+    "cryptojacking": cryptojacking.REGEXPS,
+}
+
+
+def loadCorpus(paths):
+    corpus = []
+    for path in paths:
+        if os.path.isfile(path):
+            filePaths = [path]
+        else:
+            filePaths = [os.path.join(root, f) for root, _, files in os.walk(path) for f in files]
+        for f in filePaths:
+            if f.split(".")[-1].lower() in ["js", "html", "htm", "css", "txt"]:
+                with open(f, "rb") as iF:
+                    corpus.append(iF.read())
+    return corpus
+
+
+def perRegex(corpus, rules):
+    return [{r: re.findall(r, data) for r in rules} for data in corpus]
+
+
+def combined(corpus, ruleScanner):
+    return [ruleScanner.scan(data) for data in corpus]
+
+
+def main(args):
+    corpus = loadCorpus(args)
+    size = sum(len(data) for data in corpus)
+    print("Files: {}. Size: {:.2f} MB.\n".format(len(corpus), size / 1024 / 1024))
+
+    totalOld = totalNew = 0
+    for name, table in TABLES.items():
+        rules = scanner.flattenRules(table)
+        ruleScanner = scanner.RuleScanner(rules)
+
+        start = time.time()
+        expected = perRegex(corpus, rules)
+        old = time.time() - start
+
+        start = time.time()
+        obtained = combined(corpus, ruleScanner)
+        new = time.time() - start
+
+        totalOld += old
+        totalNew += new
+        print("{:<15}{:>4} rules\tper regex: {:8.2f}s\tcombined: {:8.2f}s\tspeedup: {:5.2f}x\tidentical: {}".format(
+            name, len(rules), old, new, old / new, expected == obtained
+        ))
+
+    print("\n{:<15}\t\tper regex: {:8.2f}s\tcombined: {:8.2f}s\tspeedup: {:5.2f}x".format(
+        "total", totalOld, totalNew, totalOld / totalNew
+    ))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,60 @@
+"""
+Management of the database of well-known libraries
+
+Usage:
+    python3 bin/known_libraries.py add <NAME> <VERSION> <FILE> [<FILE> …]
+    python3 bin/known_libraries.py remove <NAME>@<VERSION>
+    python3 bin/known_libraries.py list
+
+The files added should be trusted copies of the library downloaded from its
+official distribution. Both the exact hash and the normalised fingerprint of
+each file are stored, so copies whose license header or source map comment
+have been removed are also recognised.
+"""
+
+import collections
+import sys
+
+import neto.lib.libraries as libraries
+
+
+def add(db, name, version, paths):
+    for path in paths:
+        with open(path, "rb") as iF:
+            library = db.add(name, version, iF.read())
+        print("[*] '{}' added as {}.".format(path, library))
+    db.save()
+
+
+def remove(db, library):
+    removed = db.remove(library)
+    if removed:
+        db.save()
+        print("[*] {} hashes of {} removed.".format(removed, library))
+    else:
+        print("[X] {} was not found.".format(library))
+
+
+def show(db):
+    counter = collections.Counter(db.sha256.values())
+    for library in sorted(counter):
+        print("{:<40}{:>4} files".format(library, counter[library]))
+    print("\n[*] {} libraries found at '{}'.".format(len(db), db.dbPath))
+
+
+def main(args):
+    db = libraries.KnownLibraries(libraries.getDatabasePath())
+
+    if len(args) >= 4 and args[0] == "add":
+        add(db, args[1], args[2], args[3:])
+    elif len(args) == 2 and args[0] == "remove":
+        remove(db, args[1])
+    elif len(args) == 1 and args[0] == "list":
+        show(db)
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
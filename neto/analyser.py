@@ -19,29 +19,158 @@
 #
 ################################################################################
 
-import argparse
+import concurrent.futures
 import datetime as dt
 import json
 import os
 import tempfile
+import time
 import traceback
 import shutil
+import sqlite3
 import sys
-import zipfile
+
+import requests
 
 import neto
 import neto.lib.crypto.md5 as md5
+import neto.lib.contents as contents
+import neto.lib.crypto.multiple_hashes as hasher
+import neto.lib.filecache as filecache
+import neto.lib.registry as registry
+import neto.lib.storage as storage
 import neto.lib.utils as utils
 import neto.lib.validations as validations
 from neto.lib.extensions import Extension
-from neto.downloaders.http import HTTPResource
+from neto.downloaders.bulk import BulkDownloader
+from neto.downloaders.http import HTTPResource, PARTIAL_FILE
+
+
+# Number of extensions found (hits) or not (misses) among the previous analysis
+# and number of previous analysis updated running only the plugins changed
+CACHE_STATS = {
+    "hits": 0,
+    "misses": 0,
+    "updated": 0,
+}
+
+
+def isUpToDate(ext):
+    """
+    Checks if an analysis was performed with the current version and plugins
+
+    The analysis whose sha256 is a SHA1, as stored by previous versions, are
+    never up to date.
+
+    Params:
+    -------
+        ext: an Extension object.
+
+    Returns:
+    --------
+        A boolean.
+    """
+    return (
+        not hasher.isLegacyDigest(getattr(ext, "_digest", None)) and
+        getattr(ext, "_analyser_version", None) == neto.__version__ and
+        getattr(ext, "_plugins_fingerprint", None) == registry.getRegistry().getFingerprint()
+    )
+
+
+def writeAnalysis(ext, analysisPath):
+    """
+    Stores the analysis of an extension as <md5>.json and in the store
+
+    The store is written first, in a single transaction with its index, so
+    if it fails nothing is written. The JSON file is replaced afterwards at
+    once; if that fails, the error is reported but the analysis is still
+    found in the store, which is read before the files.
+
+    Params:
+    -------
+        ext: an Extension object.
+        analysisPath: the folder where the analysis are stored.
+
+    Returns:
+    --------
+        The path of the file written.
+
+    Raises:
+    -------
+        sqlite3.Error: if the analysis cannot be stored.
+    """
+    outputFile = os.path.join(analysisPath, ext.digest["md5"] + ".json")
+    text = json.dumps(ext.__dict__, indent=2)
+    storage.getStore(analysisPath).put(text, os.path.abspath(outputFile))
+
+    tmpFile = outputFile + ".tmp"
+    try:
+        with open(tmpFile, "w") as oF:
+            oF.write(text)
+        os.replace(tmpFile, outputFile)
+    except OSError as e:
+        print("[X]\tThe analysis of '{}' was stored but '{}' could not be written: {}".format(ext.filename, outputFile, str(e)))
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+    return outputFile
+
+
+def getPreviousAnalysis(digest, analysisPath, stale=False):
+    """
+    Recovers a previous analysis of the same file if it is still valid
+
+    The analysis are looked for in the store of the analysis folder and, if
+    not found, as <md5>.json. A previous analysis is only valid if
+    the SHA256 of the file is the same and if it was performed with the current
+    version of Neto and the same plugins. The analysis stored by previous
+    versions with a SHA1 as sha256 are only returned to be updated.
+
+    Params:
+    -------
+        digest: the hashes of the file as returned by
+            neto.lib.crypto.multiple_hashes.calculateHash.
+        analysisPath: the folder where the analysis are stored.
+        stale: a boolean that defines whether to return the analysis performed
+            with other versions or plugins too, so that they can be updated.
+
+    Returns:
+    --------
+        An Extension object or None if there is no valid analysis.
+    """
+    try:
+        text = storage.getStore(analysisPath).getText(digest["md5"])
+        if text is None:
+            # Analysis performed before the store existed
+            with open(os.path.join(analysisPath, digest["md5"] + ".json")) as iF:
+                text = iF.read()
+        previous = json.loads(text)
+    except (OSError, ValueError, sqlite3.Error):
+        return None
+
+    previousDigest = previous.get("_digest") or {}
+    if hasher.isLegacyDigest(previousDigest):
+        # Previous versions stored a SHA1 as sha256. Those analysis are never
+        # up to date, but they can be updated with the right hashes.
+        if previousDigest["sha256"] != digest.get("sha1"):
+            return None
+    elif previousDigest.get("sha256") != digest["sha256"]:
+        return None
+
+    ext = Extension(jText=text)
+    if not stale and not isUpToDate(ext):
+        return None
+    return ext
 
 
-def analyseExtensionFromFile(filePath, quiet=False, analysisPath=utils.getConfigPath()["appPathDataAnalysis"], tmpPath=tempfile.gettempdir()):
+def analyseExtensionFromFile(filePath, quiet=False, analysisPath=utils.getConfigPath()["appPathDataAnalysis"], tmpPath=tempfile.gettempdir(), inMemory=False, force=False, reanalyseStale=False, digest=None):
     """
     Main function for Neto Analyser.
 
-    Performs an analysis of a locally stored file.
+    Performs an analysis of a locally stored file. If the same file has
+    already been analysed with the same version of Neto and the same plugins,
+    the previous analysis is returned instead. If reanalyseStale is set, a
+    previous analysis performed with other plugins is updated running only the
+    plugins that have changed.
 
     Params:
     -------
@@ -49,6 +178,15 @@ def analyseExtensionFromFile(filePath, quiet=False, analysisPath=utils.getConfig
         quiet: A boolean that defines whether to print an output.
         analysisPath: The folder where the extension will be stored.
         tmpPath: The folder where unzipped files will be created.
+        inMemory: A boolean that defines whether the extension is analysed
+            without extracting its files to tmpPath.
+        force: A boolean that defines whether to analyse the extension again
+            even if a valid previous analysis is found.
+        reanalyseStale: A boolean that defines whether to update the previous
+            analysis performed with other plugins instead of analysing the
+            extension again from scratch.
+        digest: the hashes of the file if they have already been calculated,
+            for instance while downloading it, so that it is not read again.
 
     Returns:
     --------
@@ -56,25 +194,139 @@ def analyseExtensionFromFile(filePath, quiet=False, analysisPath=utils.getConfig
     """
     # Process the filePath
     if os.path.isfile(filePath):
-        ext = Extension(filePath, tFolder=tmpPath)
+        digest = digest or hasher.calculateHashFromFile(filePath)
 
-        print("[*]\tData collected:\n" + str(ext))
+        if not force:
+            ext = getPreviousAnalysis(digest, analysisPath, stale=reanalyseStale)
+            if ext and isUpToDate(ext) and not (reanalyseStale and ext.getStalePlugins()):
+                CACHE_STATS["hits"] += 1
+                if not quiet:
+                    print("[*]\tThe extension had already been analysed with the same version and plugins. Use --force to analyse it again.")
+                    print("[*]\tAdditional information about the extension can be found as a JSON at {}…".format(os.path.join(analysisPath, digest["md5"] + ".json")))
+                return ext
+            elif ext:
+                stale = ext.reanalyse(filePath, tFolder=tmpPath, inMemory=inMemory)
+                CACHE_STATS["updated"] += 1
+                outputFile = writeAnalysis(ext, analysisPath)
+                if not quiet:
+                    print("[*]\tThe previous analysis has been updated running {} plugins: {}.".format(len(stale), ", ".join(stale) or "none"))
+                    print("[*]\tAdditional information about the extension can be found as a JSON at {}…".format(outputFile))
+                return ext
+            CACHE_STATS["misses"] += 1
+
+        ext = Extension(filePath, tFolder=tmpPath, inMemory=inMemory, digest=digest)
 
         # Store the features extracted
-        outputFile = os.path.join(analysisPath, ext.digest["md5"] + ".json")
+        outputFile = writeAnalysis(ext, analysisPath)
         if not quiet:
+            print("[*]\tData collected:\n" + str(ext))
             print("[*]\tAdditional information about the extension can be found as a JSON at {}…".format(outputFile))
-        with open(outputFile, "w") as oF:
-            oF.write(json.dumps(ext.__dict__, indent=2))
         return ext
     else:
         raise FileNotFoundError("The filepath provided ({}) does not match with a file.".format(filePath))
 
-def analyseExtensionFromURI(uri, quiet=False, analysisPath=utils.getConfigPath()["appPathDataAnalysis"], downloadPath=utils.getConfigPath()["appPathDataFiles"], tmpPath=tempfile.gettempdir()):
+def getDownloadFile(uri, downloadPath):
+    """
+    Returns the path where the extension found at a URI is downloaded
+
+    Params:
+    -------
+        uri: the URI of the extension.
+        downloadPath: the folder where the downloaded extensions are stored.
+
+    Returns:
+    --------
+        A string with the path of the file.
+    """
+    # The name of the extension is formed by:
+    #   <source>_<hashed_uri>_<extension_name>
+    # Not that the hash is not the hash of the whole extension
+    if uri.split("/")[-1] != "":
+        fileName = uri.split("/")[-1]
+    else:
+        fileName = "Manual_" + md5.calculateHash(uri)
+    return os.path.join(downloadPath, fileName)
+
+
+def getKnownVersion(uri, analysisPath):
+    """
+    Recovers the version of a URI already analysed to request it conditionally
+
+    Params:
+    -------
+        uri: the URI of the extension.
+        analysisPath: the folder where the analysis are stored.
+
+    Returns:
+    --------
+        A (validators, digest) tuple with the validators received when the
+            URI was downloaded and the hashes of the extension, or None if
+            they are unknown or the extension has no valid analysis anymore.
+    """
+    try:
+        known = storage.getStore(analysisPath).getValidators(uri)
+    except sqlite3.Error:
+        return None
+    if known is None or getPreviousAnalysis(known[1], analysisPath) is None:
+        return None
+    return known
+
+
+def rememberValidators(uri, validators, digest, analysisPath):
+    """
+    Stores the validators received with an extension for the next requests
+
+    Params:
+    -------
+        uri: the URI of the extension.
+        validators: the dictionary returned by HTTPResource.getValidators.
+        digest: the hashes of the extension downloaded.
+        analysisPath: the folder where the analysis are stored.
+    """
+    try:
+        storage.getStore(analysisPath).putValidators(uri, validators, digest)
+    except sqlite3.Error as e:
+        print("[X]\tThe validators of {} could not be stored: {}".format(uri, str(e)))
+
+
+def getUnchangedAnalysis(uri, digest, analysisPath, quiet=False):
+    """
+    Recovers the analysis of an extension the server says has not changed
+
+    Params:
+    -------
+        uri: the URI of the extension.
+        digest: the hashes of the version analysed, as returned by
+            getKnownVersion.
+        analysisPath: the folder where the analysis are stored.
+        quiet: A boolean that defines whether to print an output.
+
+    Returns:
+    --------
+        An Extension object.
+
+    Raises:
+    -------
+        ValueError: if the analysis is not found anymore.
+    """
+    ext = getPreviousAnalysis(digest, analysisPath)
+    if ext is None:
+        raise ValueError("The analysis of the extension at {} is not available anymore. Use --force to download it again.".format(uri))
+    CACHE_STATS["hits"] += 1
+    if not quiet:
+        print("[*]\tThe extension has not changed since it was analysed. Use --force to download it again.")
+        print("[*]\tAdditional information about the extension can be found as a JSON at {}…".format(os.path.join(analysisPath, digest["md5"] + ".json")))
+    return ext
+
+
+def analyseExtensionFromURI(uri, quiet=False, analysisPath=utils.getConfigPath()["appPathDataAnalysis"], downloadPath=utils.getConfigPath()["appPathDataFiles"], tmpPath=tempfile.gettempdir(), inMemory=False, force=False, reanalyseStale=False):
     """
     Main function for Neto Analyser.
 
     Performs an analysis of a URI extension provided using the command line.
+    If the URI was already downloaded and the server sent an ETag or a
+    Last-Modified header, it is requested conditionally and, if it has not
+    changed, the previous analysis is returned without downloading it again.
 
     Params:
     -------
@@ -83,31 +335,36 @@ def analyseExtensionFromURI(uri, quiet=False, analysisPath=utils.getConfigPath()
         analysisPath: The folder where the anbalysis will be stored.
         downloadPath: The folder where the downloaded extension will be stored.
         tmpPath: The folder where unzipped files will be created.
+        inMemory: A boolean that defines whether the extension is analysed
+            without extracting its files to tmpPath.
+        force: A boolean that defines whether to analyse the extension again
+            even if a valid previous analysis is found.
+        reanalyseStale: A boolean that defines whether to update the previous
+            analysis performed with other plugins instead of analysing the
+            extension again from scratch.
 
     Returns:
     --------
         An Extension object.
     """
+    digest = None
     if validations.isURI(uri):
+        known = None if force else getKnownVersion(uri, analysisPath)
         try:
             u =  HTTPResource(uri)
-            data = u.download()
-            if data:
-                # The name of the extension is formed by:
-                #   <source>_<hashed_uri>_<extension_name>
-                # Not that the hash is not the hash of the whole extension
-                if uri.split("/")[-1] != "":
-                    fileName = uri.split("/")[-1]
-                else:
-                    fileName = "Manual_" + md5.calculateHash(u.uri)
-                filePath = os.path.join(downloadPath, fileName)
-                if not quiet:
-                    print("[*]\tRemote file is being stored as {}…".format(filePath))
-                with open(filePath, "wb") as oF:
-                    oF.write(data)
-        except ConnectionError as e:
-            print("[X]\tSomething happened when trying to download the resource. Have we been banned?\n" + str(e))
+            if known:
+                u.setValidators(known[0])
+            filePath = getDownloadFile(u.uri, downloadPath)
+            if not quiet:
+                print("[*]\tRemote file is being stored as {}…".format(filePath))
+            # Hashed while it is written so that it is not read again
+            filePath, digest = u.downloadToFile(filePath)
+        except (ConnectionError, requests.RequestException) as e:
+            print("[X]\tThe resource could not be downloaded even after backing off: " + str(e))
             return
+        if filePath is None:
+            return getUnchangedAnalysis(uri, known[1], analysisPath, quiet=quiet)
+        rememberValidators(uri, u.getValidators(), digest, analysisPath)
     else:
         # If it is not a URI, assume that is a local path
         filePath = uri
@@ -116,10 +373,372 @@ def analyseExtensionFromURI(uri, quiet=False, analysisPath=utils.getConfigPath()
         filePath,
         tmpPath=tmpPath,
         analysisPath=analysisPath,
-        quiet=quiet
+        quiet=quiet,
+        inMemory=inMemory,
+        force=force,
+        reanalyseStale=reanalyseStale,
+        digest=digest
     )
 
 
+def newOutcome(target, error=None):
+    """
+    Creates the outcome of the analysis of a target
+
+    Params:
+    -------
+        target: the local path or the URI to be analysed.
+        error: the exception that prevented the analysis, if any.
+
+    Returns:
+    --------
+        A dictionary as the one returned by analyseTarget.
+    """
+    outcome = {
+        "target": target,
+        "status": "ok",
+        "digest": None,
+        "size": 0,
+        "elapsed": 0,
+        "cached": False,
+        "updated": False,
+        "contents": {"hits": 0, "misses": 0},
+        "error": None,
+        "traceback": None,
+    }
+    if error is not None:
+        outcome["status"] = "error"
+        outcome["error"] = "{}: {}".format(type(error).__name__, str(error))
+        outcome["traceback"] = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    return outcome
+
+
+def downloadTargets(uris, options, downloader):
+    """
+    Downloads a list of URIs returning them as they finish
+
+    Params:
+    -------
+        uris: the list of URIs to be analysed.
+        options: a dictionary with the kwargs to be passed to
+            analyseExtensionFromURI.
+        downloader: the neto.downloaders.bulk.BulkDownloader to be used.
+
+    Returns:
+    --------
+        A generator of (label, kind, target, options, error) tuples, where
+            label is the URI, target the local path of the file downloaded
+            and options the kwargs to be passed to analyseExtensionFromFile,
+            including the digest calculated while downloading. If the
+            download failed, error is the exception raised. The URIs that
+            have not changed since they were analysed are returned with the
+            "unchanged" kind and the digest of the previous version.
+    """
+    fileOptions = {k: v for k, v in options.items() if k != "downloadPath"}
+
+    items = []
+    known = {}
+    used = set()
+    for uri in uris:
+        if not options.get("force"):
+            known[uri] = getKnownVersion(uri, options["analysisPath"])
+        filePath = getDownloadFile(uri, options["downloadPath"])
+        # Several URIs may end with the same name and they are downloaded at
+        # the same time
+        if filePath in used:
+            folder, fileName = os.path.split(filePath)
+            filePath = os.path.join(folder, "Manual_" + md5.calculateHash(uri) + "_" + fileName)
+        used.add(filePath)
+        items.append((uri, filePath, (known.get(uri) or (None,))[0]))
+
+    for index, uri, filePath, digest, validators, error in downloader.iterDownloads(items):
+        if error is None and filePath is None:
+            yield uri, "unchanged", uri, dict(fileOptions, digest=known[uri][1]), None
+            continue
+        if error is None:
+            rememberValidators(uri, validators, digest, options["analysisPath"])
+        yield uri, "file", filePath, dict(fileOptions, digest=digest), error
+
+
+def analyseTarget(kind, target, options):
+    """
+    Analyses a single file or URI catching any error found
+
+    It is a module level function so that it can be sent to a process pool by
+    runBatch.
+
+    Params:
+    -------
+        kind: either "file", "uri" or "unchanged" for a URI whose previous
+            analysis is reused (see downloadTargets).
+        target: the local path or the URI to be analysed.
+        options: a dictionary with the kwargs to be passed to
+            analyseExtensionFromFile or analyseExtensionFromURI.
+
+    Returns:
+    --------
+        A dictionary with the outcome of the analysis.
+            {
+                "target": "/home/user/extension.xpi",
+                "status": "ok",
+                "digest": "…",
+                "size": 12345,
+                "elapsed": 0.52,
+                "cached": False,
+                "updated": False,
+                "contents": {"hits": 12, "misses": 34},
+                "error": None,
+                "traceback": None
+            }
+            where contents are the reads of the files of the extension served
+            by the content providers from their cache or not.
+    """
+    outcome = newOutcome(target)
+
+    hits = CACHE_STATS["hits"]
+    updated = CACHE_STATS["updated"]
+    reads = contents.getTotals()
+    start = time.time()
+    try:
+        if kind == "uri":
+            ext = analyseExtensionFromURI(target, **options)
+        elif kind == "unchanged":
+            ext = getUnchangedAnalysis(target, options["digest"], options["analysisPath"], quiet=options.get("quiet", False))
+        else:
+            ext = analyseExtensionFromFile(target, **options)
+        if ext is None:
+            raise ConnectionError("The resource could not be downloaded.")
+        outcome["digest"] = ext.digest["md5"]
+        outcome["size"] = ext.size or 0
+        outcome["cached"] = CACHE_STATS["hits"] > hits
+        outcome["updated"] = CACHE_STATS["updated"] > updated
+    except Exception as e:
+        outcome["status"] = "error"
+        outcome["error"] = "{}: {}".format(type(e).__name__, str(e))
+        outcome["traceback"] = traceback.format_exc()
+    outcome["elapsed"] = time.time() - start
+    outcome["contents"] = {k: v - reads[k] for k, v in contents.getTotals().items()}
+    return outcome
+
+
+def runBatch(kind, targets, options, jobs=1, offset=0, total=None, quiet=False, downloader=None):
+    """
+    Analyses a list of files or URIs, optionally using several processes
+
+    With jobs greater than 1, the targets are spread across a pool of
+    processes. Each worker writes the JSON of the analysis as soon as it
+    finishes and the progress is printed here as results arrive, so the
+    counter is always increasing.
+
+    If a downloader is provided, the URIs are downloaded concurrently and
+    each extension is analysed as soon as its download finishes, while the
+    rest are still being downloaded.
+
+    Params:
+    -------
+        kind: either "file" or "uri".
+        targets: the list of local paths or URIs to be analysed.
+        options: a dictionary with the kwargs to be passed to analyseTarget.
+        jobs: the number of processes to be used.
+        offset: the number of targets already skipped (used in the progress).
+        total: the total number of targets (used in the progress).
+        quiet: a boolean that defines whether to print the data of each
+            extension when running with a single process.
+        downloader: a neto.downloaders.bulk.BulkDownloader used to download
+            the URIs before analysing them.
+
+    Returns:
+    --------
+        A dictionary with the summary of the batch.
+            {
+                "analysed": 10,
+                "hits": 4,
+                "misses": 6,
+                "updated": 0,
+                "failures": [ {…} ],
+                "size": 123456,
+                "elapsed": 12.3,
+                "contents": {"hits": 120, "misses": 340},
+                "file_cache": {…}
+            }
+    """
+    total = total or len(targets)
+    summary = {
+        "analysed": 0,
+        "hits": 0,
+        "misses": 0,
+        "updated": 0,
+        "failures": [],
+        "size": 0,
+        "elapsed": 0,
+        "contents": {"hits": 0, "misses": 0},
+        "file_cache": None,
+    }
+
+    def collect(i, outcome):
+        for key in summary["contents"]:
+            summary["contents"][key] += outcome["contents"][key]
+        if outcome["status"] == "ok":
+            summary["analysed"] += 1
+            summary["size"] += outcome["size"]
+            if outcome["cached"]:
+                summary["hits"] += 1
+                status = "Already analysed"
+            elif outcome["updated"]:
+                summary["updated"] += 1
+                status = "Updated"
+            else:
+                if not options.get("force"):
+                    summary["misses"] += 1
+                status = "Analysed"
+            if jobs > 1:
+                print("[*] {}/{}\t({}) {} in {:.2f}s: {}".format(
+                    i, total, dt.datetime.now(), status, outcome["elapsed"], outcome["target"]
+                ))
+        else:
+            summary["failures"].append(outcome)
+            print("[X] {}/{}\t({}) Something happened when processing {}...".format(i, total, dt.datetime.now(), outcome["target"]))
+            print("[X]\tError Message: '{}'".format(outcome["error"]))
+
+    fileCache = filecache.getCache()
+    if fileCache.enabled:
+        before = fileCache.getStats()
+
+    start = time.time()
+
+    # Each item is a (label, kind, target, options, error) tuple
+    if kind == "uri" and downloader is not None:
+        work = downloadTargets(targets, options, downloader)
+    else:
+        work = ((target, kind, target, options, None) for target in targets)
+
+    if jobs <= 1:
+        for i, (label, targetKind, target, targetOptions, error) in enumerate(work):
+            print("[*] " + str(i+1+offset) + "/"+ str(total) +  "\t(" + str(dt.datetime.now()) + ") Processing: " + label)
+            if error is not None:
+                outcome = newOutcome(label, error)
+            else:
+                outcome = analyseTarget(targetKind, target, dict(targetOptions, quiet=quiet))
+                outcome["target"] = label
+            collect(i+1+offset, outcome)
+    else:
+        pending = iter(work)
+        done = offset
+
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        # Only a few tasks per worker are queued to keep memory bounded
+        running = {}
+        try:
+            while True:
+                for label, targetKind, target, targetOptions, error in pending:
+                    if error is not None:
+                        done += 1
+                        collect(done, newOutcome(label, error))
+                        continue
+                    # Workers do not print the data collected to keep the output readable
+                    running[pool.submit(analyseTarget, targetKind, target, dict(targetOptions, quiet=True))] = label
+                    if len(running) >= jobs * 4:
+                        break
+                if not running:
+                    break
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    done += 1
+                    label = running.pop(future)
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        # The worker died (a crash, the OOM killer…)
+                        broken = broken or isinstance(e, concurrent.futures.process.BrokenProcessPool)
+                        outcome = newOutcome(label, e)
+                    outcome["target"] = label
+                    collect(done, outcome)
+                if broken:
+                    # The rest of the tasks of a broken pool are lost too
+                    for future, label in list(running.items()):
+                        done += 1
+                        collect(done, newOutcome(label, future.exception()))
+                    running.clear()
+                    print("[X]\tA worker died unexpectedly. Starting a new pool of processes…")
+                    pool.shutdown(wait=False)
+                    pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        except KeyboardInterrupt:
+            print("[X]\tInterrupted. Waiting for the running analysis to finish…")
+            for future in running:
+                future.cancel()
+            raise
+        finally:
+            pool.shutdown()
+
+    summary["elapsed"] = time.time() - start
+
+    if fileCache.enabled:
+        # The statistics are stored in the database by all the workers
+        after = fileCache.getStats()
+        summary["file_cache"] = {
+            "hits": after["hits"] - before["hits"],
+            "misses": after["misses"] - before["misses"],
+            "corpus": after,
+        }
+    return summary
+
+
+def printSummary(summary, failuresReport=None):
+    """
+    Prints the throughput of a batch and the files that could not be analysed
+
+    Params:
+    -------
+        summary: the dictionary returned by runBatch.
+        failuresReport: the path of a file where the failures will be written
+            as a JSON. If None, they are only printed.
+    """
+    processed = summary["analysed"] + len(summary["failures"])
+    elapsed = summary["elapsed"] or 1e-9
+
+    print("[*]\tProcessed {} extensions in {:.2f}s: {} analysed and {} failed.".format(
+        processed, summary["elapsed"], summary["analysed"], len(summary["failures"])
+    ))
+    print("[*]\tThroughput: {:.2f} extensions/s ({:.2f} MB/s).".format(
+        processed / elapsed, summary["size"] / 1024 / 1024 / elapsed
+    ))
+    if summary["hits"] + summary["misses"]:
+        print("[*]\tPrevious analysis reused: {} hits and {} misses ({:.2f}% hit rate).".format(
+            summary["hits"], summary["misses"], 100 * summary["hits"] / (summary["hits"] + summary["misses"])
+        ))
+    if summary["updated"]:
+        print("[*]\tPrevious analysis updated with the plugins changed: {}.".format(summary["updated"]))
+
+    reads = summary["contents"]
+    if reads["hits"] + reads["misses"]:
+        print("[*]\tFiles read from memory: {} hits and {} misses ({:.2f}% hit rate).".format(
+            reads["hits"], reads["misses"], 100 * reads["hits"] / (reads["hits"] + reads["misses"])
+        ))
+
+    if summary["file_cache"]:
+        fc = summary["file_cache"]
+        corpus = fc["corpus"]
+        print("[*]\tFile cache: {} hits and {} misses in this batch ({:.2f}% hit rate).".format(
+            fc["hits"], fc["misses"], 100 * fc["hits"] / ((fc["hits"] + fc["misses"]) or 1)
+        ))
+        print("[*]\tFile cache: {} hits and {} misses in the whole corpus ({:.2f}% hit rate). {} entries using {:.2f} MB.".format(
+            corpus["hits"], corpus["misses"], 100 * corpus["hits"] / ((corpus["hits"] + corpus["misses"]) or 1), corpus["entries"], corpus["size"] / 1024 / 1024
+        ))
+        for plugin, stats in corpus["plugins"].items():
+            print("[*]\t\t- {}: {} hits and {} misses.".format(plugin, stats["hits"], stats["misses"]))
+
+    if summary["failures"]:
+        print("[X]\tThe following extensions could not be analysed:")
+        for f in summary["failures"]:
+            print("[X]\t\t- {}: {}".format(f["target"], f["error"]))
+
+        if failuresReport:
+            with open(failuresReport, "w") as oF:
+                oF.write(json.dumps(summary["failures"], indent=2))
+            print("[*]\tThe details of the failures can be found as a JSON at {}…".format(failuresReport))
+
+
 def main(parsed_args):
     """
     Main function for Neto Analyser.
@@ -146,58 +765,66 @@ def main(parsed_args):
     if not os.path.isdir(parsed_args.temporal_path):
         os.makedirs(parsed_args.temporal_path)
 
+    # Done here, before any worker uses the store
+    storage.migrateFolder(parsed_args.analysis_path)
+
+    if parsed_args.import_analysis:
+        print("[*]\tImporting the analysis found at '{}' into the store of '{}'…".format(parsed_args.import_analysis, parsed_args.analysis_path))
+        imported, failed = storage.getStore(parsed_args.analysis_path).importFolder(parsed_args.import_analysis)
+        print("[*]\tAnalysis imported: {}.".format(imported))
+        for f in failed:
+            print("[X]\t\t- {} could not be imported.".format(f))
+        return
+
+    options = {
+        "tmpPath": parsed_args.temporal_path,
+        "analysisPath": parsed_args.analysis_path,
+        "inMemory": parsed_args.in_memory,
+        "force": parsed_args.force,
+        "reanalyseStale": parsed_args.reanalyse_stale,
+    }
+
     # Perform the process depending on the options provided
+    kind = "file"
+    targets = []
     if parsed_args.downloads and os.path.isdir(parsed_args.downloads):
-        files = os.listdir(parsed_args.downloads)
+        # Downloads still in progress or interrupted are not analysed
+        files = [
+            os.path.abspath(os.path.join(parsed_args.downloads, f))
+            for f in os.listdir(parsed_args.downloads)
+            if not PARTIAL_FILE.search(f)
+        ]
         # Order by creation date
         files.sort(key=lambda x: os.path.getmtime(x))
 
-        for i, f in enumerate(files[parsed_args.start:]):
-            filePath = os.path.abspath(os.path.join(parsed_args.downloads, f))
+        for filePath in files:
             if os.path.isfile(filePath):
                 # Extra verification to check if the file name contains a given string
                 if not parsed_args.contains_name or parsed_args.contains_name in filePath:
-                    print("[*] " + str(i+1+parsed_args.start) + "/"+ str(len(files)) +  "\t(" + str(dt.datetime.now()) + ") Processing: " + filePath)
-                    try:
-                        ext = analyseExtensionFromFile(
-                            filePath,
-                            tmpPath=parsed_args.temporal_path,
-                            analysisPath=parsed_args.analysis_path,
-                            quiet=parsed_args.quiet,
-                        )
-                    except Exception as e:
-                        print("[X]\tSomething happened when processing {s}...".format(s=filePath))
-                        print("[X]\tError Message: '{e}'".format(e=e))
-                        #traceback.print_exc()
+                    targets.append(filePath)
     elif parsed_args.uris:
-        for i, uri in enumerate(parsed_args.uris):
-            print("[*] " + str(i+1+parsed_args.start) + "/"+ str(len(parsed_args.uris)) +  "\t(" + str(dt.datetime.now()) + ") Processing: " + uri)
-            try:
-                ext = analyseExtensionFromURI(
-                    uri,
-                    tmpPath=parsed_args.temporal_path,
-                    analysisPath=parsed_args.analysis_path,
-                    downloadPath=parsed_args.download_path,
-                    quiet=parsed_args.quiet
-                )
-            except Exception as e:
-                print("[X]\tSomething happened when processing {s}...".format(s=uri))
-                print("[X]\tError Message: '{e}'".format(e=e))
-                #traceback.print_exc()
+        kind = "uri"
+        options["downloadPath"] = parsed_args.download_path
+        targets = parsed_args.uris
     elif parsed_args.extensions:
-        for i, filePath in enumerate(parsed_args.extensions):
-            print("[*] " + str(i+1+parsed_args.start) + "/"+ str(len(parsed_args.extensions)) +  "\t(" + str(dt.datetime.now()) + ") Processing: " + filePath)
-            try:
-                ext = analyseExtensionFromFile(
-                    filePath,
-                    tmpPath=parsed_args.temporal_path,
-                    analysisPath=parsed_args.analysis_path,
-                    quiet=parsed_args.quiet
-                )
-            except Exception as e:
-                print("[X]\tSomething happened when processing {s}...".format(s=filePath))
-                print("[X]\tError Message: '{e}'".format(e=e))
-                #traceback.print_exc()
+        targets = parsed_args.extensions
+
+    downloader = None
+    if kind == "uri" and parsed_args.max_downloads > 1 and len(targets) - parsed_args.start > 1:
+        downloader = BulkDownloader(parsed_args.max_downloads, parsed_args.max_downloads_per_host)
+
+    summary = runBatch(
+        kind,
+        targets[parsed_args.start:],
+        options,
+        jobs=parsed_args.jobs,
+        offset=parsed_args.start,
+        total=len(targets),
+        quiet=parsed_args.quiet,
+        downloader=downloader
+    )
+    printSummary(summary, failuresReport=parsed_args.failures_report)
+
     if parsed_args.clean:
         print("[*]\tCleaning temporal files from '{}'…".format(parsed_args.temporal_path))
         shutil.rmtree(parsed_args.temporal_path)
@@ -20,15 +20,13 @@
 ################################################################################
 
 import argparse
+import importlib
 import os
 import sys
 import tempfile
 import textwrap
 
 import neto
-import neto.analyser
-import neto.console
-import neto.daemon
 import neto.lib.extra as extra
 import neto.lib.utils as utils
 
@@ -112,6 +110,12 @@ interface.
         action='store',
         help='receives one or several URIs, downloads them and performs the analysis of the extension found there.'
     )
+    analyserGroupMainOptions.add_argument(
+        '--import_analysis',
+        metavar='<PATH>',
+        action='store',
+        help='imports the JSON files of the analysis performed by previous versions of Neto, found in the given folder, into the store of the analysis path.'
+    )
 
     # Other options
     analyserGroupOther = analyserParser.add_argument_group(
@@ -140,6 +144,63 @@ interface.
         action='store',
         help='sets the path where the extensions will be extracted. It is recommended to use a temporal path. Default: {}'.format(os.path.join(tempfile.gettempdir(), "neto", "temporal"))
     )
+    analyserGroupOther.add_argument(
+        '--in_memory',
+        action='store_true',
+        default=False,
+        help='reads the files directly from the extension instead of unzipping them in the temporal path. Plugins requesting a real path will still get their files extracted.'
+    )
+    analyserGroupOther.add_argument(
+        '--contains_name',
+        metavar='<STRING>',
+        action='store',
+        default=None,
+        help='only analyses the files in the downloads folder whose path contains the given string.'
+    )
+    analyserGroupOther.add_argument(
+        '--force',
+        action='store_true',
+        default=False,
+        help='analyses the extensions again even if they had already been analysed with the same version of Neto and the same plugins.'
+    )
+    analyserGroupOther.add_argument(
+        '--reanalyse-stale',
+        dest='reanalyse_stale',
+        action='store_true',
+        default=False,
+        help='updates the previous analysis of the extensions performed with other plugins running only the plugins that have been added or modified since then.'
+    )
+    analyserGroupOther.add_argument(
+        '--jobs',
+        metavar='<N>',
+        action='store',
+        default=1,
+        type=int,
+        help='sets the number of processes used to analyse several extensions at the same time. Each JSON is written as soon as its analysis finishes. Default: 1.'
+    )
+    analyserGroupOther.add_argument(
+        '--max_downloads',
+        metavar='<N>',
+        action='store',
+        default=int(utils.getConfigurationFor("downloader").get("max_downloads") or 16),
+        type=int,
+        help='sets the number of URIs downloaded at the same time when using --uris. Each extension is analysed as soon as it is downloaded while the rest continue. Set it to 1 to download them one after another. Default: %(default)s.'
+    )
+    analyserGroupOther.add_argument(
+        '--max_downloads_per_host',
+        metavar='<N>',
+        action='store',
+        default=int(utils.getConfigurationFor("downloader").get("max_downloads_per_host") or 4),
+        type=int,
+        help='sets the number of URIs of the same host downloaded at the same time when using --uris. Default: %(default)s.'
+    )
+    analyserGroupOther.add_argument(
+        '--failures_report',
+        metavar='<PATH>',
+        action='store',
+        default=None,
+        help='sets a file where the extensions that could not be analysed and their errors will be written as a JSON.'
+    )
     analyserGroupOther.add_argument(
         '--clean',
         action='store_true',
@@ -159,7 +220,7 @@ interface.
         type=int,
         help='sets the start index in case you analyse several files in a folder. This option can be used to relaunch experiments with a big series of files..'
     )
-    analyserParser.set_defaults(func=neto.analyser.main)
+    analyserParser.set_defaults(module="neto.analyser")
 
     # Console parser
     # -------------
@@ -189,7 +250,7 @@ interface.
         default=utils.getConfigurationFor("console")["working_directory"] or utils.getConfigPath()["appPathDataAnalysis"],
         help='sets the path where previous analysis are supposed to be. The loaded analysis will be brought from here.'
     )
-    consoleParser.set_defaults(func=neto.console.main)
+    consoleParser.set_defaults(module="neto.console")
 
     # Daemon parser
     # -------------
@@ -214,6 +275,18 @@ interface.
         help="Host to be listen on",
         default=utils.getConfigurationFor("daemon")["host"] or 'localhost',
     )
+    daemonGroupOptions.add_argument(
+        "--workers",
+        type=int,
+        help="Number of extensions analysed at the same time for the jobs submitted with submit_remote and submit_local",
+        default=int(utils.getConfigurationFor("daemon").get("workers") or 2),
+    )
+    daemonGroupOptions.add_argument(
+        "--max_queue",
+        type=int,
+        help="Number of jobs that can be waiting for a worker. Further submissions are rejected as busy",
+        default=int(utils.getConfigurationFor("daemon").get("max_queue") or 100),
+    )
     daemonGroupOptions.add_argument(
         '--debug',
         action='store_true',
@@ -239,7 +312,7 @@ interface.
         default=utils.getConfigPath()["appPathDataAnalysis"],
         help='sets the analysis folder where the JSON files will be stored.'
     )
-    daemonParser.set_defaults(func=neto.daemon.main)
+    daemonParser.set_defaults(module="neto.daemon")
 
     # About options
     # -------------
@@ -282,7 +355,8 @@ interface.
     if args.license:
         utils.showLicense()
     elif args.subcommand:
-        args.func(args)
+        # Only the module of the subcommand is imported
+        importlib.import_module(args.module).main(args)
     else:
         parser.print_help()
 
@@ -25,16 +25,30 @@ import os
 import os.path
 import sys
 import tempfile
+import threading
 
 import neto
 import neto.analyser as analyser
 import neto.lib.extra as extra
+import neto.lib.registry as registry
 import neto.lib.storage as storage
 import neto.lib.utils as utils
 import neto.lib.validations as validations
 from neto.lib.extensions import Extension
 from neto.downloaders.http import HTTPResource
 
+def removeAnalysisFile(ext):
+    """
+    Removes the JSON file of an analysis already removed from the store
+
+    Params:
+    -------
+        ext: a dictionary as returned by neto.lib.storage.getExtensionList.
+    """
+    if ext["analysis_path"] and os.path.isfile(ext["analysis_path"]):
+        os.remove(ext["analysis_path"])
+
+
 class NetoConsoleMain(cmd.Cmd):
     """
     Neto console application to control the different framework utils
@@ -63,12 +77,74 @@ class NetoConsoleMain(cmd.Cmd):
 
     ruler = '='
 
-    knownExtensions = storage.getExtensionList()
     config = {
         "working_directory": "./"
     }
     selectedExtensions = []
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._knownExtensions = None
+        self._loader = None
+        self._progress = (0, 0)
+
+    def loadExtensions(self):
+        """
+        Starts loading the list of known extensions in the background
+
+        The prompt is shown while the list is being loaded and the commands
+        that need it wait for it.
+        """
+        if self._loader is not None and self._loader.is_alive():
+            return
+
+        def load():
+            try:
+                storage.migrateFolder()
+                self._knownExtensions = storage.getExtensionList(callback=self._setProgress)
+            except Exception as e:
+                print("\n[X] The list of known extensions could not be loaded: {}".format(str(e)))
+                self._knownExtensions = []
+
+        self._loader = threading.Thread(target=load, daemon=True)
+        self._loader.start()
+
+    def _setProgress(self, loaded, total):
+        self._progress = (loaded, total)
+
+    @property
+    def knownExtensions(self):
+        """
+        The list of known extensions as returned by storage.getExtensionList
+
+        It is loaded on first use if it has not been loaded in the background.
+        """
+        if self._knownExtensions is None:
+            self.loadExtensions()
+            if self._loader.is_alive():
+                print("\nWaiting for the list of known extensions… ({}/{})".format(*self._progress))
+            self._loader.join()
+        return self._knownExtensions
+
+    @knownExtensions.setter
+    def knownExtensions(self, value):
+        # Otherwise the loader could replace it with an older list
+        if self._loader is not None:
+            self._loader.join()
+        self._knownExtensions = value
+
+    def preloop(self):
+        self.loadExtensions()
+        self.postcmd(False, "")
+
+    def postcmd(self, stop, line):
+        # Shows the progress in the prompt while the list is being loaded
+        if self._knownExtensions is None and self._loader is not None and self._loader.is_alive():
+            self.prompt = "\nneto (loading extensions {}/{}) > ".format(*self._progress)
+        else:
+            self.prompt = NetoConsoleMain.prompt
+        return stop
+
 
     def do_analyse(self, line):
         """
@@ -140,24 +216,24 @@ class NetoConsoleMain(cmd.Cmd):
         if line.upper() == 'ALL':
             print("\nDeleting all analysis…\n")
             for ext in self.knownExtensions:
-                if os.path.isfile(ext["analysis_path"]):
-                    os.remove(ext["analysis_path"])
-                    self.knownExtensions.remove(ext)
+                if storage.getStore().delete(ext["md5"]):
+                    removeAnalysisFile(ext)
                     counter += 1
+            self.knownExtensions = []
         elif line.upper() == 'SELECTED':
             print("\nDeleting selected analysis…\n")
             for sel in self.selectedExtensions:
                 for ext in self.knownExtensions:
-                    if sel == ext["name"] and os.path.isfile(ext["analysis_path"]):
-                        os.remove(ext["analysis_path"])
+                    if sel == ext["name"] and storage.getStore().delete(ext["md5"]):
+                        removeAnalysisFile(ext)
                         self.knownExtensions.remove(ext)
                         self.selectedExtensions.remove(sel)
                         counter += 1
         elif line[-1] == "*":
             extensionNames = []
             for ext in self.knownExtensions:
-                if ext["name"].startswith(line[:-1].lower()) and os.path.isfile(ext["analysis_path"]):
-                    os.remove(ext["analysis_path"])
+                if ext["name"].startswith(line[:-1].lower()) and storage.getStore().delete(ext["md5"]):
+                    removeAnalysisFile(ext)
                     self.knownExtensions.remove(ext)
                     if ext["name"] in self.selectedExtensions:
                         self.selectedExtensions.remove(ext["name"])
@@ -165,8 +241,8 @@ class NetoConsoleMain(cmd.Cmd):
         else:
             extensionNames = []
             for ext in self.knownExtensions:
-                if ext["name"] == line and os.path.isfile(ext["analysis_path"]):
-                    os.remove(ext["analysis_path"])
+                if ext["name"] == line and storage.getStore().delete(ext["md5"]):
+                    removeAnalysisFile(ext)
                     self.knownExtensions.remove(ext)
                     if ext["name"] in self.selectedExtensions:
                         self.selectedExtensions.remove(ext["name"])
@@ -224,10 +300,9 @@ class NetoConsoleMain(cmd.Cmd):
         for e in self.knownExtensions:
             if line == e["name"]:
                 print("\nShowing details of this extension…\n")
-                with open(e["analysis_path"], "r") as iF:
-                    ext = Extension(jText=iF.read())
-                    print(ext)
-                    return
+                ext = Extension(jText=storage.getStore().getText(e["md5"]))
+                print(ext)
+                return
         print("\nNo analysis found for '{}'.".format(line))
 
     def complete_details(self, text, line, begidx, endidx):
@@ -269,10 +344,9 @@ class NetoConsoleMain(cmd.Cmd):
         for e in self.knownExtensions:
             if line == e["name"]:
                 print("\nShowing the whole JSON for this extension…\n")
-                with open(e["analysis_path"], "r") as iF:
-                    print(iF.read())
-                    print()
-                    return
+                print(storage.getStore().getText(e["md5"]))
+                print()
+                return
         print("\nNo analysis found for '{}'.".format(line))
 
     def complete_full_details(self, text, line, begidx, endidx):
@@ -288,27 +362,39 @@ class NetoConsoleMain(cmd.Cmd):
         """
     This command will list any extension containing a given text.
 
-    The analyst will be able to make a literal search of any text found inside
-    the results thrown by the Neto analyser.
+    The analyst will be able to search the words found in the entities, domains,
+    permissions, manifest, comments and file name of the extensions analysed.
+    The search can be limited to one of them using 'field:text' and a trailing
+    '*' finds the words starting with the text. Texts between double quotes or
+    without any word are looked for literally in the results thrown by the Neto
+    analyser, which is much slower.
 
     Examples:
         grep tabs
+        grep permissions:tabs
+        grep domain:coinhive.com
+        grep url:example*
+        grep "eval("
         """
         matchedExtensions = []
         if self.selectedExtensions:
-            for name in self.selectedExtensions:
-                for ext in self.knownExtensions:
-                    if name == ext["name"]:
-                        with open(ext["analysis_path"], "r") as iF:
-                            text = iF.read()
-                            if line in text:
-                                matchedExtensions.append(name)
+            targets = [ext for ext in self.knownExtensions if ext["name"] in self.selectedExtensions]
         else:
-            for ext in self.knownExtensions:
-                with open(ext["analysis_path"], "r") as iF:
-                    text = iF.read()
-                    if line in text:
-                        matchedExtensions.append(ext["name"])
+            targets = self.knownExtensions
+
+        if len(line) > 1 and line[0] == line[-1] == '"':
+            line = line[1:-1]
+            found = None
+        else:
+            found = storage.getStore().search(line)
+
+        if found is not None:
+            matchedExtensions = [ext["name"] for ext in targets if ext["md5"] in found]
+        else:
+            names = {ext["md5"]: ext["name"] for ext in targets}
+            for md5, text in storage.getStore().iterTexts([ext["md5"] for ext in targets]):
+                if line in text:
+                    matchedExtensions.append(names[md5])
         print("\nExtensions that contain the text '{}': {}".format(line, len(matchedExtensions)))
 
         # Print matched extensions name
@@ -390,6 +476,17 @@ class NetoConsoleMain(cmd.Cmd):
         return completions
     '''
 
+    def do_reload(self, line):
+        """
+    This command loads again the analysis plugins and the thirdparty collectors.
+
+    The user plugins are already loaded again automatically when they change,
+    but this command also reloads the plugins shipped with Neto.
+        """
+        print("\nReloading the plugins…")
+        loaded = registry.getRegistry().reload()
+        print("Analysis plugins loaded: {}. Thirdparty collectors loaded: {}.\n".format(loaded["analysis"], loaded["thirdparties"]))
+
     def do_select(self, line):
         """
     This command will select an analysis and will let the user interact with the
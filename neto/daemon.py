@@ -23,69 +23,584 @@
 # Example based on json-rpc documentation:
 #   <https://json-rpc.readthedocs.io/en/latest/quickstart.html>
 
+import base64
+import binascii
+import functools
+import json
 import os
+import re
 import sys
+import tempfile
+import threading
+import time
+import zipfile
 
 from jsonrpc import JSONRPCResponseManager, dispatcher
+from jsonrpc.exceptions import JSONRPCDispatchException
 from werkzeug.wrappers import Request, Response
 from werkzeug.serving import run_simple
 
 import neto
+import neto.analyser as analyser
 import neto.lib.crypto.md5 as md5
+import neto.lib.crypto.multiple_hashes as hasher
+import neto.lib.jobs as jobs
+import neto.lib.metrics as metrics
+import neto.lib.registry as registry
+import neto.lib.resultcache as resultcache
+import neto.lib.storage as storage
+import neto.lib.utils as utils
 from neto.lib.extensions import Extension
 from neto.downloaders.http import HTTPResource
 
 
 DOWNLOADS_PATH = "./downloads"
+ANALYSIS_PATH = utils.getConfigPath()["appPathDataAnalysis"]
+
+# Maximum number of bytes of an extension received by analyse_bytes or /upload
+MAX_UPLOAD_SIZE = 256 * 1024 * 1024
+
+# JSON-RPC error codes of the daemon, in the range reserved for the server
+BUSY_ERROR = -32000
+JOB_NOT_FOUND_ERROR = -32001
+INVALID_PARAMS_ERROR = -32602
+
+# The queue of the jobs submitted asynchronously
+JOBS = None
+
+# The cache of the analysis returned
+RESULTS = None
+
+_globalsLock = threading.Lock()
+
+RPC_REQUESTS = metrics.counter(
+    "neto_rpc_requests_total",
+    "Requests answered by method and status (ok or error).",
+    ("method", "status")
+)
+RPC_DURATION = metrics.histogram(
+    "neto_rpc_duration_seconds",
+    "Time spent answering the requests by method.",
+    ("method",)
+)
+ANALYSIS_FAILURES = metrics.counter(
+    "neto_analysis_failures_total",
+    "Extensions that could not be analysed by source and type of exception.",
+    ("source", "exception")
+)
+metrics.gauge(
+    "neto_jobs_queued",
+    "Jobs waiting for a worker.",
+    function=lambda: JOBS.getDepth() if JOBS else 0
+)
+
+
+def getResultCacheLookups():
+    """
+    Returns the lookups in the result cache for the metrics
+
+    Returns:
+    --------
+        A dictionary where the key is a (kind, result) tuple and the value the
+            number of lookups.
+    """
+    lookups = {}
+    if RESULTS:
+        for kind, stats in RESULTS.getStats().items():
+            if kind in ["uri", "sha256"]:
+                lookups[(kind, "hit")] = stats["hits"]
+                lookups[(kind, "miss")] = stats["misses"]
+    return lookups
+
+
+def getResultCacheHitRatios():
+    """
+    Returns the ratio of hits in the result cache for the metrics
+
+    Returns:
+    --------
+        A dictionary where the key is a (kind,) tuple and the value the ratio of
+            lookups that were hits.
+    """
+    lookups = getResultCacheLookups()
+    ratios = {}
+    for kind in ["uri", "sha256"]:
+        total = lookups.get((kind, "hit"), 0) + lookups.get((kind, "miss"), 0)
+        if total:
+            ratios[(kind,)] = lookups[(kind, "hit")] / total
+    return ratios
+
+
+metrics.counter(
+    "neto_result_cache_lookups_total",
+    "Lookups in the result cache by kind of key and result (hit or miss).",
+    ("kind", "result"),
+    function=getResultCacheLookups
+)
+metrics.gauge(
+    "neto_result_cache_hit_ratio",
+    "Ratio of the lookups in the result cache that were hits by kind of key.",
+    ("kind",),
+    function=getResultCacheHitRatios
+)
+metrics.gauge(
+    "neto_result_cache_bytes",
+    "Approximate size of the entries of the result cache kept in memory.",
+    function=lambda: RESULTS.getStats()["size"] if RESULTS else 0
+)
+
+
+def instrument(function):
+    """
+    Decorator that records the requests and the duration of a JSON-RPC method
+
+    Args:
+    -----
+        function: the function of the method.
+
+    Returns:
+    --------
+        The decorated function.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = function(*args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            RPC_DURATION.observe(time.perf_counter() - start, (function.__name__,))
+            RPC_REQUESTS.inc((function.__name__, status))
+    return wrapper
+
+
+def countFailures(source):
+    """
+    Decorator that counts the exceptions raised when analysing an extension
+
+    Args:
+    -----
+        source: the label of the source of the extensions analysed.
+
+    Returns:
+    --------
+        The decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                ANALYSIS_FAILURES.inc((source, type(e).__name__))
+                raise
+        return wrapper
+    return decorator
+
+
+def getJobQueue():
+    """
+    Returns the queue of jobs of the daemon, creating it on first use
+
+    The settings are read from the `workers` and `max_queue` options of the
+    daemon configuration.
+
+    Returns:
+    --------
+        A neto.lib.jobs.JobQueue.
+    """
+    global JOBS
+    with _globalsLock:
+        if JOBS is None:
+            config = utils.getConfigurationFor("daemon")
+            workers = config.get("workers")
+            maxQueued = config.get("max_queue")
+            JOBS = jobs.JobQueue(
+                int(workers if workers not in [None, ""] else 2),
+                int(maxQueued if maxQueued not in [None, ""] else 100)
+            )
+        return JOBS
+
+
+def getResultCache():
+    """
+    Returns the cache of the analysis of the daemon, creating it on first use
+
+    The analysis are cached for the version returned by getAnalysisVersion.
+    The settings are read from the `result_cache_size` (in MB),
+    `result_cache_ttl` (in seconds) and `result_cache_persistent` options of
+    the daemon configuration.
+
+    Returns:
+    --------
+        A neto.lib.resultcache.ResultCache.
+    """
+    global RESULTS
+    with _globalsLock:
+        if RESULTS is None:
+            config = utils.getConfigurationFor("daemon")
+            maxSize = config.get("result_cache_size")
+            ttl = config.get("result_cache_ttl")
+            persistent = str(config.get("result_cache_persistent") or "").lower() in ["yes", "true", "1"]
+            RESULTS = resultcache.ResultCache(
+                int(maxSize if maxSize not in [None, ""] else 64) * 1024 * 1024,
+                int(ttl if ttl not in [None, ""] else 3600),
+                os.path.join(utils.getConfigPath()["appPathData"], "result_cache.sqlite") if persistent else None,
+                getAnalysisVersion
+            )
+        return RESULTS
+
+
+def getAnalysisVersion():
+    """
+    Returns the version of the analysis performed by the daemon
+
+    It changes with the version of Neto and whenever a plugin is added,
+    removed or modified, so that the result cache does not return analysis
+    performed with other plugins, even after a restart.
+
+    Returns:
+    --------
+        A string.
+    """
+    return "{}:{}".format(neto.__version__, registry.getRegistry().getFingerprint())
+
+
+def isCurrent(result):
+    """
+    Checks if an analysis was performed with the current version and plugins
+
+    Args:
+    -----
+        result: the JSON representation of the analysis.
+
+    Returns:
+    --------
+        A boolean.
+    """
+    return (
+        result.get("_analyser_version") == neto.__version__ and
+        result.get("_plugins_fingerprint") == registry.getRegistry().getFingerprint()
+    )
+
+
+def getCachedResult(sha256):
+    """
+    Recovers from the cache the analysis of some contents if it is still valid
+
+    Args:
+    -----
+        sha256: the SHA256 of the extension.
+
+    Returns:
+    --------
+        The JSON representation of the analysis or None if it is not found or
+            it was performed with other plugins.
+    """
+    result = getResultCache().getByDigest(sha256)
+    if result is not None and isCurrent(result):
+        return result
+    return None
+
+
+@countFailures("remote")
+def analyseRemote(uri):
+    """
+    Downloads and analyses a remote URI
+
+    The URIs already analysed and the extensions already seen at other URIs
+    are answered from the result cache. Otherwise, a URI whose analysis is
+    stored is requested conditionally and, if it has not changed, the stored
+    analysis is returned without downloading it again.
+
+    Args:
+    -----
+        uri: the URI of the extension.
+
+    Returns:
+    --------
+        The JSON representation of the analysis with an additional `cached`
+            key set to True if it was found in the result cache.
+
+    Raises:
+    -------
+        ValueError: if nothing could be downloaded.
+        requests.RequestException: if the download failed.
+    """
+    cache = getResultCache()
+    entry = cache.getByURI(uri)
+    if entry and entry[2] is not None and isCurrent(entry[2]):
+        print(" * <{0}> found in the result cache...".format(uri))
+        return dict(entry[2], cached=True)
+
+    # The name of the extension is formed by:
+    #   <source>_<hashed_uri>_<extension_file_name>
+    # Note: that the hash is not the hash of the whole extension
+    file_name = "jsonrpc_" + md5.calculateHash(uri)
+    if len(uri.split("/")[-1]) > 1:
+        file_name += "_" + uri.split("/")[-1]
+    target_file = os.path.join(
+        DOWNLOADS_PATH,
+        file_name
+    )
+
+    known = analyser.getKnownVersion(uri, ANALYSIS_PATH)
+
+    # Hashed while it is written so that it is not read again
+    resource = HTTPResource(uri)
+    if known:
+        resource.setValidators(known[0])
+    target_file, digest = resource.downloadToFile(target_file)
+    if target_file is None:
+        print(" * <{0}> has not changed since it was analysed...".format(uri))
+        result = analyser.getUnchangedAnalysis(uri, known[1], ANALYSIS_PATH, quiet=True).__dict__
+        cache.put(known[1]["sha256"], result, uri=uri, validators=known[0])
+        return dict(result, cached=True)
+    if not os.path.getsize(target_file):
+        raise ValueError("Nothing was downloaded from <{}>.".format(uri))
+    print(" * Extension stored as '{0}'...".format(target_file))
+
+    result = getCachedResult(digest["sha256"])
+    if result is None:
+        ext = analyser.getPreviousAnalysis(digest, ANALYSIS_PATH)
+        result = ext.__dict__ if ext else None
+    cached = result is not None
+
+    if not cached:
+        print(" * Analysing the extension at '{0}'...".format(target_file))
+        ext = Extension(target_file, digest=digest)
+        # Stored so that the URI can be requested conditionally later
+        analyser.writeAnalysis(ext, ANALYSIS_PATH)
+        result = ext.__dict__
+
+    analyser.rememberValidators(uri, resource.getValidators(), digest, ANALYSIS_PATH)
+    cache.put(digest["sha256"], result, uri=uri, validators=resource.getValidators())
+    return dict(result, cached=cached)
+
+
+@countFailures("local")
+def analyseLocal(localPath):
+    """
+    Analyses a locally downloaded extension
+
+    The extensions already analysed, by SHA256, are answered from the result
+    cache.
+
+    Args:
+    -----
+        localPath: the path of the extension file.
+
+    Returns:
+    --------
+        The JSON representation of the analysis with an additional `cached`
+            key set to True if it was found in the result cache.
+    """
+    digest = hasher.calculateHashFromFile(localPath)
+    result = getCachedResult(digest["sha256"])
+    if result is not None:
+        return dict(result, cached=True)
+
+    result = Extension(localPath, digest=digest).__dict__
+    getResultCache().put(digest["sha256"], result)
+    return dict(result, cached=False)
+
+
+@countFailures("upload")
+def analyseStream(source, filename=None):
+    """
+    Analyses an extension read from a binary file-like object
+
+    The contents are written to the downloads folder and hashed in the same
+    pass, so they are read only once and never kept whole in memory. If the
+    same contents, by SHA256, have already been analysed with the current
+    version and plugins, the file is removed and the previous analysis is
+    returned instead. New analysis are stored in the analysis folder.
+
+    Args:
+    -----
+        source: a binary file-like object with the contents of the extension.
+        filename: the original name of the file, if known.
+
+    Returns:
+    --------
+        A dict with the hashes of the contents, whether they had already been
+            analysed (`duplicate`) and the JSON representation of the analysis.
+
+    Raises:
+    -------
+        ValueError: if nothing is received or it is bigger than
+            MAX_UPLOAD_SIZE.
+        zipfile.BadZipFile: if the contents are not a valid extension.
+    """
+    fd, partFile = tempfile.mkstemp(prefix="upload_", suffix=".part", dir=DOWNLOADS_PATH)
+    try:
+        with os.fdopen(fd, "wb") as oF:
+            received = [0]
+
+            def write(chunk):
+                received[0] += len(chunk)
+                if received[0] > MAX_UPLOAD_SIZE:
+                    raise ValueError("The extension is bigger than the maximum of {} bytes.".format(MAX_UPLOAD_SIZE))
+                oF.write(chunk)
+
+            digest = hasher.calculateHashFromFile(source, callback=write)
+        if not received[0]:
+            raise ValueError("No contents were received.")
+
+        result = getCachedResult(digest["sha256"])
+        if result is None:
+            ext = analyser.getPreviousAnalysis(digest, ANALYSIS_PATH)
+            result = ext.__dict__ if ext else None
+        if result is not None:
+            print(" * The extension with SHA256 {0} had already been analysed.".format(digest["sha256"]))
+            os.remove(partFile)
+            getResultCache().put(digest["sha256"], result)
+            return {"digest": digest, "duplicate": True, "analysis": result}
+
+        # The name of the extension is formed by:
+        #   upload_<md5>_<extension_file_name>
+        file_name = "upload_" + digest["md5"]
+        if filename:
+            file_name += "_" + re.sub(r"[^\w.\-]", "_", os.path.basename(filename))
+        target_file = os.path.join(DOWNLOADS_PATH, file_name)
+        os.replace(partFile, target_file)
+        print(" * Extension stored as '{0}'...".format(target_file))
+
+        print(" * Analysing the extension at '{0}'...".format(target_file))
+        try:
+            ext = Extension(target_file, digest=digest)
+        except zipfile.BadZipFile:
+            os.remove(target_file)
+            raise
+        analyser.writeAnalysis(ext, ANALYSIS_PATH)
+        getResultCache().put(digest["sha256"], ext.__dict__)
+        return {"digest": digest, "duplicate": False, "analysis": ext.__dict__}
+    finally:
+        if os.path.exists(partFile):
+            os.remove(partFile)
+
+
+class Base64Reader:
+    """
+    A binary file-like object that decodes a base64 string while it is read
+
+    The string is decoded in slices whose length is a multiple of 4, so only
+    the chunk requested is decoded at once and the whole contents are never
+    copied in memory.
+    """
+    def __init__(self, data):
+        """
+        Constructor of the Base64Reader
+
+        Args:
+        -----
+            data: a string with the contents encoded as base64.
+        """
+        self.data = data
+        self.position = 0
+
+    def read(self, size=-1):
+        """
+        Decodes the next chunk of the contents
+
+        Args:
+        -----
+            size: the maximum number of bytes to return. If negative, all the
+                remaining contents are decoded.
+
+        Returns:
+        --------
+            The bytes decoded, empty once all the contents have been read.
+
+        Raises:
+        -------
+            ValueError: if the string is not valid base64.
+        """
+        if size is None or size < 0:
+            end = len(self.data)
+        else:
+            end = self.position + max(size // 3, 1) * 4
+        text = self.data[self.position:end]
+        self.position += len(text)
+        try:
+            return base64.b64decode(text, validate=True)
+        except binascii.Error as e:
+            raise ValueError("data is not valid base64 ({}).".format(str(e)))
+
 
 @dispatcher.add_method
+@instrument
+def analyse_bytes(data, filename=None):
+    """
+    Analyses an extension sent in the request
+
+    It lets the clients running on other hosts send the extension without
+    sharing a folder with the daemon. Files bigger than a few MB should be
+    sent to the /upload endpoint instead, which avoids the base64 encoding.
+
+    Args:
+    -----
+        data: the contents of the extension encoded as base64.
+        filename: the original name of the file, if known.
+
+    Returns:
+    --------
+        A dict with the hashes of the contents, whether they had already been
+            analysed (`duplicate`) and the JSON representation of the analysis.
+    """
+    if not isinstance(data, str):
+        raise JSONRPCDispatchException(code=INVALID_PARAMS_ERROR, message="Invalid params: data is not a base64 string.")
+    # Every 3 bytes are encoded as 4 characters, so the size is known beforehand
+    if len(data) > (MAX_UPLOAD_SIZE + 2) // 3 * 4:
+        raise JSONRPCDispatchException(
+            code=INVALID_PARAMS_ERROR,
+            message="Invalid params: The extension is bigger than the maximum of {} bytes.".format(MAX_UPLOAD_SIZE)
+        )
+    try:
+        # Decoded in chunks while it is hashed and written
+        return analyseStream(Base64Reader(data), filename)
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise JSONRPCDispatchException(code=INVALID_PARAMS_ERROR, message="Invalid params: " + str(e))
+
+
+@dispatcher.add_method
+@instrument
 def remote(*args):
     """
     Downloads and analyses a remote URI
 
-    To prevent misuse, just the first parameter is processed.
+    The request is answered once all of them have been analysed. Use
+    submit_remote to avoid waiting.
 
     Args:
     -----
         args: list of remote uris to download
+
+    Returns:
+    --------
+        A dict where the key is the URI and the value is the JSON representation of the analysis.
     """
     results = {}
     for i, uri in enumerate(args):
         print(" * {0}/{1} Processing <{2}>...".format(i+1, len(args), uri))
         try:
-            data = HTTPResource(uri).download()
-        except ConnectionError as e:
-            print(" X Something happened when trying to download the resource. Have we been banned?\n<" + str(e) + ">\nRetrying...")
-
-        if data:
-            # The name of the extension is formed by:
-            #   <source>_<hashed_uri>_<extension_file_name>
-            # Note: that the hash is not the hash of the whole extension
-            file_name = "jsonrpc_" + md5.calculateHash(uri)
-            if len(uri.split("/")[-1]) > 1:
-                file_name += "_" + uri.split("/")[-1]
-            target_file = os.path.join(
-                DOWNLOADS_PATH,
-                file_name
-            )
-
-            with open(target_file, "wb") as oF:
-                oF.write(data)
-            print(" * Extension stored as '{0}'...".format(target_file))
-
-            print(" * Analysing the extension at '{0}'...".format(target_file))
-            ext = Extension(target_file)
-            results[uri] = ext.__dict__
-        else:
-            print("SAMPASA")
+            results[uri] = analyseRemote(uri)
+        except Exception as e:
+            print(" X Something happened when trying to process <{0}>: {1}".format(uri, str(e)))
     return results
 
 
 @dispatcher.add_method
+@instrument
 def local(*args):
     """
     Analyses a locally downloaded extension
 
+    The request is answered once all of them have been analysed. Use
+    submit_local to avoid waiting.
+
     Args:
     -----
         args: list of locally downloaded extension files.
@@ -98,14 +613,171 @@ def local(*args):
 
     for i, localPath in enumerate(args):
         try:
-            results[localPath] = Extension(localPath).__dict__
+            results[localPath] = analyseLocal(localPath)
         except Exception as e:
             print(e)
 
     return results
 
 
+def submit(method, function, targets):
+    """
+    Adds a job to the queue for each of the targets
+
+    Args:
+    -----
+        method: the name of the JSON-RPC method called.
+        function: the function that analyses each target.
+        targets: the list of URIs or paths.
+
+    Returns:
+    --------
+        A list with the status of the jobs created, including their ID.
+
+    Raises:
+    -------
+        JSONRPCDispatchException: if the queue is full. The jobs of the targets
+            already submitted are kept.
+    """
+    queue = getJobQueue()
+    submitted = []
+    for target in targets:
+        try:
+            job = queue.submit(method, target, function, target)
+        except jobs.QueueFullError as e:
+            raise JSONRPCDispatchException(
+                code=BUSY_ERROR,
+                message="Busy: " + str(e),
+                data={"submitted": submitted, "max_queue": queue.maxQueued}
+            )
+        submitted.append(job.getStatus())
+    return submitted
+
+
+def getJob(jobId):
+    """
+    Recovers a job from the queue
+
+    Args:
+    -----
+        jobId: the ID returned when the job was submitted.
+
+    Returns:
+    --------
+        A neto.lib.jobs.Job.
+
+    Raises:
+    -------
+        JSONRPCDispatchException: if the job does not exist.
+    """
+    try:
+        return getJobQueue().getJob(jobId)
+    except KeyError:
+        raise JSONRPCDispatchException(
+            code=JOB_NOT_FOUND_ERROR,
+            message="Job not found: '{}'. It may have expired.".format(jobId)
+        )
+
+
+@dispatcher.add_method
+@instrument
+def submit_remote(*args):
+    """
+    Queues the download and analysis of remote URIs
+
+    Args:
+    -----
+        args: list of remote uris to download
+
+    Returns:
+    --------
+        A list with the status of each job, including the ID to be used with
+            status, result and cancel.
+    """
+    return submit("submit_remote", analyseRemote, args)
+
+
+@dispatcher.add_method
+@instrument
+def submit_local(*args):
+    """
+    Queues the analysis of locally downloaded extensions
+
+    Args:
+    -----
+        args: list of locally downloaded extension files.
+
+    Returns:
+    --------
+        A list with the status of each job, including the ID to be used with
+            status, result and cancel.
+    """
+    return submit("submit_local", analyseLocal, args)
+
+
+@dispatcher.add_method
+@instrument
+def status(jobId):
+    """
+    Returns the status of a job
+
+    Args:
+    -----
+        jobId: the ID returned when the job was submitted.
+
+    Returns:
+    --------
+        A dict with the status of the job: queued, running, done, failed or
+            cancelled.
+    """
+    return getJob(jobId).getStatus()
+
+
+@dispatcher.add_method
+@instrument
+def result(jobId):
+    """
+    Returns the result of a job
+
+    Args:
+    -----
+        jobId: the ID returned when the job was submitted.
+
+    Returns:
+    --------
+        A dict with the status of the job and, in `result`, the JSON
+            representation of the analysis or None if it is not done.
+    """
+    job = getJob(jobId)
+    data = job.getStatus()
+    data["result"] = job.result
+    return data
+
+
+@dispatcher.add_method
+@instrument
+def cancel(jobId):
+    """
+    Cancels a job that has not started yet
+
+    Args:
+    -----
+        jobId: the ID returned when the job was submitted.
+
+    Returns:
+    --------
+        A dict with the status of the job and, in `cancelled`, whether it
+            has been cancelled. Jobs already running cannot be cancelled.
+    """
+    job = getJob(jobId)
+    cancelled = getJobQueue().cancel(jobId)
+    data = job.getStatus()
+    data["cancelled"] = cancelled
+    return data
+
+
 @dispatcher.add_method
+@instrument
 def commands():
     """
     Returns list of possible commands
@@ -121,6 +793,7 @@ def commands():
 
 
 @dispatcher.add_method
+@instrument
 def info():
     """
     Prints Neto's JSONRPC information
@@ -137,11 +810,71 @@ def info():
     )
 
 
+@dispatcher.add_method
+@instrument
+def reload_plugins():
+    """
+    Loads again the analysis plugins and the thirdparty collectors
+
+    Returns:
+    --------
+        A dict with the number of plugins of each type loaded.
+    """
+    return registry.getRegistry().reload()
+
+
+def upload(request):
+    """
+    Analyses the extension sent as the raw body of a POST or PUT request
+
+    The body is streamed to disk while it is received. The original name of
+    the file can be given in the filename parameter of the query string:
+        curl --data-binary @sample.xpi "http://localhost:14041/upload?filename=sample.xpi"
+
+    Args:
+    -----
+        request: the werkzeug Request.
+
+    Returns:
+    --------
+        A werkzeug Response with the same JSON returned by analyse_bytes or
+            with an error.
+    """
+    def error(status, message):
+        return Response(json.dumps({"error": message}), status=status, mimetype='application/json')
+
+    if request.method not in ["POST", "PUT"]:
+        return error(405, "The extension must be sent as the body of a POST or PUT request.")
+    if request.content_length and request.content_length > MAX_UPLOAD_SIZE:
+        return error(413, "The extension is bigger than the maximum of {} bytes.".format(MAX_UPLOAD_SIZE))
+
+    try:
+        result = analyseStream(request.stream, request.args.get("filename"))
+    except (ValueError, zipfile.BadZipFile) as e:
+        return error(400, str(e))
+    except Exception as e:
+        return error(500, "{}: {}".format(type(e).__name__, str(e)))
+    return Response(json.dumps(result), mimetype='application/json')
+
+
 @Request.application
 def application(request):
     """
     Creates the Wekzeug application.
+
+    Requests to /upload receive raw extensions, /metrics returns the metrics
+    of the daemon in the Prometheus text format and the rest are handled as
+    JSON-RPC.
     """
+    if request.path == "/upload":
+        start = time.perf_counter()
+        response = upload(request)
+        RPC_DURATION.observe(time.perf_counter() - start, ("upload",))
+        RPC_REQUESTS.inc(("upload", "ok" if response.status_code == 200 else "error"))
+        return response
+    elif request.path == "/metrics":
+        return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
     # dispatcher is a dictionary {<method_name>: callable}
     # It can also be isntantiated using:
     #   dispatcher["new_method"] = functionName
@@ -175,12 +908,26 @@ def main(parsed_args):
         # Create folder
         os.makedirs(parsed_args.downloads)
 
+    if not os.path.isdir(parsed_args.analysis):
+        os.makedirs(parsed_args.analysis)
+
     # Set global JSON RPC vars
-    global DOWNLOADS_PATH
+    global DOWNLOADS_PATH, ANALYSIS_PATH, MAX_UPLOAD_SIZE, JOBS
     DOWNLOADS_PATH = parsed_args.downloads
+    ANALYSIS_PATH = parsed_args.analysis
+    maxUploadSize = utils.getConfigurationFor("daemon").get("max_upload_size")
+    MAX_UPLOAD_SIZE = int(maxUploadSize if maxUploadSize not in [None, ""] else 256) * 1024 * 1024
+    JOBS = jobs.JobQueue(parsed_args.workers, parsed_args.max_queue)
+
+    # Done before serving so that no request waits for it
+    storage.migrateFolder(ANALYSIS_PATH)
 
     try:
-        run_simple(parsed_args.host, parsed_args.port, application)
+        # Each request is answered in its own thread so that the clients
+        # asking for the status of their jobs are not blocked by the analysis
+        run_simple(parsed_args.host, parsed_args.port, application, threaded=True)
     except OSError:
         print(" * It seems that the address '{0}:{1}' is already in use. Try another address or close the other instance.".format(parsed_args.host, parsed_args.port))
         sys.exit(1)
+    finally:
+        JOBS.shutdown()
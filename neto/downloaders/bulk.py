@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import urllib.parse
+
+from neto.downloaders.http import HTTPResource, getRateController
+
+# Marks the end of the downloads in the queue of results
+_DONE = object()
+
+
+class BulkDownloader:
+    """
+    A class that downloads many resources at the same time
+
+    The downloads are scheduled by an asyncio event loop running in its own
+    thread, so that the latency of the network overlaps instead of adding up.
+    The number of downloads running at once is limited globally and for each
+    host, so that a single store is not flooded, and the requests to each host
+    are paced by its rate controller. Each download is performed by
+    HTTPResource.downloadToFile in a pool of threads, reusing the connections
+    of the shared session and hashing the files while they are written.
+
+    The results are returned as soon as each download finishes, so the caller
+    can analyse an extension while the rest are still being downloaded.
+    """
+
+    def __init__(self, maxDownloads=16, maxPerHost=4):
+        """
+        Constructor
+
+        Args:
+        -----
+            maxDownloads: the maximum number of downloads running at once.
+            maxPerHost: the maximum number of downloads running at once from
+                the same host.
+        """
+        self.maxDownloads = max(1, maxDownloads)
+        self.maxPerHost = max(1, min(maxPerHost, self.maxDownloads))
+
+    async def _download(self, index, uri, targetFile, validators, globalLimit, hostLimits, pool, results, stop):
+        """
+        Downloads a single resource when the limits allow it
+
+        Args:
+        -----
+            index: the position of the resource in the list received.
+            uri: the URI of the resource.
+            targetFile: the path where it will be stored.
+            validators: the validators of the version already known, if any,
+                to request it conditionally.
+            globalLimit: the asyncio.Semaphore shared by all the downloads.
+            hostLimits: a dictionary with the asyncio.Semaphore of each host.
+            pool: the executor where the download is performed.
+            results: the queue.Queue where the outcome is put.
+            stop: a threading.Event set when the results are not needed anymore.
+        """
+        host = urllib.parse.urlsplit(uri).netloc.lower()
+        hostLimit = hostLimits.setdefault(host, asyncio.Semaphore(self.maxPerHost))
+
+        # The host is waited for first, including the delay imposed by its rate
+        # controller, so that a busy or throttled host does not hold slots that
+        # downloads from other hosts could use
+        async with hostLimit:
+            controller = getRateController(uri)
+            delay = controller.getDelay()
+            while delay > 0 and not stop.is_set():
+                await asyncio.sleep(delay)
+                delay = controller.getDelay()
+            async with globalLimit:
+                if stop.is_set():
+                    return
+                loop = asyncio.get_running_loop()
+                resource = HTTPResource(uri)
+                if validators:
+                    resource.setValidators(validators)
+                try:
+                    path, digest = await loop.run_in_executor(pool, resource.downloadToFile, targetFile)
+                    results.put((index, uri, path, digest, resource.getValidators(), None))
+                except Exception as e:
+                    results.put((index, uri, None, None, None, e))
+
+    async def _run(self, items, results, stop):
+        """
+        Schedules all the downloads and waits for them
+
+        Args:
+        -----
+            items: a list of (uri, targetFile, validators) tuples.
+            results: the queue.Queue where the outcomes are put.
+            stop: a threading.Event set when the results are not needed anymore.
+        """
+        globalLimit = asyncio.Semaphore(self.maxDownloads)
+        hostLimits = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.maxDownloads) as pool:
+            await asyncio.gather(*[
+                self._download(i, uri, targetFile, validators, globalLimit, hostLimits, pool, results, stop)
+                for i, (uri, targetFile, validators) in enumerate(items)
+            ])
+
+    def iterDownloads(self, items):
+        """
+        Downloads a list of resources returning them as they finish
+
+        Args:
+        -----
+            items: a list of (uri, targetFile, validators) tuples where
+                validators are the ones of the version already known, if any,
+                as returned by HTTPResource.getValidators.
+
+        Returns:
+        --------
+            A generator of (index, uri, path, digest, validators, error)
+                tuples in the order in which the downloads finish. index is the
+                position in items, path and digest are the values returned by
+                HTTPResource.downloadToFile (both None if the resource has not
+                changed), validators the ones received and error the exception
+                raised, if any. If the generator is closed before the end, the
+                downloads not started yet are skipped.
+        """
+        results = queue.Queue()
+        stop = threading.Event()
+
+        def run():
+            try:
+                asyncio.run(self._run(list(items), results, stop))
+            finally:
+                results.put(_DONE)
+
+        thread = threading.Thread(target=run, name="neto-bulk-downloader", daemon=True)
+        thread.start()
+        try:
+            while True:
+                result = results.get()
+                if result is _DONE:
+                    break
+                yield result
+        finally:
+            stop.set()
@@ -19,11 +19,385 @@
 #
 ################################################################################
 
+import base64
+import binascii
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+import zlib
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+import neto.lib.crypto.multiple_hashes as hasher
+import neto.lib.metrics as metrics
+import neto.lib.utils as utils
 import neto.lib.validations as validations
+import neto.downloaders.ratelimit as ratelimit
 from neto.lib.resources import Resource
 
+DOWNLOAD_DURATION = metrics.histogram(
+    "neto_download_duration_seconds",
+    "Time spent downloading HTTP resources.",
+    ("status",)
+)
+DOWNLOAD_BYTES = metrics.counter(
+    "neto_download_bytes_total",
+    "Bytes received when downloading HTTP resources."
+)
+DOWNLOAD_SIZE = metrics.histogram(
+    "neto_download_size_bytes",
+    "Size of the HTTP resources downloaded.",
+    buckets=metrics.SIZE_BUCKETS
+)
+DOWNLOAD_RESUMED = metrics.counter(
+    "neto_download_resumed_total",
+    "Downloads resumed from a partial file instead of starting over."
+)
+
+# Errors raised when a connection drops while the body is being received
+INTERRUPTED_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+# Matches the files kept next to a download while it is in progress: the
+# partial file, its metadata and its lock (a lock being removed as stale is
+# renamed with the PID of the process removing it)
+PARTIAL_FILE = re.compile(r"\.part(\.json|(\.\d+)?\.lock)?$")
+
+# Algorithms of the digests of the whole resource sent by the servers (in the
+# Repr-Digest or Digest headers) that can be compared with the hashes
+# calculated while downloading it
+DIGEST_ALGORITHMS = {"sha-256": "sha256", "sha-1": "sha1", "sha": "sha1", "md5": "md5"}
+
+# First bytes of the zip files and of the Chrome extensions, zip files too
+ZIP_SIGNATURES = (b"PK\x03\x04", b"Cr24")
+
+# Seconds after which a lock file without a PID is considered abandoned
+LOCK_WRITE_TIMEOUT = 60
+
+# The in-process locks of the partial files being downloaded and the number of
+# threads using each of them
+_partLocks = {}
+_partLocksLock = threading.Lock()
+
+
+def getDownloaderConfiguration():
+    """
+    Reads the settings of the HTTP downloads from the configuration
+
+    Returns:
+    --------
+        A dictionary with the pool_size, retries, retry_backoff,
+            max_backoff, connect_timeout, read_timeout, initial_rate,
+            min_rate and max_rate.
+    """
+    config = utils.getConfigurationFor("downloader")
+    defaults = {
+        "pool_size": 10,
+        "retries": 3,
+        "retry_backoff": 0.5,
+        "max_backoff": 300.0,
+        "connect_timeout": 10,
+        "read_timeout": 60,
+        "initial_rate": 4.0,
+        "min_rate": 0.2,
+        "max_rate": 32.0,
+    }
+    settings = {}
+    for key, default in defaults.items():
+        value = config.get(key)
+        try:
+            settings[key] = type(default)(value) if value not in [None, ""] else default
+        except ValueError:
+            print("[X] Invalid value '{}' for {} in the downloader configuration. Using {}.".format(value, key, default))
+            settings[key] = default
+    return settings
+
+
+def createSession(settings):
+    """
+    Creates a session that keeps the connections to each host open
+
+    Args:
+    -----
+        settings: the dictionary returned by getDownloaderConfiguration.
+
+    Returns:
+    --------
+        A requests.Session.
+    """
+    # Only connection errors are retried here. Throttled answers are retried
+    # by HTTPResource so that the rate of the host is adapted too
+    retry = Retry(
+        total=settings["retries"],
+        backoff_factor=settings["retry_backoff"],
+        status=0,
+        allowed_methods=["GET", "HEAD"],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings["pool_size"],
+        pool_maxsize=settings["pool_size"],
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# The session shared by the whole process
+_session = None
+_sessionPid = None
+_sessionLock = threading.Lock()
+
+
+def getSession():
+    """
+    Returns the session shared by the whole process, creating it on first use
+
+    Reusing the session means reusing the connections, so downloading many
+    extensions from the same store does not open a new TCP connection nor
+    perform a new TLS handshake each time. Sessions are not shared with the
+    processes forked from this one.
+
+    Returns:
+    --------
+        A (requests.Session, settings) tuple where settings is the dictionary
+            returned by getDownloaderConfiguration.
+    """
+    global _session, _sessionPid
+    with _sessionLock:
+        if _session is None or _sessionPid != os.getpid():
+            settings = getDownloaderConfiguration()
+            _session = (createSession(settings), settings)
+            _sessionPid = os.getpid()
+        return _session
+
+
+def getRateController(uri):
+    """
+    Returns the rate controller of the host of a URI
+
+    Args:
+    -----
+        uri: the URI to be requested.
+
+    Returns:
+    --------
+        A neto.downloaders.ratelimit.HostRateController.
+    """
+    _, settings = getSession()
+    return ratelimit.getController(uri, {
+        "initialRate": settings["initial_rate"],
+        "minRate": settings["min_rate"],
+        "maxRate": settings["max_rate"],
+        "backoffBase": settings["retry_backoff"],
+        "maxBackoff": settings["max_backoff"],
+    })
+
+
+def getRangeValidator(validators):
+    """
+    Returns the validator that can be sent in an If-Range header
+
+    Only strong validators can be used to combine ranges of the same version
+    of a resource, so weak ETags (W/"…") are ignored.
+
+    Args:
+    -----
+        validators: a dictionary with the etag and last_modified received.
+
+    Returns:
+    --------
+        A string or None if there is no valid one.
+    """
+    etag = validators.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return validators.get("last_modified")
+
+
+def removeFiles(*paths):
+    """
+    Removes some files ignoring the ones that do not exist
+
+    Args:
+    -----
+        paths: the paths of the files.
+    """
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _isStaleLock(lockFile):
+    """
+    Checks if the lock file of a partial file has been abandoned
+
+    Args:
+    -----
+        lockFile: the path of the lock file.
+
+    Returns:
+    --------
+        True if the process that created it is not running anymore.
+    """
+    try:
+        with open(lockFile) as iF:
+            content = iF.read().strip()
+        age = time.time() - os.path.getmtime(lockFile)
+    except OSError:
+        return False
+    if not content.isdigit():
+        # Its owner may still be writing its PID
+        return age > LOCK_WRITE_TIMEOUT
+    pid = int(content)
+    # This process only creates lock files while holding the in-process lock of
+    # the path, so one with its PID is a leftover of a previous process
+    return pid == os.getpid() or not utils.isProcessRunning(pid)
+
+
+def _removeStaleLock(lockFile):
+    """
+    Removes an abandoned lock file
+
+    The file is renamed first and checked again so that a lock created by
+    another process in the meantime is not removed by mistake.
+
+    Args:
+    -----
+        lockFile: the path of the lock file.
+    """
+    claimedFile = "{}.{}.lock".format(lockFile[:-len(".lock")], os.getpid())
+    try:
+        os.replace(lockFile, claimedFile)
+    except FileNotFoundError:
+        return
+    if _isStaleLock(claimedFile):
+        removeFiles(claimedFile)
+        return
+    try:
+        # Restored unless yet another process has created a new one
+        os.link(claimedFile, lockFile)
+    except OSError:
+        pass
+    removeFiles(claimedFile)
+
+
+@contextlib.contextmanager
+def lockPartFile(partFile, poll=0.2):
+    """
+    Context manager that gives exclusive access to a partial file
+
+    Threads of this process downloading the same file wait for an in-process
+    lock and other processes wait for <partFile>.lock, created atomically with
+    the PID of its owner and removed when done. The lock files of processes
+    that are not running anymore are removed.
+
+    Args:
+    -----
+        partFile: the path of the partial file.
+        poll: the seconds waited between attempts to create the lock file.
+    """
+    path = os.path.abspath(partFile)
+    with _partLocksLock:
+        entry = _partLocks.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            lockFile = partFile + ".lock"
+            waiting = False
+            while True:
+                try:
+                    fd = os.open(lockFile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    break
+                except FileExistsError:
+                    if _isStaleLock(lockFile):
+                        _removeStaleLock(lockFile)
+                        continue
+                    if not waiting:
+                        print("[*] '{}' is being downloaded by another process. Waiting for it…".format(partFile))
+                        waiting = True
+                    time.sleep(poll)
+            try:
+                with os.fdopen(fd, "w") as oF:
+                    oF.write(str(os.getpid()))
+                yield
+            finally:
+                removeFiles(lockFile)
+    finally:
+        with _partLocksLock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _partLocks[path]
+
+
+def getServerDigests(headers):
+    """
+    Returns the digests of the whole resource sent by the server
+
+    Args:
+    -----
+        headers: the headers of the response.
+
+    Returns:
+    --------
+        A dictionary where the key is the type of hash, as the ones returned
+            by neto.lib.crypto.multiple_hashes, and the value is the hexdigest.
+    """
+    digests = {}
+    for header in ["Digest", "Repr-Digest"]:
+        for item in headers.get(header, "").split(","):
+            algorithm, _, value = item.partition("=")
+            algorithm = DIGEST_ALGORITHMS.get(algorithm.strip().lower())
+            if algorithm is None:
+                continue
+            try:
+                # Repr-Digest encloses the value between colons
+                digests[algorithm] = base64.b64decode(value.strip().strip(":"), validate=True).hex()
+            except (binascii.Error, ValueError):
+                pass
+    return digests
+
+
+def checkZipFile(path):
+    """
+    Checks that a file that looks like a zip file can be read
+
+    Args:
+    -----
+        path: the path of the file.
+
+    Returns:
+    --------
+        A string describing the problem found or None if the file is valid or
+            it is not a zip file.
+    """
+    with open(path, "rb") as iF:
+        if not iF.read(4).startswith(ZIP_SIGNATURES):
+            return None
+    try:
+        with zipfile.ZipFile(path) as zF:
+            bad = zF.testzip()
+    except (zipfile.BadZipFile, zlib.error, EOFError, OSError) as e:
+        return str(e) or type(e).__name__
+    except (RuntimeError, NotImplementedError):
+        # Encrypted or compressed with unsupported methods. It cannot be told.
+        return None
+    if bad is not None:
+        return "the CRC of '{}' does not match".format(bad)
+    return None
+
+
 class HTTPResource(Resource):
     """
     A class that represents an HTTP resource
@@ -47,9 +421,10 @@ class HTTPResource(Resource):
                 "Accept-Language": "es-ES,es;q=0.8,en-US;q=0.5,en;q=0.3",
                 "Accept-Encoding": "gzip, deflate, br",
                 "Moz-XPI-Update": "1",
-                "Connection": "close"
             }
         self.headers = h
+        # The headers of the last response received
+        self.responseHeaders = {}
 
     @property
     def headers(self):
@@ -95,20 +470,339 @@ class HTTPResource(Resource):
             else:
                 raise ValueError("The provided URI (" + value + ") does not represent a HTTP or HTTPS protocol.")
 
+    def _get(self, stream=False, headers=None):
+        """
+        Sends the GET request using the shared session
+
+        The requests to each host are spaced by its rate controller. If the
+        server throttles us or fails (429 or 5xx), the request is sent again,
+        up to the number of retries configured, once the time given by the
+        Retry-After header or the backoff of the controller has passed.
+
+        Args:
+        -----
+            stream: a boolean that defines whether the body is read later.
+            headers: the headers to be sent instead of self.headers.
+
+        Returns:
+        --------
+            A requests.Response. It may still be a 429 or 5xx answer if all
+                the retries failed.
+        """
+        session, settings = getSession()
+        controller = getRateController(self.uri)
+        for attempt in range(settings["retries"] + 1):
+            controller.wait()
+            start = time.perf_counter()
+            try:
+                response = session.get(
+                    url=self.uri,
+                    headers=headers or self.headers,
+                    timeout=(settings["connect_timeout"], settings["read_timeout"]),
+                    stream=stream
+                )
+            except requests.RequestException:
+                controller.record(None)
+                raise
+            delay = controller.record(
+                response.status_code,
+                time.perf_counter() - start,
+                ratelimit.parseRetryAfter(response.headers.get("Retry-After"))
+            )
+            if response.status_code not in ratelimit.THROTTLE_STATUS or attempt == settings["retries"]:
+                break
+            print("[X] {} for <{}>. Retrying in {:.1f}s…".format(response.status_code, self.uri, delay))
+            response.close()
+
+        self.responseHeaders = response.headers
+        return response
+
     def download(self, type="bytes"):
         """
         Method to download a resource
 
         This method is a wrapper that will perform the download of a resource.
+        The whole resource is kept in memory, so downloadToFile should be
+        preferred for extensions.
 
         Returns:
         --------
-            The downloaded contents of the remote resource.
-        """
-        response = requests.get(
-            url=self.uri,
-            headers=self.headers
-        )
-        if response.status_code != 200:
-            print(str(response.status_code) + " for " + self.uri)
+            The downloaded contents of the remote resource or None if the
+                request was made conditional with setValidators and the
+                resource has not changed.
+
+        Raises:
+        -------
+            requests.RequestException: if the download fails or the server
+                does not answer with a 2xx status code.
+        """
+        start = time.perf_counter()
+        try:
+            response = self._get()
+        except requests.RequestException:
+            DOWNLOAD_DURATION.observe(time.perf_counter() - start, ("error",))
+            raise
+        DOWNLOAD_DURATION.observe(time.perf_counter() - start, (str(response.status_code),))
+        if response.status_code == 304:
+            return None
+        DOWNLOAD_BYTES.inc(amount=len(response.content))
+        DOWNLOAD_SIZE.observe(len(response.content))
+        # Error pages are not returned as if they were the resource
+        response.raise_for_status()
         return response.content
+
+    def setValidators(self, validators):
+        """
+        Method that makes the following requests conditional
+
+        The server answers 304 Not Modified without sending the resource if
+        it has not changed since the version identified by the validators.
+
+        Args:
+        -----
+            validators: a dictionary with the etag and last_modified received
+                with a previous version, as returned by getValidators.
+        """
+        headers = dict(self.headers)
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        self.headers = headers
+
+    def downloadToFile(self, targetFile, chunkSize=hasher.CHUNK_SIZE):
+        """
+        Method to download a resource to a file hashing it at the same time
+
+        The body is written in chunks as it is received while the hashes are
+        updated, so the memory used is constant whatever the size of the
+        resource and the file does not need to be read again to hash it. It
+        is written to <targetFile>.part first and renamed when complete, so
+        targetFile is never left with partial contents.
+
+        If the server identifies the resource with a strong ETag or a
+        Last-Modified date, the partial file is kept when the connection
+        drops and the download is resumed from where it stopped with a Range
+        request, either at once (up to the number of retries configured) or
+        the next time the same file is downloaded. If-Range ensures that a
+        resource that has changed in the meantime is downloaded again from
+        the beginning.
+
+        Before being used, the file is compared with the digest sent by the
+        server in a Repr-Digest or Digest header, if any, and a resumed file
+        that looks like a zip file is tested so that the bytes received before
+        resuming are checked too. A corrupt resumed file is downloaded again
+        from the beginning.
+
+        Each kind of failure is retried by a single layer, up to the number of
+        retries configured: the connection errors that happen before any byte
+        is received are retried by the session (see createSession), the 429
+        and 5xx answers by _get and the interruptions while the body is being
+        received here, as long as each attempt receives more bytes. Thus, with
+        N retries, a download is resumed at most N times and each request is
+        sent at most (N + 1) * (N + 1) times if the server keeps failing and
+        refusing connections alternately.
+
+        The partial file is locked while it is being written, so downloads of
+        the same targetFile from other threads or processes wait for this one
+        instead of writing the same file at once.
+
+        Args:
+        -----
+            targetFile: the path where the resource will be stored.
+            chunkSize: the number of bytes read at once.
+
+        Returns:
+        --------
+            A (path, digest) tuple where digest is the dictionary of hashes
+                returned by neto.lib.crypto.multiple_hashes. If the request was
+                made conditional with setValidators and the resource has not
+                changed, (None, None) is returned and nothing is written.
+
+        Raises:
+        -------
+            requests.RequestException: if the download fails, the server does
+                not answer with a 2xx status code or the size or the digest of
+                the file do not match the ones announced.
+        """
+        partFile = targetFile + ".part"
+        _, settings = getSession()
+        with lockPartFile(partFile):
+            resumed = 0
+            while True:
+                received = os.path.getsize(partFile) if os.path.exists(partFile) else 0
+                try:
+                    return self._downloadPart(targetFile, partFile, chunkSize)
+                except INTERRUPTED_ERRORS:
+                    # Failing without receiving anything new is not resumed, as
+                    # the session has already retried the connection
+                    if resumed == settings["retries"] or not os.path.exists(partFile) or os.path.getsize(partFile) <= received:
+                        raise
+                    resumed += 1
+                    print("[X] The download of <{}> was interrupted after {} bytes. Resuming it…".format(self.uri, os.path.getsize(partFile)))
+
+    def _getPartOffset(self, partFile):
+        """
+        Method that checks if a partial file of the resource can be resumed
+
+        Args:
+        -----
+            partFile: the path of the partial file.
+
+        Returns:
+        --------
+            An (offset, validator) tuple with the size of the partial file and
+                the value to be sent in the If-Range header, or (0, None) if
+                the download has to start from the beginning.
+        """
+        try:
+            with open(partFile + ".json") as iF:
+                metadata = json.load(iF)
+            offset = os.path.getsize(partFile)
+        except (OSError, ValueError):
+            return 0, None
+        if metadata.get("uri") != self.uri or not offset:
+            return 0, None
+        validator = getRangeValidator(metadata)
+        if validator is None:
+            return 0, None
+        return offset, validator
+
+    def _downloadPart(self, targetFile, partFile, chunkSize):
+        """
+        Method that performs a single request of downloadToFile
+
+        Args:
+        -----
+            targetFile: the path where the resource will be stored.
+            partFile: the path of the partial file.
+            chunkSize: the number of bytes read at once.
+
+        Returns:
+        --------
+            The value returned by downloadToFile.
+        """
+        metadataFile = partFile + ".json"
+        offset, validator = self._getPartOffset(partFile)
+
+        # The ranges refer to the bytes of the resource, not to a compressed
+        # version. Extensions are zip files anyway.
+        headers = dict(self.headers)
+        headers["Accept-Encoding"] = "identity"
+        if offset:
+            headers["Range"] = "bytes={}-".format(offset)
+            headers["If-Range"] = validator
+
+        start = time.perf_counter()
+        size = 0
+        status = "error"
+        # A partial file is only removed if it cannot be resumed
+        keep = bool(offset)
+        try:
+            with self._get(stream=True, headers=headers) as response:
+                status = str(response.status_code)
+                if response.status_code == 304:
+                    return None, None
+                if response.status_code == 416:
+                    # The partial file does not match the resource anymore. The
+                    # files of the new attempt are handled by itself.
+                    removeFiles(partFile, metadataFile)
+                    keep = True
+                    return self._downloadPart(targetFile, partFile, chunkSize)
+                response.raise_for_status()
+
+                multiHasher = hasher.MultiHasher()
+                contentRange = re.match(r"bytes (\d+)-\d+/(\d+|\*)", response.headers.get("Content-Range", ""))
+                if response.status_code == 206 and offset and contentRange and int(contentRange.group(1)) == offset:
+                    DOWNLOAD_RESUMED.inc()
+                    mode = "ab"
+                    # The hashes of the bytes already received are calculated
+                    # again since the state of the hashers is not kept
+                    with open(partFile, "rb") as iF:
+                        for chunk in iter(lambda: iF.read(chunkSize), b""):
+                            multiHasher.update(chunk)
+                    total = int(contentRange.group(2)) if contentRange.group(2) != "*" else None
+                elif response.status_code == 206:
+                    keep = False
+                    raise requests.RequestException(
+                        "<{}> answered with a range that was not requested: {}.".format(self.uri, response.headers.get("Content-Range"))
+                    )
+                else:
+                    # The server sent the whole resource, maybe a new version
+                    offset = 0
+                    mode = "wb"
+                    length = response.headers.get("Content-Length")
+                    encoded = response.headers.get("Content-Encoding", "identity") != "identity"
+                    total = int(length) if length and length.isdigit() and not encoded else None
+
+                metadata = dict(self.getValidators(), uri=self.uri, size=total)
+                keep = getRangeValidator(metadata) is not None and response.headers.get("Content-Encoding", "identity") == "identity"
+                if keep:
+                    # Written before the body so that it can be resumed even if
+                    # this process is killed
+                    with open(metadataFile, "w") as oF:
+                        json.dump(metadata, oF)
+                elif os.path.exists(metadataFile):
+                    os.remove(metadataFile)
+
+                with open(partFile, mode) as oF:
+                    for chunk in response.iter_content(chunkSize):
+                        multiHasher.update(chunk)
+                        oF.write(chunk)
+                        size += len(chunk)
+
+            # Final integrity check of the whole file
+            if total is not None and offset + size != total:
+                if offset + size < total:
+                    raise requests.exceptions.ChunkedEncodingError(
+                        "Only {} of the {} bytes of <{}> were received.".format(offset + size, total, self.uri)
+                    )
+                keep = False
+                raise requests.RequestException(
+                    "{} bytes were received from <{}> but {} were announced.".format(offset + size, self.uri, total)
+                )
+
+            digest = multiHasher.hexdigests()
+            for algorithm, expected in getServerDigests(response.headers).items():
+                if digest[algorithm] != expected:
+                    keep = False
+                    raise requests.RequestException(
+                        "The {} of <{}> is {} but the server announced {}.".format(algorithm, self.uri, digest[algorithm], expected)
+                    )
+            # The bytes received before resuming are checked along with the rest
+            problem = checkZipFile(partFile) if mode == "ab" else None
+            if problem:
+                print("[X] The download of <{}> resumed is corrupt: {}. Downloading it again from the beginning…".format(self.uri, problem))
+                removeFiles(partFile, metadataFile)
+                keep = True
+                return self._downloadPart(targetFile, partFile, chunkSize)
+
+            os.replace(partFile, targetFile)
+            removeFiles(metadataFile)
+        except BaseException:
+            if not keep:
+                removeFiles(partFile, metadataFile)
+            raise
+        finally:
+            DOWNLOAD_DURATION.observe(time.perf_counter() - start, (status,))
+            DOWNLOAD_BYTES.inc(amount=size)
+
+        DOWNLOAD_SIZE.observe(offset + size)
+        return targetFile, digest
+
+    def getValidators(self):
+        """
+        Method that returns the validators of the last response received
+
+        They identify the version of the resource downloaded and can be sent
+        back to the server to know if it has changed.
+
+        Returns:
+        --------
+            A dictionary with the etag and last_modified values, None if they
+                were not received.
+        """
+        return {
+            "etag": self.responseHeaders.get("ETag"),
+            "last_modified": self.responseHeaders.get("Last-Modified"),
+        }
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import email.utils
+import random
+import threading
+import time
+import urllib.parse
+
+import neto.lib.metrics as metrics
+
+# Status codes meaning that the server is overloaded or throttling us
+THROTTLE_STATUS = [429, 500, 502, 503, 504]
+
+# Requests per second added to the rate after each successful request
+RATE_INCREASE = 0.25
+
+# Factor applied to the rate when the server throttles us
+RATE_DECREASE = 0.5
+
+# Factor applied to the rate when the server becomes slower than usual
+SLOWDOWN_DECREASE = 0.9
+
+# Times the usual latency above which the server is considered slower
+SLOWDOWN_THRESHOLD = 3
+
+
+def parseRetryAfter(value):
+    """
+    Parses the value of a Retry-After header
+
+    Args:
+    -----
+        value: the value of the header, either a number of seconds or an HTTP
+            date.
+
+    Returns:
+    --------
+        The number of seconds to wait or None if it is not present or valid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time())
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+class HostRateController:
+    """
+    A class that adapts the rate of the requests sent to a host
+
+    The requests are spaced using a token bucket whose rate changes with the
+    answers of the server: it grows slowly while the requests succeed and it
+    is halved when the server throttles us (429) or fails (5xx), or reduced
+    when it becomes much slower than usual. After a throttled answer, no
+    request is sent to the host until the time given in its Retry-After
+    header or, if missing, an exponential backoff with jitter.
+
+    This way a crawl runs at the highest rate the host tolerates instead of
+    being banned. The controller is shared by all the threads downloading
+    from the same host.
+    """
+
+    def __init__(self, host, initialRate=4.0, minRate=0.2, maxRate=32.0, burst=4, backoffBase=0.5, maxBackoff=300.0, window=100):
+        """
+        Constructor
+
+        Args:
+        -----
+            host: the name of the host.
+            initialRate: the requests per second allowed at the beginning.
+            minRate: the minimum requests per second.
+            maxRate: the maximum requests per second.
+            burst: the maximum number of requests sent at once after being
+                idle.
+            backoffBase: the seconds waited after the first throttled answer
+                without Retry-After. It is doubled with each consecutive one.
+            maxBackoff: the maximum number of seconds waited.
+            window: the number of recent status codes kept.
+        """
+        self.host = host
+        self.minRate = minRate
+        self.maxRate = max(maxRate, minRate)
+        self.rate = min(max(initialRate, self.minRate), self.maxRate)
+        self.burst = max(1, burst)
+        self.backoffBase = backoffBase
+        self.maxBackoff = maxBackoff
+
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blockedUntil = 0.0
+        self.failures = 0
+        self.latency = None
+        self.statuses = collections.deque(maxlen=window)
+
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """
+        Adds the tokens generated since the last update. It requires the lock.
+
+        Args:
+        -----
+            now: the current value of time.monotonic().
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def getDelay(self):
+        """
+        Returns the seconds until a request could be sent, without reserving it
+
+        Returns:
+        --------
+            A float.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            delay = max(0.0, self.blockedUntil - now)
+            if self.tokens < 1:
+                delay = max(delay, (1 - self.tokens) / self.rate)
+            return delay
+
+    def reserve(self):
+        """
+        Reserves the next request to the host
+
+        The token is taken even if it is not available yet, so concurrent
+        callers are given increasing delays instead of all waking at once.
+
+        Returns:
+        --------
+            The number of seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            delay = max(0.0, self.blockedUntil - now)
+            if self.tokens < 0:
+                delay = max(delay, -self.tokens / self.rate)
+            return delay
+
+    def wait(self):
+        """
+        Reserves the next request to the host and sleeps until it can be sent
+
+        If another thread is throttled while this one sleeps, it keeps waiting
+        until the host is not blocked anymore.
+        """
+        delay = self.reserve()
+        while delay > 0:
+            time.sleep(delay)
+            with self._lock:
+                delay = self.blockedUntil - time.monotonic()
+
+    def record(self, status, latency=None, retryAfter=None):
+        """
+        Updates the rate with the outcome of a request
+
+        Args:
+        -----
+            status: the status code received or None if the connection failed.
+            latency: the seconds the server took to answer.
+            retryAfter: the seconds in the Retry-After header, if any.
+
+        Returns:
+        --------
+            The seconds during which no request will be sent to the host, 0
+                if the request succeeded.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.statuses.append(status)
+
+            if status is None or status in THROTTLE_STATUS:
+                THROTTLED.inc((self.host, str(status or "error")))
+                self.failures += 1
+                self.rate = max(self.minRate, self.rate * RATE_DECREASE)
+                if retryAfter is not None:
+                    delay = min(self.maxBackoff, retryAfter)
+                else:
+                    # Exponential backoff with equal jitter so that the
+                    # clients throttled at once do not come back at once
+                    backoff = min(self.maxBackoff, self.backoffBase * 2 ** (self.failures - 1))
+                    delay = backoff / 2 + random.uniform(0, backoff / 2)
+                self.blockedUntil = max(self.blockedUntil, now + delay)
+                self.tokens = min(self.tokens, 0.0)
+                return delay
+
+            self.failures = 0
+            if latency is not None:
+                if self.latency is not None and latency > SLOWDOWN_THRESHOLD * self.latency:
+                    self.rate = max(self.minRate, self.rate * SLOWDOWN_DECREASE)
+                else:
+                    self.rate = min(self.maxRate, self.rate + RATE_INCREASE)
+                # Exponentially weighted moving average of the latency
+                self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+            else:
+                self.rate = min(self.maxRate, self.rate + RATE_INCREASE)
+            return 0.0
+
+    def getStats(self):
+        """
+        Returns the state of the controller
+
+        Returns:
+        --------
+            A dictionary with the host, the current rate, the average latency,
+                the consecutive failures and the recent status codes.
+        """
+        with self._lock:
+            return {
+                "host": self.host,
+                "rate": self.rate,
+                "latency": self.latency,
+                "failures": self.failures,
+                "statuses": collections.Counter(self.statuses),
+            }
+
+
+# The controllers of each host shared by the whole process
+_controllers = {}
+_controllersLock = threading.Lock()
+
+
+def getController(uri, settings=None):
+    """
+    Returns the controller of the host of a URI, creating it on first use
+
+    Args:
+    -----
+        uri: the URI to be requested.
+        settings: a dictionary with the kwargs of HostRateController used if
+            it has to be created.
+
+    Returns:
+    --------
+        A HostRateController.
+    """
+    host = urllib.parse.urlsplit(uri).netloc.lower()
+    with _controllersLock:
+        controller = _controllers.get(host)
+        if controller is None:
+            controller = _controllers[host] = HostRateController(host, **(settings or {}))
+        return controller
+
+
+def getRates():
+    """
+    Returns the current rate of each host for the metrics
+
+    Returns:
+    --------
+        A dictionary where the key is a (host,) tuple and the value the
+            requests per second allowed.
+    """
+    with _controllersLock:
+        controllers = list(_controllers.values())
+    return {(c.host,): c.rate for c in controllers}
+
+
+metrics.gauge(
+    "neto_download_rate",
+    "Requests per second currently allowed to each host.",
+    ("host",),
+    function=getRates
+)
+THROTTLED = metrics.counter(
+    "neto_download_throttled_total",
+    "Answers received meaning that the host is throttling us or failing, by host and status.",
+    ("host", "status")
+)
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections.abc
+import os
+import tempfile
+import threading
+import zipfile
+
+
+class PathArchive:
+    """
+    A class that gives access to the files of an already unzipped extension
+
+    The files are provided as a dictionary where the key is the relative path
+    inside the extension while the value is the real path where the
+    information is stored:
+        {
+             "manifest.json": "/tmp/extension/manifest.json"
+             …
+        }
+    """
+
+    def __init__(self, paths):
+        """
+        Constructor
+
+        Args:
+        -----
+            paths: a dictionary of relative paths and real paths.
+        """
+        self.paths = paths
+
+    def namelist(self):
+        """
+        Returns the relative paths of the files found in the extension
+
+        Returns:
+        --------
+            A list of strings.
+        """
+        return [f for f, realPath in self.paths.items() if os.path.isfile(realPath)]
+
+    def open(self, name):
+        """
+        Opens a file of the extension
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+
+        Returns:
+        --------
+            A binary file-like object.
+        """
+        return open(self.paths[name], "rb")
+
+    def read(self, name):
+        """
+        Reads the contents of a file of the extension
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+
+        Returns:
+        --------
+            The bytes of the file.
+        """
+        with self.open(name) as iF:
+            return iF.read()
+
+    def getPath(self, name):
+        """
+        Returns the real path where a file of the extension is stored
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+
+        Returns:
+        --------
+            A string representing the real path.
+        """
+        return self.paths[name]
+
+    def close(self):
+        """
+        Nothing to release as the files are already in the filesystem.
+        """
+        pass
+
+
+class ZipArchive:
+    """
+    A class that gives access to the files of a zipped extension in memory
+
+    The members are read directly from the zip file, so nothing is written to
+    the temporal folder unless a real path is explicitly requested with
+    getPath(). In that case, only the requested member is extracted.
+
+    When sent to another process, the zip file is opened again there.
+    """
+
+    def __init__(self, lPath, tFolder=None):
+        """
+        Constructor
+
+        Args:
+        -----
+            lPath: a string containing the local path of the zipped file.
+            tFolder: a string representing the folder where the members will
+                be extracted if a real path is ever requested.
+
+        Raises:
+        -------
+            zipfile.BadZipFile: if the file is not a valid zip file.
+        """
+        self.lPath = lPath
+        self.tFolder = tFolder or os.path.join(tempfile.gettempdir(), os.path.basename(lPath))
+        self.zip = zipfile.ZipFile(lPath)
+        self._extracted = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"lPath": self.lPath, "tFolder": self.tFolder}
+
+    def __setstate__(self, state):
+        self.__init__(state["lPath"], state["tFolder"])
+
+    def namelist(self):
+        """
+        Returns the relative paths of the files found in the extension
+
+        Returns:
+        --------
+            A list of strings.
+        """
+        return [i.filename for i in self.zip.infolist() if not i.is_dir()]
+
+    def open(self, name):
+        """
+        Opens a member of the extension without extracting it
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+
+        Returns:
+        --------
+            A binary file-like object that decompresses the data lazily.
+        """
+        return self.zip.open(name)
+
+    def read(self, name):
+        """
+        Reads the contents of a member of the extension
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+
+        Returns:
+        --------
+            The bytes of the file.
+        """
+        return self.zip.read(name)
+
+    def getPath(self, name):
+        """
+        Returns a real path for a member, extracting it on first use
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+
+        Returns:
+        --------
+            A string representing the real path.
+        """
+        with self._lock:
+            if name not in self._extracted:
+                self._extracted[name] = self.zip.extract(name, self.tFolder)
+            return self._extracted[name]
+
+    def close(self):
+        """
+        Closes the underlying zip file.
+        """
+        self.zip.close()
+
+
+class SubsetArchive:
+    """
+    A class that restricts an archive to a given list of files
+
+    It is useful when a plugin wants to run another plugin over some of the
+    files of the extension.
+    """
+
+    def __init__(self, archive, names):
+        """
+        Constructor
+
+        Args:
+        -----
+            archive: a ZipArchive or PathArchive object.
+            names: the list of relative paths to be exposed.
+        """
+        self.archive = archive
+        self.names = [n for n in names if n in archive.namelist()]
+
+    def namelist(self):
+        return list(self.names)
+
+    def open(self, name):
+        return self.archive.open(name)
+
+    def read(self, name):
+        return self.archive.read(name)
+
+    def getPath(self, name):
+        return self.archive.getPath(name)
+
+    def close(self):
+        pass
+
+
+class LazyPaths(collections.abc.Mapping):
+    """
+    A dictionary-like view of the real paths of the files in an archive
+
+    It keeps the unzippedFiles contract of the analysis plugins: the key is
+    the relative path inside the extension and the value the real path. The
+    value is only resolved (and thus the member extracted) when accessed.
+    """
+
+    def __init__(self, archive):
+        """
+        Constructor
+
+        Args:
+        -----
+            archive: a ZipArchive or PathArchive object.
+        """
+        self.archive = archive
+        self._names = archive.namelist()
+        self._known = set(self._names)
+
+    def __getitem__(self, key):
+        if key not in self._known:
+            raise KeyError(key)
+        return self.archive.getPath(key)
+
+    def __contains__(self, key):
+        # Overriden so that membership tests do not extract the member
+        return key in self._known
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+
+def getArchiveFromKwargs(kwargs):
+    """
+    Returns the archive to be used by an analysis plugin
+
+    Plugins receive `contents` and an `archive` in their kwargs when invoked by
+    an Extension. The former is a neto.lib.contents.ContentProvider that
+    caches the files read so that they are not read again by other plugins.
+    If they are invoked directly with just `unzippedFiles`, a PathArchive is
+    built on top of it so the plugin can use the same interface.
+
+    Args:
+    -----
+        kwargs: the kwargs received by runAnalysis.
+
+    Returns:
+    --------
+        A ContentProvider, ZipArchive or PathArchive object.
+    """
+    if kwargs.get("contents") is not None:
+        return kwargs["contents"]
+    if kwargs.get("archive") is not None:
+        return kwargs["archive"]
+    return PathArchive(kwargs["unzippedFiles"])
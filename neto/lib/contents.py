@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import threading
+
+import neto.lib.crypto.multiple_hashes as hasher
+import neto.lib.metrics as metrics
+import neto.lib.utils as utils
+
+# Maximum number of bytes kept in memory by each ContentProvider
+DEFAULT_MAX_SIZE = int(utils.getConfigurationFor("analyser").get("content_cache_size") or 64) * 1024 * 1024
+
+CONTENT_READS = metrics.counter(
+    "neto_content_reads_total",
+    "Files of the extensions requested to the content providers by result (hit or miss).",
+    ("result",)
+)
+
+
+def getTotals():
+    """
+    Returns the reads of all the providers used by this process
+
+    Returns:
+    --------
+        A dictionary with the hits and misses.
+    """
+    values = {labels[0]: value for _, labels, _, value in CONTENT_READS.getSamples()}
+    return {"hits": values.get("hit", 0), "misses": values.get("miss", 0)}
+
+
+def addTotals(hits=0, misses=0):
+    """
+    Adds the reads counted by the providers sent to other processes
+
+    Args:
+    -----
+        hits: the number of reads served from the cache.
+        misses: the number of reads that needed to go to the archive.
+    """
+    if hits:
+        CONTENT_READS.inc(("hit",), hits)
+    if misses:
+        CONTENT_READS.inc(("miss",), misses)
+
+
+class ContentProvider:
+    """
+    A class that reads the files of an extension once and caches them
+
+    It wraps any of the archives defined in neto.lib.archives exposing the same
+    interface, so the analysis plugins can use it transparently. The contents
+    are kept in a LRU cache bounded by size: when the total number of bytes
+    exceeds maxSize, the least recently used files are evicted. Files bigger
+    than maxSize are never cached.
+
+    A provider can be shared by several threads and, when sent to another
+    process, it is rebuilt there with an empty cache. The reads of all the
+    providers of a process are added up in the CONTENT_READS metric (see
+    getTotals), which the analyser reports at the end of each batch.
+
+    The information is loaded into different properties:
+        @hits: the number of reads served from the cache.
+        @misses: the number of reads that needed to go to the archive.
+        @size: the number of bytes currently cached.
+    """
+
+    def __init__(self, archive, maxSize=DEFAULT_MAX_SIZE):
+        """
+        Constructor
+
+        Args:
+        -----
+            archive: a neto.lib.archives object to read the files from.
+            maxSize: the maximum number of bytes to keep in memory.
+        """
+        self.archive = archive
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._cache = collections.OrderedDict()
+        self._digests = {}
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        # The cached contents are not sent to other processes
+        return {"archive": self.archive, "maxSize": self.maxSize}
+
+    def __setstate__(self, state):
+        self.__init__(state["archive"], state["maxSize"])
+
+    def namelist(self):
+        return self.archive.namelist()
+
+    def open(self, name):
+        return self.archive.open(name)
+
+    def getPath(self, name):
+        return self.archive.getPath(name)
+
+    def read(self, name):
+        """
+        Reads the contents of a file, using the cache when possible
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+
+        Returns:
+        --------
+            The bytes of the file.
+        """
+        with self._lock:
+            if name in self._cache:
+                self._cache.move_to_end(name)
+                self._count(True)
+                return self._cache[name]
+
+            self._count(False)
+
+        data = self.archive.read(name)
+
+        self._store(name, data)
+        return data
+
+    def _count(self, hit):
+        """
+        Records a read. It requires the lock.
+
+        Args:
+        -----
+            hit: a boolean that defines whether it was served from the cache.
+        """
+        if hit:
+            self.hits += 1
+            addTotals(hits=1)
+        else:
+            self.misses += 1
+            addTotals(misses=1)
+
+    def _store(self, name, data):
+        """
+        Adds a file to the cache if it fits
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+            data: the bytes of the file.
+        """
+        with self._lock:
+            if len(data) <= self.maxSize and name not in self._cache:
+                self._cache[name] = data
+                self.size += len(data)
+                # Evict the least recently used files
+                while self.size > self.maxSize:
+                    self.evict(next(iter(self._cache)))
+
+    def getDigest(self, name):
+        """
+        Returns the hashes of a file
+
+        If the file is not cached, it is hashed while it is being read from the
+        archive in chunks and it is then cached so that the plugins do not need
+        to read it again. Files bigger than maxSize are hashed in constant
+        memory and not cached.
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+
+        Returns:
+        --------
+            A dictionary where the key is the type of hash and the value is the
+                hexdigest.
+        """
+        with self._lock:
+            if name in self._digests:
+                return self._digests[name]
+            data = self._cache.get(name)
+            if data is None:
+                self._count(False)
+
+        if data is not None:
+            digest = hasher.calculateHash(data)
+        else:
+            chunks = []
+            size = [0]
+
+            def keep(chunk):
+                # Chunks are discarded as soon as the file is too big
+                size[0] += len(chunk)
+                if size[0] <= self.maxSize:
+                    chunks.append(chunk)
+                else:
+                    chunks.clear()
+
+            with self.archive.open(name) as iF:
+                digest = hasher.calculateHashFromFile(iF, callback=keep)
+
+            if size[0] <= self.maxSize:
+                self._store(name, b"".join(chunks))
+
+        with self._lock:
+            self._digests[name] = digest
+        return digest
+
+    def evict(self, name):
+        """
+        Removes a file from the cache
+
+        Args:
+        -----
+            name: the relative path of the file inside the extension.
+        """
+        with self._lock:
+            data = self._cache.pop(name, None)
+            if data is not None:
+                self.size -= len(data)
+
+    def clear(self):
+        """
+        Removes all the files from the cache.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._digests.clear()
+            self.size = 0
+
+    def close(self):
+        """
+        Frees the cache. The wrapped archive is not closed.
+        """
+        self.clear()
+
+    def getStats(self):
+        """
+        Returns the usage statistics of the cache
+
+        Returns:
+        --------
+            A dictionary with the hits, misses, cached files and cached bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache),
+                "size": self.size,
+            }
@@ -22,29 +22,136 @@
 import sys
 import hashlib
 
-import neto.lib.crypto.md5 as md5
-import neto.lib.crypto.sha1 as sha1
-import neto.lib.crypto.sha256 as sha256
+# Algorithms calculated by default
+ALGORITHMS = ["md5", "sha1", "sha256"]
 
+# Number of bytes read at once when hashing files
+CHUNK_SIZE = 1024 * 1024
 
-def calculateHash(data):
+
+class MultiHasher:
+    """
+    A class that calculates several hashes of the same data in a single pass
+
+    The data can be provided in as many chunks as needed using update(), so it
+    is not required to have the whole data in memory.
+    """
+
+    def __init__(self, algorithms=ALGORITHMS):
+        """
+        Constructor
+
+        Args:
+        -----
+            algorithms: a list of the names of the algorithms to calculate as
+                understood by hashlib.new.
+        """
+        self.hashes = [(a, hashlib.new(a)) for a in algorithms]
+
+    def update(self, data):
+        """
+        Updates all the hashes with a new chunk of data
+
+        Args:
+        -----
+            data: a string or set of bytes containing the data to hash.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        for _, h in self.hashes:
+            h.update(data)
+
+    def hexdigests(self):
+        """
+        Returns the hexdigests of the data received so far
+
+        Returns:
+        --------
+            A dictionary where the key is the type of hash and the value is the
+                hexdigest.
+        """
+        return {a: h.hexdigest() for a, h in self.hashes}
+
+
+def calculateHash(data, algorithms=ALGORITHMS):
     """
     A function to calculate several hash
 
     Args:
     -----
         data: a string or set of bytes containing the data to hash.
+        algorithms: a list of the names of the algorithms to calculate.
 
     Returns:
     --------
         A dictionary containing several hashes where the key is the type of hash
             and the value is the hexdigest.
     """
-    return {
-        "md5": md5.calculateHash(data),
-        "sha1": sha1.calculateHash(data),
-        "sha256": sha256.calculateHash(data),
-    }
+    if isinstance(data, str):
+        data = data.encode()
+
+    hasher = MultiHasher(algorithms)
+    # Chunks are small enough to remain in the CPU cache for all the hashes
+    view = memoryview(data)
+    for i in range(0, len(view), CHUNK_SIZE):
+        hasher.update(view[i:i + CHUNK_SIZE])
+    return hasher.hexdigests()
+
+
+def calculateHashFromFile(source, algorithms=ALGORITHMS, chunkSize=CHUNK_SIZE, callback=None):
+    """
+    A function to calculate several hash of a file reading it in chunks
+
+    The memory used is constant whatever the size of the file.
+
+    Args:
+    -----
+        source: either a string with the path of the file or a binary
+            file-like object already opened such as the ones returned by
+            zipfile.ZipFile.open.
+        algorithms: a list of the names of the algorithms to calculate.
+        chunkSize: the number of bytes to read at once.
+        callback: a function called with every chunk read, useful to do
+            something else with the data in the same pass.
+
+    Returns:
+    --------
+        A dictionary containing several hashes where the key is the type of hash
+            and the value is the hexdigest.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as iF:
+            return calculateHashFromFile(iF, algorithms, chunkSize, callback)
+
+    hasher = MultiHasher(algorithms)
+    while True:
+        chunk = source.read(chunkSize)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        if callback:
+            callback(chunk)
+    return hasher.hexdigests()
+
+
+def isLegacyDigest(digest):
+    """
+    A function to check if some hashes were stored by previous versions
+
+    Those versions stored a SHA1 as the sha256 of the extensions and their
+    files, so it has the length of a SHA1 (40 hexadecimal characters).
+
+    Args:
+    -----
+        digest: a dictionary as the ones returned by calculateHash.
+
+    Returns:
+    --------
+        A boolean.
+    """
+    value = digest.get("sha256") if isinstance(digest, dict) else None
+    return isinstance(value, str) and len(value) == 40
+
 
 if __name__ == "__main__":
     print(calculateHash(sys.argv[1]))
@@ -33,9 +33,9 @@ def calculateHash(data):
 
     Returns:
     --------
-        A string representing the SHA1.
+        A string representing the SHA256.
     """
-    h = hashlib.sha1()
+    h = hashlib.sha256()
     if data.__class__.__name__ == "bytes":
         h.update(data)
     else:
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import atexit
+import concurrent.futures
+import inspect
+import os
+import threading
+import time
+
+import neto.lib.contents as contents
+import neto.lib.metrics as metrics
+import neto.lib.utils as utils
+
+# Valid values for the plugin_executor configuration option
+EXECUTORS = ["serial", "thread", "process"]
+
+# Pools are reused by all the extensions analysed in this process
+_pools = {}
+_poolsLock = threading.Lock()
+
+# Plugins that are not thread-safe are never run twice at the same time
+_pluginLocks = {}
+_pluginLocksLock = threading.Lock()
+
+PLUGIN_DURATION = metrics.histogram(
+    "neto_plugin_duration_seconds",
+    "Time spent in the runAnalysis method of each analysis plugin.",
+    ("plugin",)
+)
+PLUGIN_FAILURES = metrics.counter(
+    "neto_plugin_failures_total",
+    "Analysis plugins that raised an exception by type of exception.",
+    ("plugin", "exception")
+)
+
+
+def getPluginName(methodObj):
+    """
+    Returns a readable name for an analysis plugin
+
+    Args:
+    -----
+        methodObj: the runAnalysis callable of the plugin.
+
+    Returns:
+    --------
+        A string with the name of the module of the plugin.
+    """
+    return methodObj.__module__.split(".")[-1]
+
+
+def isParallelSafe(methodObj):
+    """
+    Checks if a plugin can be run concurrently with others
+
+    Plugins that are not thread-safe can opt out by setting a module level
+    variable `PARALLEL_SAFE = False`. They will always be run in the calling
+    thread once the rest of the plugins have finished, holding a lock of their
+    own so that analyses running in other threads do not run them at once.
+
+    Args:
+    -----
+        methodObj: the runAnalysis callable of the plugin.
+
+    Returns:
+    --------
+        A boolean.
+    """
+    module = inspect.getmodule(methodObj)
+    return getattr(module, "PARALLEL_SAFE", True) is not False
+
+
+def getExecutorConfiguration():
+    """
+    Reads the executor settings from the analyser configuration
+
+    Returns:
+    --------
+        A tuple (executor, workers) where executor is one of EXECUTORS and
+            workers is the maximum number of plugins run at the same time.
+    """
+    config = utils.getConfigurationFor("analyser")
+
+    executor = (config.get("plugin_executor") or "serial").strip().lower()
+    if executor not in EXECUTORS:
+        print("[X] Unknown plugin_executor '{}'. Plugins will be run serially.".format(executor))
+        executor = "serial"
+
+    try:
+        workers = int(config.get("plugin_workers") or 0)
+    except ValueError:
+        workers = 0
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+
+    return executor, workers
+
+
+def _getPool(executor, workers):
+    """
+    Returns a pool of the given type, creating it on first use
+
+    Args:
+    -----
+        executor: either "thread" or "process".
+        workers: the number of workers of the pool.
+
+    Returns:
+    --------
+        A concurrent.futures.Executor.
+    """
+    with _poolsLock:
+        pool = _pools.get((executor, workers))
+        if pool is None:
+            if executor == "process":
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            else:
+                pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            _pools[(executor, workers)] = pool
+        return pool
+
+
+def _discardPool(executor, workers, pool):
+    """
+    Forgets a broken pool so that the next analysis creates a new one
+
+    Args:
+    -----
+        executor: either "thread" or "process".
+        workers: the number of workers of the pool.
+        pool: the concurrent.futures.Executor broken.
+    """
+    with _poolsLock:
+        if _pools.get((executor, workers)) is pool:
+            del _pools[(executor, workers)]
+    pool.shutdown(wait=False)
+
+
+def _submit(executor, workers, methodObj, kwargs):
+    """
+    Sends a plugin to the pool, replacing the pool if it is broken
+
+    A process pool is broken for good once one of its workers dies (e.g. a
+    plugin crashing the interpreter or killed by the system).
+
+    Args:
+    -----
+        executor: either "thread" or "process".
+        workers: the number of workers of the pool.
+        methodObj: the runAnalysis callable of the plugin.
+        kwargs: the kwargs to be passed to the plugin.
+
+    Returns:
+    --------
+        A (pool, future) tuple where future is the concurrent.futures.Future
+            with the value returned by runPlugin.
+    """
+    pool = _getPool(executor, workers)
+    try:
+        return pool, pool.submit(runPlugin, methodObj, kwargs)
+    except concurrent.futures.BrokenExecutor:
+        _discardPool(executor, workers, pool)
+    pool = _getPool(executor, workers)
+    return pool, pool.submit(runPlugin, methodObj, kwargs)
+
+
+def getPluginLock(methodObj):
+    """
+    Returns the lock of a plugin that is not thread-safe
+
+    Args:
+    -----
+        methodObj: the runAnalysis callable of the plugin.
+
+    Returns:
+    --------
+        A threading.Lock shared by all the analyses of this process.
+    """
+    with _pluginLocksLock:
+        return _pluginLocks.setdefault(methodObj.__module__, threading.Lock())
+
+
+@atexit.register
+def shutdownPools():
+    """
+    Shuts down all the pools created so far.
+    """
+    with _poolsLock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False)
+        _pools.clear()
+
+
+def runPlugin(methodObj, kwargs):
+    """
+    Runs a single analysis plugin catching any error it may raise
+
+    It is a module level function so that it can be sent to a process pool.
+
+    Args:
+    -----
+        methodObj: the runAnalysis callable of the plugin.
+        kwargs: the kwargs to be passed to the plugin.
+
+    Returns:
+    --------
+        A tuple (results, error, duration, reads) where results is the
+            dictionary returned by the plugin (or None), error a string
+            describing the exception raised (or None) and duration the number
+            of seconds it took. It is measured here so that it does not
+            include the time waiting in a pool. reads is a dictionary with the
+            hits and misses of the content providers of this process while the
+            plugin was running, so that the ones of a process pool can be added
+            to the ones of the process that sent the plugin.
+    """
+    before = contents.getTotals()
+    start = time.perf_counter()
+    try:
+        results, error = methodObj(**kwargs), None
+    except Exception as e:
+        results, error = None, "{}: {}".format(type(e).__name__, str(e))
+    duration = time.perf_counter() - start
+    after = contents.getTotals()
+    return results, error, duration, {k: after[k] - before[k] for k in after}
+
+
+def runPlugins(analysisList, kwargs, executor=None, workers=None, produced=None):
+    """
+    Runs a list of analysis plugins and merges their results
+
+    The plugins can be run one after another ("serial"), in a pool of threads
+    ("thread"), useful for plugins waiting for I/O, or in a pool of processes
+    ("process"), useful for CPU-bound plugins such as the ones using regular
+    expressions. Whatever the executor, the results are merged in the order
+    of analysisList so the keys of the final dictionary are always the same
+    and in the same order.
+
+    A plugin raising an exception does not stop the analysis. The error is
+    recorded under the "plugin_errors" key, where the key is the name of the
+    plugin and the value the error found.
+
+    Args:
+    -----
+        analysisList: a list of runAnalysis callables.
+        kwargs: the kwargs to be passed to each plugin.
+        executor: one of EXECUTORS. If None, it is read from the configuration.
+        workers: the maximum number of plugins run at the same time. If None,
+            it is read from the configuration.
+        produced: a dictionary that, if provided, is filled with the keys
+            returned by each plugin, where the key is the name of the module
+            of the plugin. Plugins that failed are not included.
+
+    Returns:
+    --------
+        A dictionary with the merged results of all the plugins.
+    """
+    if executor is None or workers is None:
+        confExecutor, confWorkers = getExecutorConfiguration()
+        executor = executor or confExecutor
+        workers = workers or confWorkers
+
+    outcomes = [None] * len(analysisList)
+
+    if executor != "serial" and len(analysisList) > 1:
+        futures = {}
+        for i, methodObj in enumerate(analysisList):
+            if isParallelSafe(methodObj):
+                try:
+                    futures[i] = _submit(executor, workers, methodObj, kwargs)
+                except Exception as e:
+                    outcomes[i] = None, "{}: {}".format(type(e).__name__, str(e)), None, None
+
+        for i, (pool, future) in futures.items():
+            try:
+                outcomes[i] = future.result()
+                if executor == "process":
+                    # The copies of the content providers sent to the workers
+                    # count their reads there
+                    contents.addTotals(**outcomes[i][3])
+            except Exception as e:
+                # The plugin could not even be sent to or returned by the pool.
+                # If a worker died, the plugins running in that pool fail and
+                # the pool is replaced for the next analysis.
+                if isinstance(e, concurrent.futures.BrokenExecutor):
+                    _discardPool(executor, workers, pool)
+                outcomes[i] = None, "{}: {}".format(type(e).__name__, str(e)), None, None
+
+    # Plugins run here: all of them in serial mode and the ones that opted out
+    # of the pools otherwise, once the rest have finished
+    for i, methodObj in enumerate(analysisList):
+        if outcomes[i] is not None:
+            continue
+        if isParallelSafe(methodObj):
+            outcomes[i] = runPlugin(methodObj, kwargs)
+        else:
+            with getPluginLock(methodObj):
+                outcomes[i] = runPlugin(methodObj, kwargs)
+
+    results = {}
+    errors = {}
+    for methodObj, (pluginResults, error, duration, _) in zip(analysisList, outcomes):
+        name = getPluginName(methodObj)
+        if duration is not None:
+            PLUGIN_DURATION.observe(duration, (name,))
+        if error is not None:
+            print("[X] The analysis plugin '{}' failed: {}".format(name, error))
+            PLUGIN_FAILURES.inc((name, error.split(":")[0]))
+            errors[name] = error
+        else:
+            if pluginResults:
+                results.update(pluginResults)
+            if produced is not None:
+                produced[methodObj.__module__] = list(pluginResults or {})
+
+    if errors:
+        results["plugin_errors"] = errors
+
+    return results
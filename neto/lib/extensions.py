@@ -28,10 +28,15 @@ import textwrap
 from binascii import unhexlify
 
 import neto
+import neto.lib.archives as archives
+import neto.lib.executors as executors
+import neto.lib.libraries as libraries
+import neto.lib.registry as registry
 import neto.lib.utils as utils
 import neto.lib.crypto.multiple_hashes as hasher
 import neto.lib.crypto.pkcs7 as pkcs7
 import neto.lib.validations as validations
+from neto.lib.contents import ContentProvider
 
 
 class Extension:
@@ -50,10 +55,14 @@ class Extension:
             files as MD5, SHA1, and SHA256.
         @manifest: a dict with the manifest values of the extension.
         @manifest_file: a string containing the name of the manifes file.
+        @plugins: a dict with the version of each plugin used to conduct the
+            analysis and the keys of the features it returned.
+        @plugins_fingerprint: a hash of the plugins used to conduct the
+            analysis.
         @size: the size of the file.
     """
 
-    def __init__(self, lPath=None, tFolder=tempfile.gettempdir(), jText=None):
+    def __init__(self, lPath=None, tFolder=tempfile.gettempdir(), jText=None, inMemory=False, digest=None):
         """
         Constructor
 
@@ -62,6 +71,11 @@ class Extension:
             lPath: a string containing the local path for the file.
             tFolder: a string representing the folder for the temporal file.
             jText: a string representing the details of the extension as a JSON.
+            inMemory: a boolean that defines whether the members of the
+                extension are read directly from the zip file instead of
+                being extracted to tFolder.
+            digest: the hashes of the file at lPath if they have already been
+                calculated, so that the file is not hashed again.
 
         Raises:
         -------
@@ -78,38 +92,42 @@ class Extension:
             self.type = self.__class__.__name__
             self.manifest = None
             self.manifest_file = None
+            self.plugins = {}
+            self.plugins_fingerprint = registry.getRegistry().getFingerprint()
             self.size = None
 
-            # Hashing the file
-            with open(lPath, "rb") as iF:
-                data = iF.read()
-                self.digest = hasher.calculateHash(data)
-            # Trying to unzip the folder
-            tmpFolder = os.path.join(tFolder, self.digest["md5"])
+            # Hashing the file in chunks so that it is not loaded in memory
+            self.digest = digest or hasher.calculateHashFromFile(lPath)
+            self.size = os.path.getsize(lPath)
 
-            tmpFiles = utils.unzipFile(lPath, tmpFolder)
-            if tmpFiles:
-                # Create auxiliar structure for the found files
-                workingPaths = Extension.getWorkingPaths(tmpFolder, tmpFiles)
-
-                # Set the manifest_file
-                for m in ["manifest.json", "package.json"]:
-                    if m in workingPaths:
-                        self.manifest_file = m
-                        self.manifest = Extension.readManifest(os.path.join(tmpFolder, self.manifest_file))
-                        break
-                    else:
-                        self.manifest = None
-                        self.manifest_file = None
-
-                # Set the hashes for the files
-                self.files = Extension.hashFiles(workingPaths)
-
-                # Set the features for the file
-                self.features = Extension.analyse(unzippedFiles=workingPaths, extensionFile=lPath)
-
-                # Get third parties links
-                self.getThirdparties()
+            archive, workingPaths = Extension.openArchive(lPath, os.path.join(tFolder, self.digest["md5"]), inMemory)
+
+            # Files are read once and shared by the hashing and the plugins
+            provider = ContentProvider(archive)
+
+            try:
+                if workingPaths:
+                    # Set the manifest_file
+                    for m in ["manifest.json", "package.json"]:
+                        if m in workingPaths:
+                            self.manifest_file = m
+                            self.manifest = Extension.parseManifest(provider.read(m).decode("utf-8"))
+                            break
+                        else:
+                            self.manifest = None
+                            self.manifest_file = None
+
+                    # Set the hashes for the files
+                    self.files = Extension.hashFiles(provider)
+
+                    # Set the features for the file
+                    self.features = Extension.analyse(unzippedFiles=workingPaths, extensionFile=lPath, archive=archive, contents=provider, plugins=self.plugins)
+
+                    # Get third parties links
+                    self.getThirdparties()
+            finally:
+                provider.close()
+                archive.close()
         elif jText:
             try:
                 aux = json.loads(jText)
@@ -171,6 +189,10 @@ class Extension:
         -----
             value: a datetime object with the date.
         """
+        if isinstance(value, str):
+            # Already formatted when loaded from a JSON
+            self._date_analysis = value
+            return
         try:
             if validations.isTypeCorrect(value, 'datetime'):
                 self._date_analysis = str(value) + " UTC"
@@ -324,6 +346,64 @@ class Extension:
         if value is None or validations.isTypeCorrect(value, 'str'):
             self._manifest_file = value
 
+    @property
+    def plugins(self):
+        return self._plugins
+
+    @plugins.setter
+    def plugins(self, value):
+        """
+        Sets the plugins used in the analysis
+
+        Args:
+        -----
+            value: a dictionary where the key is the name of the module of the
+                plugin and the value a dictionary with its version, as returned
+                by neto.lib.registry.PluginRegistry.getPluginVersions, and the
+                keys of the features it returned. The thirdparty collectors
+                share the "thirdparties" feature, so the keys they added to it
+                are recorded too.
+                {
+                    "neto.plugins.analysis.comments": {
+                        "version": "…",
+                        "features": ["comments"]
+                    },
+                    "neto.plugins.thirdparties.virustotal": {
+                        "version": "…",
+                        "features": ["thirdparties"],
+                        "thirdparties": ["virustotal"]
+                    },
+                    …
+                }
+
+        Raises:
+        -------
+            TypeError: whenever the value provided is not a dictionary.
+        """
+        if value is None or validations.isTypeCorrect(value, 'dict'):
+            self._plugins = value
+
+    @property
+    def plugins_fingerprint(self):
+        return self._plugins_fingerprint
+
+    @plugins_fingerprint.setter
+    def plugins_fingerprint(self, value):
+        """
+        Sets the fingerprint of the plugins used in the analysis
+
+        Args:
+        -----
+            value: a string representing the fingerprint as returned by
+                neto.lib.registry.PluginRegistry.getFingerprint.
+
+        Raises:
+        -------
+            TypeError: whenever the value provided is not a string.
+        """
+        if value is None or validations.isTypeCorrect(value, 'str'):
+            self._plugins_fingerprint = value
+
     @property
     def size(self):
         return self._size
@@ -378,6 +458,10 @@ class Extension:
                 self.manifest = value
             elif key == "_manifest_file":
                 self.manifest_file = value
+            elif key == "_plugins":
+                self.plugins = value
+            elif key == "_plugins_fingerprint":
+                self.plugins_fingerprint = value
             elif key == "_size":
                 self.size = value
             elif key == "_type":
@@ -404,19 +488,37 @@ class Extension:
         """
         # Set the manifest
         with open(tmpFile) as iF:
-            # Analysed line by line to remove comments in JSON files
-            lines = iF.readlines()
-            text = ""
-            for l in lines:
-                if not l.lstrip().startswith('//'):
-                    text += l
-            # TODO: Grab this exception
-            # json.decoder.JSONDecodeError: Unexpected UTF-8 BOM (decode using utf-8-sig): line 1 column 1 (char 0)
-            try:
-                return json.loads(text)
-            except Exception as e:
-                print(str(e) + ": Something happenned when loading the manifest file.")
-                return None
+            return Extension.parseManifest(iF.read())
+
+    @classmethod
+    def parseManifest(self, text):
+        """
+        Method that parses the contents of a manifest
+
+        This method is a class method that can be invoked without instantiating
+        an object of the class.
+
+        Args:
+        ----
+            text: a string with the contents of the manifest file.
+
+        Returns:
+        --------
+            A dictionary with the values of the manifest.
+        """
+        # Analysed line by line to remove comments in JSON files
+        lines = text.splitlines(True)
+        text = ""
+        for l in lines:
+            if not l.lstrip().startswith('//'):
+                text += l
+        # TODO: Grab this exception
+        # json.decoder.JSONDecodeError: Unexpected UTF-8 BOM (decode using utf-8-sig): line 1 column 1 (char 0)
+        try:
+            return json.loads(text)
+        except Exception as e:
+            print(str(e) + ": Something happenned when loading the manifest file.")
+            return None
 
     @classmethod
     def getWorkingPaths(self, tmpFolder,  tmpFiles):
@@ -452,20 +554,58 @@ class Extension:
         return workingPaths
 
     @classmethod
-    def hashFiles(self, tmpFiles):
+    def openArchive(self, lPath, tmpFolder, inMemory=False):
         """
-        Method that hashes the files found in a folder
+        Method that gives access to the files of an extension
 
         Args:
         -----
-            tmpFolder: the list of files of an extension to be analysed.
-            tmpFiles: the list of files of an extension to be analysed.
+            lPath: a string containing the local path for the file.
+            tmpFolder: the folder where the files are extracted.
+            inMemory: a boolean that defines whether the members of the
+                extension are read directly from the zip file instead of
+                being extracted to tmpFolder.
+
+        Returns:
+        --------
+            A tuple (archive, workingPaths) where archive is a
+                neto.lib.archives object and workingPaths the dictionary
+                returned by getWorkingPaths.
+
+        Raises:
+        -------
+            zipfile.BadZipFile: if the function is unable of unzipping the
+                extension.
+        """
+        if inMemory:
+            archive = archives.ZipArchive(lPath, tmpFolder)
+            workingPaths = archives.LazyPaths(archive)
+        else:
+            tmpFiles = utils.unzipFile(lPath, tmpFolder)
+            # Create auxiliar structure for the found files
+            workingPaths = Extension.getWorkingPaths(tmpFolder, tmpFiles)
+            archive = archives.PathArchive(workingPaths)
+        return archive, workingPaths
+
+    @classmethod
+    def hashFiles(self, archive):
+        """
+        Method that hashes the files found in an extension
+
+        The files are read in chunks and all the hashes are calculated in a
+        single pass. If a neto.lib.contents.ContentProvider is given, the files
+        are also kept in its cache for the analysis plugins.
+
+        Args:
+        -----
+            archive: a neto.lib.archives object giving access to the files of
+                the extension. For backwards compatibility, a dictionary of
+                relative paths and real paths is also accepted.
 
         Returns:
         ---------
-            A dictionary of valid paths towards the files to analyse. The key
-            is the relative path inside the extension while the value is the
-            real path where the information is stored.
+            A dictionary where the key is the relative path inside the extension
+            while the value is the hash of the contents of the file.
                 {
                      "manifest.json": {
                          "md5": "…",
@@ -475,24 +615,39 @@ class Extension:
                      …
                 }
         """
+        if isinstance(archive, dict):
+            archive = archives.PathArchive(archive)
+
         files = {}
-        # The key is the temporal path, while the value is the name of the file
-        for relativePath, realPath in tmpFiles.items():
+        for relativePath in archive.namelist():
             # Calculate the hash
-            if os.path.isfile(realPath):
-                files[relativePath] = hasher.calculateHash(realPath)
+            if isinstance(archive, ContentProvider):
+                files[relativePath] = archive.getDigest(relativePath)
+            else:
+                with archive.open(relativePath) as iF:
+                    files[relativePath] = hasher.calculateHashFromFile(iF)
 
         return files
 
     @classmethod
-    def analyse(self, extensionFile=None, unzippedFiles=None):
+    def analyse(self, extensionFile=None, unzippedFiles=None, archive=None, contents=None, analysisList=None, plugins=None):
         """
         Method that extracts entities from the files found in a folder
 
         This method is a class method that can be invoked without instantiating
-        an object of the class. This object calls to a util function that
-        dinamically collects the functions found in the modules available at
-        neto.plugins.analysis.
+        an object of the class. The functions found in the modules available at
+        neto.plugins.analysis and in the user plugins folder are collected by
+        the process-wide neto.lib.registry.PluginRegistry.
+
+        The plugins are run using the executor set in the `plugin_executor`
+        option of the analyser configuration (serial, thread or process). A
+        plugin raising an exception does not stop the analysis: the error is
+        stored under the "plugin_errors" key instead.
+
+        The files recognised as well-known libraries (see
+        neto.lib.libraries.KnownLibraries) are passed to the plugins as the
+        `knownLibraries` kwarg so that they can skip them, and they are
+        recorded under the "known_library" key.
 
         Args:
         -----
@@ -505,6 +660,17 @@ class Extension:
                      "manifest.json": "/tmp/extension/manifest.json"
                      …
                 }
+            archive: A neto.lib.archives object that gives access to the
+                contents of the files without requiring their real path.
+            contents: A neto.lib.contents.ContentProvider shared by all the
+                plugins so that each file is read only once. If not
+                provided, a new one is created on top of the archive.
+            analysisList: A list of the runAnalysis callables to be run. If
+                not provided, all the plugins found are run.
+            plugins: A dictionary that, if provided, is filled with the version
+                of each plugin run and the keys of the features it returned
+                (see the @plugins property). Plugins that failed are recorded
+                without version so that they are run again.
 
         Returns:
         --------
@@ -524,6 +690,9 @@ class Extension:
                         "entities": []
                     },
                     "exif_data": {},
+                    "known_library": {
+                        "js/jquery.min.js": "jquery@3.3.1"
+                    },
                     "locales": {
                         "es": {
                             "Título": {
@@ -543,31 +712,181 @@ class Extension:
                     }
                 }
         """
-        results = {}
+        if contents is None and archive is not None:
+            contents = ContentProvider(archive)
+
+        knownLibraries = {}
+        if contents is not None:
+            knownLibraries = libraries.getKnownLibraries().identifyFiles(contents)
+
+        if analysisList is None:
+            analysisList = registry.getRegistry().getAnalysisMethods()
+        kwargs = {
+            "unzippedFiles": unzippedFiles,
+            "extensionFile": extensionFile,
+            "archive": archive,
+            "contents": contents,
+            "knownLibraries": knownLibraries,
+        }
+        produced = {}
+        results = executors.runPlugins(analysisList, kwargs, produced=produced)
+        results["known_library"] = knownLibraries
+
+        if plugins is not None:
+            versions = registry.getRegistry().getPluginVersions()
+            for methodObj in analysisList:
+                name = methodObj.__module__
+                plugins[name] = {
+                    "version": versions.get(name) if name in produced else None,
+                    "features": produced.get(name, []),
+                }
+        return results
 
-        analysisList = utils.getRunnableAnalysisFromModule("neto.plugins.analysis") + utils.getUserAnalysisMethods()
-        for methodObj in analysisList:
-            results.update(methodObj(unzippedFiles=unzippedFiles, extensionFile=extensionFile))
+    def getStalePlugins(self):
+        """
+        Method that gets the plugins that changed since the analysis
 
-        return results
+        Returns:
+        --------
+            A list with the names of the modules of the plugins that have been
+                added or modified, as well as the ones that failed. All of them
+                if the versions were not recorded in the analysis.
+        """
+        # Analysis performed before the versions were recorded do not have them
+        previous = getattr(self, "_plugins", None) or {}
+        versions = registry.getRegistry().getPluginVersions()
 
+        # Plugins recorded without version failed or had no source available
+        return [n for n, v in versions.items() if v is None or previous.get(n, {}).get("version") != v]
 
-    def getThirdparties(self):
+    def reanalyse(self, lPath, tFolder=tempfile.gettempdir(), inMemory=False):
+        """
+        Method that runs again the plugins that changed since the analysis
+
+        The plugins whose version is not the one recorded in the @plugins
+        property are run again and their features replaced. The features of
+        the plugins that have not changed are kept as they are and the ones of
+        the plugins that no longer exist are removed. Analysis performed before
+        the versions were recorded run all the plugins again.
+
+        Args:
+        -----
+            lPath: a string containing the local path for the file. It must be
+                the same file that was analysed.
+            tFolder: a string representing the folder for the temporal file.
+            inMemory: a boolean that defines whether the members of the
+                extension are read directly from the zip file instead of
+                being extracted to tFolder.
+
+        Returns:
+        --------
+            A list with the names of the modules of the plugins run again.
+
+        Raises:
+        -------
+            ValueError: if the file is not the one that was analysed.
+        """
+        digest = hasher.calculateHashFromFile(lPath)
+        # Previous versions stored a SHA1 as sha256
+        legacy = hasher.isLegacyDigest(self.digest)
+        if digest["sha1" if legacy else "sha256"] != self.digest["sha256"]:
+            raise ValueError("The file provided ({}) is not the extension analysed.".format(lPath))
+
+        reg = registry.getRegistry()
+        versions = reg.getPluginVersions()
+        previous = getattr(self, "_plugins", None) or {}
+        features = getattr(self, "_features", None) or {}
+
+        stale = self.getStalePlugins()
+        analysisList = [m for m in reg.getAnalysisMethods() if m.__module__ in stale]
+
+        # The features of the plugins to be run again or removed are dropped
+        errors = features.get("plugin_errors", {})
+        for name in list(previous):
+            if name in stale or name not in versions:
+                if "thirdparties" in previous[name]:
+                    # Only the results of this collector are dropped
+                    for key in previous[name]["thirdparties"]:
+                        features.get("thirdparties", {}).pop(key, None)
+                else:
+                    for key in previous[name].get("features", []):
+                        features.pop(key, None)
+                errors.pop(name.split(".")[-1], None)
+                del previous[name]
+
+        # All the collectors are run again if their results were dropped
+        # together, as the analysis recorded before did not tell them apart
+        staleThirdparties = [
+            t for t in reg.getThirdparties()
+            if type(t).__module__ in stale or "thirdparties" not in features
+        ]
+
+        if analysisList or legacy:
+            archive, workingPaths = Extension.openArchive(lPath, os.path.join(tFolder, self.digest["md5"]), inMemory)
+            provider = ContentProvider(archive)
+            try:
+                if legacy:
+                    # The wrong hashes of the extension and its files are replaced
+                    self.digest = digest
+                    self.files = Extension.hashFiles(provider)
+                if analysisList:
+                    results = Extension.analyse(unzippedFiles=workingPaths, extensionFile=lPath, archive=archive, contents=provider, analysisList=analysisList, plugins=previous)
+                    errors.update(results.pop("plugin_errors", {}))
+                    features.update(results)
+            finally:
+                provider.close()
+                archive.close()
+
+        if errors:
+            features["plugin_errors"] = errors
+        else:
+            features.pop("plugin_errors", None)
+        self.features = features
+
+        self.plugins = previous
+        if staleThirdparties:
+            self.getThirdparties(staleThirdparties)
+
+        self.plugins_fingerprint = reg.getFingerprint()
+        self.analyser_version = neto.__version__
+        self.date_analysis = dt.datetime.utcnow()
+        return stale
+
+
+    def getThirdparties(self, collectors=None):
         """
         Method that gets thirdparties analysis
 
         It automatically updates the instance's features with a thirdparties
         attribute in the Json. To do so, we will use the ThirdPartyCollector
         classes that will return always a JSON structure.
-        """
-        results = {}
-        results["thirdparties"] = {}
 
-        thirdpartiesList = utils.getAllClassesFromModule("neto.plugins.thirdparties", classesToAvoid=["ThirdpartyCollector"])
-        for classObj in thirdpartiesList:
-            results["thirdparties"].update(classObj.getInfo(self))
+        Args:
+        -----
+            collectors: the list of ThirdpartyCollector instances to be run.
+                If None, all of them are run and the previous results are
+                replaced. Otherwise, only the keys they return are updated.
+        """
+        reg = registry.getRegistry()
+        if collectors is None:
+            collectors = reg.getThirdparties()
+            thirdparties = {}
+        else:
+            thirdparties = dict(self.features.get("thirdparties") or {})
+
+        versions = reg.getPluginVersions()
+        for classObj in collectors:
+            info = classObj.getInfo(self)
+            thirdparties.update(info)
+
+            if getattr(self, "_plugins", None) is not None:
+                self.plugins[type(classObj).__module__] = {
+                    "version": versions.get(type(classObj).__module__),
+                    "features": ["thirdparties"],
+                    "thirdparties": sorted(info),
+                }
 
-        self.features.update(results)
+        self.features.update({"thirdparties": thirdparties})
 
 
     def __str__(self):
@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import neto.lib.utils as utils
+
+# Seconds before the last use of an entry is updated again when it is read
+TOUCH_INTERVAL = 3600
+
+
+class FileResultCache:
+    """
+    A persistent cache of the results of the plugins for each file
+
+    Many extensions bundle byte-identical copies of the same libraries. The
+    findings of a plugin for a file only depend on its contents, so they are
+    stored in a SQLite database keyed by the SHA256 of the contents, the name
+    of the plugin and its version. When the same file is found again in
+    another extension, the findings are recovered from here instead of
+    scanning it again.
+
+    The database is bounded by size: when it grows over maxSize, the least
+    recently used entries are evicted. The number of hits and misses of each
+    plugin are also stored so that the hit rate of the whole corpus can be
+    reported.
+    """
+
+    def __init__(self, dbPath, maxSize, minFileSize=0):
+        """
+        Constructor
+
+        Args:
+        -----
+            dbPath: the path of the SQLite database.
+            maxSize: the maximum number of bytes stored. If 0, the cache is
+                disabled.
+            minFileSize: files smaller than this are always scanned as it is
+                faster than looking for them in the cache.
+        """
+        self.dbPath = dbPath
+        self.maxSize = maxSize
+        self.minFileSize = minFileSize
+
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    @property
+    def enabled(self):
+        return self.maxSize > 0
+
+    def _getConnection(self):
+        """
+        Returns the connection to the database, opening it if needed
+
+        Connections are not shared with the processes forked from this one.
+
+        Returns:
+        --------
+            A sqlite3.Connection.
+        """
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.dbPath, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    sha256 TEXT NOT NULL,
+                    plugin TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (sha256, plugin, version)
+                );
+                CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+                CREATE TABLE IF NOT EXISTS stats (
+                    plugin TEXT PRIMARY KEY,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    size INTEGER NOT NULL
+                );
+                CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN
+                    UPDATE totals SET size = size + new.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE OF size ON results BEGIN
+                    UPDATE totals SET size = size + new.size - old.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN
+                    UPDATE totals SET size = size - old.size;
+                END;
+            """)
+            # The total size is kept up to date by the triggers, shared by all
+            # the processes using the database, so it is only summed once
+            if connection.execute("SELECT 1 FROM totals").fetchone() is None:
+                with connection:
+                    connection.execute("INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM results")
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def getMany(self, plugin, version, digests):
+        """
+        Recovers the findings stored for several files
+
+        Args:
+        -----
+            plugin: the name of the plugin.
+            version: the version of the plugin.
+            digests: a list of SHA256 of the contents of the files.
+
+        Returns:
+        --------
+            A dictionary where the key is the SHA256 and the value the data
+                stored. Files not found are not included.
+        """
+        found = {}
+        if not digests:
+            return found
+
+        now = time.time()
+        with self._lock:
+            connection = self._getConnection()
+            unique = list(set(digests))
+            # Avoids going over the maximum number of parameters of SQLite
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                rows = connection.execute(
+                    "SELECT sha256, data, last_used FROM results WHERE plugin = ? AND version = ? AND sha256 IN ({})".format(",".join("?" * len(chunk))),
+                    [plugin, version] + chunk
+                ).fetchall()
+                touched = []
+                for sha256, data, lastUsed in rows:
+                    found[sha256] = json.loads(zlib.decompress(data).decode("utf-8"))
+                    if now - lastUsed > TOUCH_INTERVAL:
+                        touched.append((now, sha256, plugin, version))
+                if touched:
+                    connection.executemany("UPDATE results SET last_used = ? WHERE sha256 = ? AND plugin = ? AND version = ?", touched)
+            connection.commit()
+        return found
+
+    def putMany(self, plugin, version, entries, hits=0, misses=0):
+        """
+        Stores the findings of several files and updates the statistics
+
+        Args:
+        -----
+            plugin: the name of the plugin.
+            version: the version of the plugin.
+            entries: a dictionary where the key is the SHA256 of the contents
+                of the file and the value the data to store. It must be
+                serializable as JSON.
+            hits: the number of files found in the cache.
+            misses: the number of files not found in the cache.
+        """
+        now = time.time()
+        rows = []
+        for sha256, value in entries.items():
+            data = zlib.compress(json.dumps(value).encode("utf-8"))
+            rows.append((sha256, plugin, version, data, len(data), now))
+
+        with self._lock:
+            connection = self._getConnection()
+            with connection:
+                # An upsert instead of INSERT OR REPLACE so that the triggers
+                # keeping the total size see the replaced rows
+                connection.executemany(
+                    "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (sha256, plugin, version) "
+                    "DO UPDATE SET data = excluded.data, size = excluded.size, last_used = excluded.last_used",
+                    rows
+                )
+                connection.execute("INSERT OR IGNORE INTO stats (plugin) VALUES (?)", (plugin,))
+                connection.execute("UPDATE stats SET hits = hits + ?, misses = misses + ? WHERE plugin = ?", (hits, misses, plugin))
+            if rows:
+                self._evict(connection)
+
+    def _evict(self, connection):
+        """
+        Removes the least recently used entries while the cache is too big
+
+        Args:
+        -----
+            connection: the connection to the database.
+        """
+        total = connection.execute("SELECT size FROM totals").fetchone()[0]
+        if total <= self.maxSize:
+            return
+
+        # Some room is freed so that this is not done after every insertion
+        target = self.maxSize * 0.9
+        with connection:
+            cursor = connection.execute("SELECT rowid, size FROM results ORDER BY last_used")
+            toDelete = []
+            for rowid, size in cursor:
+                if total <= target:
+                    break
+                toDelete.append((rowid,))
+                total -= size
+            connection.executemany("DELETE FROM results WHERE rowid = ?", toDelete)
+
+    def getStats(self):
+        """
+        Returns the statistics of the cache for the whole corpus analysed
+
+        Returns:
+        --------
+            A dictionary with the hits, misses, entries and size of the cache
+                as well as the hits and misses of each plugin.
+        """
+        with self._lock:
+            connection = self._getConnection()
+            entries = connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            size = connection.execute("SELECT size FROM totals").fetchone()[0]
+            plugins = {
+                plugin: {"hits": hits, "misses": misses}
+                for plugin, hits, misses in connection.execute("SELECT plugin, hits, misses FROM stats ORDER BY plugin")
+            }
+        return {
+            "hits": sum(p["hits"] for p in plugins.values()),
+            "misses": sum(p["misses"] for p in plugins.values()),
+            "entries": entries,
+            "size": size,
+            "plugins": plugins,
+        }
+
+    def clear(self):
+        """
+        Removes all the entries and statistics of the cache.
+        """
+        with self._lock:
+            connection = self._getConnection()
+            with connection:
+                connection.execute("DELETE FROM results")
+                connection.execute("DELETE FROM stats")
+
+
+def _encodeMatches(matches, rules):
+    """
+    Converts the results of a neto.lib.scanner.RuleScanner into JSON data
+
+    Args:
+    -----
+        matches: the dictionary returned by RuleScanner.scan.
+        rules: the list of expressions of the scanner.
+
+    Returns:
+    --------
+        A dictionary where the key is the index of the expression and the value
+            the list of values found. Bytes are stored as latin-1 strings and
+            tuples as lists.
+    """
+    encoded = {}
+    for i, r in enumerate(rules):
+        values = matches[r]
+        if values:
+            encoded[str(i)] = [
+                [v.decode("latin-1") for v in value] if isinstance(value, tuple) else value.decode("latin-1")
+                for value in values
+            ]
+    return encoded
+
+
+def _decodeMatches(encoded, rules):
+    """
+    Inverse of _encodeMatches
+
+    Args:
+    -----
+        encoded: the data returned by _encodeMatches.
+        rules: the list of expressions of the scanner.
+
+    Returns:
+    --------
+        A dictionary with the same format as the one returned by
+            RuleScanner.scan.
+    """
+    matches = {r: [] for r in rules}
+    for i, values in encoded.items():
+        matches[rules[int(i)]] = [
+            tuple(v.encode("latin-1") for v in value) if isinstance(value, list) else value.encode("latin-1")
+            for value in values
+        ]
+    return matches
+
+
+def scanFiles(ruleScanner, archive, names, plugin):
+    """
+    Scans several files of an extension using the cache
+
+    The files already scanned by the same plugin with the same expressions
+    are recovered from the cache while the rest are scanned and stored.
+
+    Args:
+    -----
+        ruleScanner: the neto.lib.scanner.RuleScanner of the plugin.
+        archive: the archive, or the neto.lib.contents.ContentProvider, where
+            the files are.
+        names: the list of relative paths of the files to scan.
+        plugin: the name of the plugin.
+
+    Returns:
+    --------
+        A dictionary where the key is the relative path of the file and the
+            value is the result of ruleScanner.scan for that file.
+    """
+    cache = getCache()
+    if not cache.enabled:
+        return {f: ruleScanner.scan(archive.read(f)) for f in names}
+
+    version = ruleScanner.getFingerprint()
+    matches = {}
+    digests = {}
+
+    for f in names:
+        data = archive.read(f)
+        if len(data) < cache.minFileSize:
+            # Small files are not worth looking for
+            matches[f] = ruleScanner.scan(data)
+        elif hasattr(archive, "getDigest"):
+            # Already calculated when hashing the files of the extension
+            digests[f] = archive.getDigest(f)["sha256"]
+        else:
+            digests[f] = hashlib.sha256(data).hexdigest()
+
+    try:
+        found = cache.getMany(plugin, version, list(digests.values()))
+    except sqlite3.Error as e:
+        print("[X] The file cache could not be read: {}".format(str(e)))
+        found = {}
+
+    toStore = {}
+    hits = misses = 0
+    for f, sha256 in digests.items():
+        if sha256 in found:
+            matches[f] = _decodeMatches(found[sha256], ruleScanner.rules)
+            hits += 1
+        else:
+            matches[f] = ruleScanner.scan(archive.read(f))
+            toStore[sha256] = _encodeMatches(matches[f], ruleScanner.rules)
+            # Copies of the file in the same extension are not scanned again
+            found[sha256] = toStore[sha256]
+            misses += 1
+
+    try:
+        cache.putMany(plugin, version, toStore, hits=hits, misses=misses)
+    except sqlite3.Error as e:
+        print("[X] The file cache could not be updated: {}".format(str(e)))
+
+    return {f: matches[f] for f in names}
+
+
+# The cache shared by the whole process
+_cache = None
+_cacheLock = threading.Lock()
+
+
+def getCache():
+    """
+    Returns the cache shared by the whole process, creating it on first use
+
+    The settings are read from the `file_cache_size` (in MB) and
+    `file_cache_min_size` (in bytes) options of the analyser configuration.
+
+    Returns:
+    --------
+        A FileResultCache.
+    """
+    global _cache
+    with _cacheLock:
+        if _cache is None:
+            config = utils.getConfigurationFor("analyser")
+            maxSize = config.get("file_cache_size")
+            minFileSize = config.get("file_cache_min_size")
+            _cache = FileResultCache(
+                os.path.join(utils.getConfigPath()["appPathData"], "file_cache.sqlite"),
+                int(maxSize if maxSize not in [None, ""] else 256) * 1024 * 1024,
+                int(minFileSize if minFileSize not in [None, ""] else 2048)
+            )
+        return _cache
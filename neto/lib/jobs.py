@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import concurrent.futures
+import datetime as dt
+import threading
+import time
+import uuid
+
+# Possible values of the status of a job
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted and the queue has no room for it
+    """
+    pass
+
+
+class Job:
+    """
+    A class that represents a piece of work submitted to a JobQueue
+    """
+
+    def __init__(self, method, target):
+        """
+        Constructor
+
+        Args:
+        -----
+            method: a string with the name of the method that submitted it.
+            target: the path, URI or name of the extension to be analysed.
+        """
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.target = target
+        self.status = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+
+    def getStatus(self):
+        """
+        Method that summarises the state of the job
+
+        Returns:
+        --------
+            A dictionary that can be serialised as JSON.
+                {
+                    "id": "…",
+                    "method": "submit_remote",
+                    "target": "https://example.com/sample.xpi",
+                    "status": "done",
+                    "submitted": "2018-01-01 00:00:00.000000 UTC",
+                    "started": "2018-01-01 00:00:00.000000 UTC",
+                    "finished": "2018-01-01 00:00:01.000000 UTC",
+                    "error": None
+                }
+        """
+        def formatDate(timestamp):
+            if timestamp is None:
+                return None
+            return str(dt.datetime.utcfromtimestamp(timestamp)) + " UTC"
+
+        return {
+            "id": self.id,
+            "method": self.method,
+            "target": self.target,
+            "status": self.status,
+            "submitted": formatDate(self.submitted),
+            "started": formatDate(self.started),
+            "finished": formatDate(self.finished),
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    A bounded queue of jobs run by a pool of workers
+
+    Submitting a job returns immediately. The job waits in the queue until one
+    of the workers is free and its status and result can be requested at any
+    time using its ID. When too many jobs are waiting, new ones are rejected
+    with a QueueFullError instead of making the clients wait indefinitely.
+
+    Finished jobs are kept so that their results can be recovered, but only the
+    most recent ones so that the memory used is bounded.
+    """
+
+    def __init__(self, workers=2, maxQueued=100, retention=1000):
+        """
+        Constructor
+
+        Args:
+        -----
+            workers: the number of jobs run at the same time.
+            maxQueued: the maximum number of jobs waiting for a worker.
+            retention: the number of finished jobs kept.
+        """
+        self.workers = workers
+        self.maxQueued = maxQueued
+        self.retention = retention
+
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._finished = collections.OrderedDict()
+        self._queued = 0
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def getDepth(self):
+        """
+        Returns the number of jobs waiting for a worker
+
+        Returns:
+        --------
+            An integer.
+        """
+        with self._lock:
+            return self._queued
+
+    def submit(self, method, target, function, *args):
+        """
+        Method that adds a job to the queue
+
+        Args:
+        -----
+            method: a string with the name of the method that submitted it.
+            target: the path, URI or name of the extension to be analysed.
+            function: the callable to be run by the worker. Its return value is
+                the result of the job.
+            args: the arguments for function.
+
+        Returns:
+        --------
+            The Job created.
+
+        Raises:
+        -------
+            QueueFullError: if there are already maxQueued jobs waiting.
+        """
+        job = Job(method, target)
+        with self._lock:
+            if self._queued >= self.maxQueued:
+                raise QueueFullError("{} jobs are already waiting for a worker. Try again later.".format(self._queued))
+            self._queued += 1
+            self._jobs[job.id] = job
+            job.future = self._pool.submit(self._run, job, function, args)
+        return job
+
+    def _run(self, job, function, args):
+        """
+        Runs a job in a worker
+
+        Args:
+        -----
+            job: the Job to be run.
+            function: the callable to be run.
+            args: the arguments for function.
+        """
+        with self._lock:
+            if job.status != QUEUED:
+                return
+            self._queued -= 1
+            job.status = RUNNING
+            job.started = time.time()
+
+        try:
+            result = function(*args)
+            status, error = DONE, None
+        except Exception as e:
+            result, status, error = None, FAILED, "{}: {}".format(type(e).__name__, str(e))
+
+        with self._lock:
+            job.result = result
+            job.error = error
+            job.status = status
+            job.finished = time.time()
+            self._setFinished(job)
+
+    def _setFinished(self, job):
+        """
+        Records a finished job removing the oldest ones. It requires the lock.
+
+        Args:
+        -----
+            job: the Job finished.
+        """
+        job.future = None
+        self._finished[job.id] = True
+        while len(self._finished) > self.retention:
+            oldest, _ = self._finished.popitem(last=False)
+            self._jobs.pop(oldest, None)
+
+    def getJob(self, jobId):
+        """
+        Method that recovers a job
+
+        Args:
+        -----
+            jobId: the ID of the job.
+
+        Returns:
+        --------
+            The Job.
+
+        Raises:
+        -------
+            KeyError: if the job does not exist or it is too old.
+        """
+        with self._lock:
+            if jobId not in self._jobs:
+                raise KeyError("No job found with the ID '{}'.".format(jobId))
+            return self._jobs[jobId]
+
+    def cancel(self, jobId):
+        """
+        Method that cancels a job that has not started yet
+
+        Args:
+        -----
+            jobId: the ID of the job.
+
+        Returns:
+        --------
+            True if the job has been cancelled and False if it had already
+                started.
+
+        Raises:
+        -------
+            KeyError: if the job does not exist or it is too old.
+        """
+        job = self.getJob(jobId)
+        with self._lock:
+            if job.status != QUEUED:
+                return job.status == CANCELLED
+            job.future.cancel()
+            self._queued -= 1
+            job.status = CANCELLED
+            job.finished = time.time()
+            self._setFinished(job)
+            return True
+
+    def shutdown(self):
+        """
+        Cancels the jobs waiting and waits for the running ones to finish.
+        """
+        with self._lock:
+            jobIds = [job.id for job in self._jobs.values() if job.status == QUEUED]
+        for jobId in jobIds:
+            self.cancel(jobId)
+        self._pool.shutdown(wait=True)
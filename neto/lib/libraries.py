@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+import neto.lib.utils as utils
+
+# Types of the files that may contain a known library
+LIBRARY_TYPES = ["js", "css"]
+
+# Lines pointing to source maps, which are usually removed or rewritten
+SOURCE_MAP = re.compile(r"^\s*(//|/\*)[#@]\s*source(Mapping)?URL=")
+
+
+def getDatabasePath():
+    """
+    Returns the path of the database of known libraries
+
+    Returns:
+    --------
+        A string representing the path of the JSON file.
+    """
+    return os.path.join(utils.getConfigPath()["appPath"], "known_libraries.json")
+
+
+def normalise(data):
+    """
+    Function that normalises the contents of a library
+
+    Copies of the same library are usually modified when bundled in an
+    extension: the license header is removed, the source map comment is
+    stripped or the line endings change. The normalised text ignores these
+    differences, so its hash can be used to recognise the library.
+
+    Args:
+    -----
+        data: the bytes of the file.
+
+    Returns:
+    --------
+        A string with the normalised text or None if the file is not text.
+    """
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    text = text.lstrip("\ufeff").lstrip()
+
+    # Remove the leading comments, where the license is usually found
+    while True:
+        if text.startswith("/*"):
+            end = text.find("*/")
+            if end == -1:
+                break
+            text = text[end + 2:].lstrip()
+        elif text.startswith("//"):
+            end = text.find("\n")
+            text = text[end + 1:].lstrip() if end != -1 else ""
+        else:
+            break
+
+    lines = []
+    for l in text.splitlines():
+        l = l.rstrip()
+        if l and not SOURCE_MAP.match(l):
+            lines.append(l)
+    return "\n".join(lines)
+
+
+def calculateFingerprint(data):
+    """
+    Function that calculates the fingerprint of the contents of a library
+
+    Args:
+    -----
+        data: the bytes of the file.
+
+    Returns:
+    --------
+        A string with the SHA256 of the normalised text or None if the file is
+            not text.
+    """
+    text = normalise(data)
+    if text is None:
+        return None
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class KnownLibraries:
+    """
+    A class that recognises well-known libraries by the hash of their contents
+
+    The database is a JSON file that can be updated by the analyst (see
+    bin/known_libraries.py) with two indexes: the SHA256 of the exact contents
+    of the files and the SHA256 of their normalised contents.
+        {
+            "sha256": {
+                "…": "jquery@3.3.1",
+                …
+            },
+            "fingerprint": {
+                "…": "jquery@3.3.1",
+                …
+            }
+        }
+    """
+
+    def __init__(self, dbPath):
+        """
+        Constructor
+
+        Args:
+        -----
+            dbPath: the path of the JSON file. It is created when saving if it
+                does not exist.
+        """
+        self.dbPath = dbPath
+        self.sha256 = {}
+        self.fingerprint = {}
+        self.mtime = None
+        self._version = None
+
+        if os.path.isfile(dbPath):
+            self.mtime = os.path.getmtime(dbPath)
+            with open(dbPath) as iF:
+                data = json.load(iF)
+            self.sha256 = data.get("sha256", {})
+            self.fingerprint = data.get("fingerprint", {})
+
+    def getVersion(self):
+        """
+        Method that returns the version of the contents of the database
+
+        The files skipped by the plugins depend on the database, so it is part
+        of the version of the plugins using it (see
+        neto.lib.registry.PluginRegistry.getPluginVersions).
+
+        Returns:
+        --------
+            A string with the SHA256 of the hashes stored.
+        """
+        if self._version is None:
+            text = json.dumps({"sha256": self.sha256, "fingerprint": self.fingerprint}, sort_keys=True)
+            self._version = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return self._version
+
+    def __len__(self):
+        return len(set(self.sha256.values()) | set(self.fingerprint.values()))
+
+    def identify(self, data, sha256=None):
+        """
+        Method that checks if some contents belong to a known library
+
+        The exact hash is checked first as it is cheaper. The normalised
+        fingerprint is only calculated if it is not found.
+
+        Args:
+        -----
+            data: the bytes of the file.
+            sha256: the SHA256 of data if it has already been calculated.
+
+        Returns:
+        --------
+            A string like "name@version" or None if it is not known.
+        """
+        if not self.sha256 and not self.fingerprint:
+            return None
+
+        sha256 = sha256 or hashlib.sha256(data).hexdigest()
+        if sha256 in self.sha256:
+            return self.sha256[sha256]
+
+        if self.fingerprint:
+            return self.fingerprint.get(calculateFingerprint(data))
+        return None
+
+    def identifyFiles(self, archive):
+        """
+        Method that finds the known libraries in the files of an extension
+
+        Args:
+        -----
+            archive: the archive, or the neto.lib.contents.ContentProvider,
+                where the files are.
+
+        Returns:
+        --------
+            A dictionary where the key is the relative path of the file and the
+                value the library found as "name@version".
+        """
+        found = {}
+        if not self.sha256 and not self.fingerprint:
+            return found
+
+        for f in archive.namelist():
+            if f.split(".")[-1].lower() in LIBRARY_TYPES:
+                # Already calculated when hashing the files of the extension
+                sha256 = archive.getDigest(f)["sha256"] if hasattr(archive, "getDigest") else None
+                library = self.identify(archive.read(f), sha256)
+                if library:
+                    found[f] = library
+        return found
+
+    def add(self, name, version, data):
+        """
+        Method that adds the contents of a library to the database
+
+        Args:
+        -----
+            name: the name of the library.
+            version: the version of the library.
+            data: the bytes of one of the files of the library.
+
+        Returns:
+        --------
+            A string like "name@version".
+        """
+        library = "{}@{}".format(name, version)
+        self._version = None
+        self.sha256[hashlib.sha256(data).hexdigest()] = library
+        fingerprint = calculateFingerprint(data)
+        if fingerprint:
+            self.fingerprint[fingerprint] = library
+        return library
+
+    def remove(self, library):
+        """
+        Method that removes all the hashes of a library
+
+        Args:
+        -----
+            library: a string like "name@version".
+
+        Returns:
+        --------
+            The number of hashes removed.
+        """
+        removed = 0
+        self._version = None
+        for index in [self.sha256, self.fingerprint]:
+            for h in [h for h, l in index.items() if l == library]:
+                del index[h]
+                removed += 1
+        return removed
+
+    def save(self):
+        """
+        Method that writes the database to its JSON file.
+        """
+        with open(self.dbPath, "w") as oF:
+            json.dump({"sha256": self.sha256, "fingerprint": self.fingerprint}, oF, indent=2, sort_keys=True)
+        self.mtime = os.path.getmtime(self.dbPath)
+
+
+# The database shared by the whole process
+_libraries = None
+_librariesLock = threading.Lock()
+
+
+def getKnownLibraries():
+    """
+    Returns the database shared by the whole process
+
+    It is loaded again if the file has been modified since it was read.
+
+    Returns:
+    --------
+        A KnownLibraries object.
+    """
+    global _libraries
+    dbPath = getDatabasePath()
+    try:
+        mtime = os.path.getmtime(dbPath)
+    except OSError:
+        mtime = None
+
+    with _librariesLock:
+        if _libraries is None or _libraries.dbPath != dbPath or _libraries.mtime != mtime:
+            try:
+                _libraries = KnownLibraries(dbPath)
+            except (OSError, ValueError) as e:
+                print("[X] The database of known libraries at '{}' could not be loaded: {}".format(dbPath, str(e)))
+                _libraries = KnownLibraries(os.devnull)
+                _libraries.dbPath = dbPath
+                _libraries.mtime = mtime
+        return _libraries
+
+
+def excludeKnownLibraries(names, kwargs):
+    """
+    Removes the known libraries from a list of files
+
+    It is intended to be used by the analysis plugins that do not need to
+    scan the code of well-known libraries.
+
+    Args:
+    -----
+        names: a list of relative paths.
+        kwargs: the kwargs received by runAnalysis.
+
+    Returns:
+    --------
+        A list of relative paths.
+    """
+    known = kwargs.get("knownLibraries") or {}
+    return [f for f in names if f not in known]
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import re
+
+try:
+    # Optional C implementation (pip3 install pyahocorasick)
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Bytes that have a special meaning when found unescaped in an expression
+METACHARACTERS = b".^$*+?{}[]()|\\"
+
+# Maximum number of literals an expression can be expanded into
+MAX_EXPANSIONS = 32
+
+# Minimum length of the literals so that candidates are not too frequent
+MIN_LENGTH = 4
+
+# Length of the prefixes used to skip the text that cannot start a literal
+SKIP_LENGTH = 3
+
+
+# A quantifier applied to the previous atom, including lazy ones
+QUANTIFIER = re.compile(rb"(?:[*+?]|\{[0-9]*(?:,[0-9]*)?\})\??")
+
+
+def tokenize(rule):
+    """
+    Function that splits an expression in its top level tokens
+
+    Each token is an atom (a character, an escape sequence, a class or a group)
+    together with its quantifier, if any. If the expression contains an
+    alternation at the top level, it is returned as a single token as it cannot
+    be split safely.
+
+    Args:
+    -----
+        rule: a regular expression as bytes.
+
+    Returns:
+    --------
+        A list of bytes whose concatenation is the expression.
+    """
+    tokens = []
+    i = 0
+    while i < len(rule):
+        start = i
+        c = rule[i:i+1]
+        if c == b"\\":
+            i += 4 if rule[i+1:i+2] == b"x" else 2
+        elif c == b"[":
+            i += 1
+            # A closing bracket just after the opening one is a literal
+            if rule[i:i+1] == b"^":
+                i += 1
+            if rule[i:i+1] == b"]":
+                i += 1
+            while i < len(rule) and rule[i:i+1] != b"]":
+                i += 2 if rule[i:i+1] == b"\\" else 1
+            i += 1
+        elif c == b"(":
+            depth = 0
+            while i < len(rule):
+                c = rule[i:i+1]
+                if c == b"\\":
+                    i += 1
+                elif c == b"[":
+                    # Skip classes as they may contain parenthesis
+                    i += 1
+                    if rule[i:i+1] == b"^":
+                        i += 1
+                    if rule[i:i+1] == b"]":
+                        i += 1
+                    while i < len(rule) and rule[i:i+1] != b"]":
+                        i += 2 if rule[i:i+1] == b"\\" else 1
+                elif c == b"(":
+                    depth += 1
+                elif c == b")":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            i += 1
+        elif c == b"|":
+            return [b"(?:" + rule + b")"]
+        else:
+            i += 1
+
+        m = QUANTIFIER.match(rule, i)
+        if m and c not in [b"^", b"$"]:
+            i = m.end()
+        tokens.append(rule[start:i])
+
+    return tokens
+
+
+def _expandToken(token):
+    """
+    Function that gets the literal values a single token can match
+
+    Args:
+    -----
+        token: a token as returned by tokenize.
+
+    Returns:
+    --------
+        A tuple (values, optional, repeated) where values is a list of bytes,
+            optional says if the token may be skipped and repeated if it may
+            match more than once. Values is None if the token is not literal.
+    """
+    optional = repeated = False
+    if token.endswith(b"??"):
+        token, optional = token[:-2], True
+    elif token.endswith(b"?"):
+        token, optional = token[:-1], True
+    elif token.endswith(b"+") and len(token) > 1 and token[-2:-1] != b"\\":
+        token, repeated = token[:-1], True
+
+    if len(token) == 1 and token not in METACHARACTERS:
+        values = [token]
+    elif len(token) == 2 and token[:1] == b"\\" and not token[1:].isalnum():
+        values = [token[1:]]
+    elif token[:1] == b"[" and token[-1:] == b"]" and token[1:2] != b"^":
+        body = token[1:-1]
+        values = []
+        i = 0
+        while i < len(body):
+            if body[i:i+1] == b"\\" and not body[i+1:i+2].isalnum():
+                values.append(body[i+1:i+2])
+                i += 2
+            elif body[i:i+1] in [b"\\", b"-"]:
+                # Ranges and escaped classes are not expanded
+                return None, optional, repeated
+            else:
+                values.append(body[i:i+1])
+                i += 1
+    else:
+        return None, optional, repeated
+    return values, optional, repeated
+
+
+def expandPrefix(rule):
+    """
+    Function that expands the literal prefix of an expression
+
+    The prefix is the longest sequence of literal characters, escaped
+    characters, simple classes like [Mm] and optional characters like "-?"
+    found at the start of the expression. Any match of the expression starts
+    with one of the returned literals.
+
+    Args:
+    -----
+        rule: a regular expression as bytes.
+
+    Returns:
+    --------
+        A list of literals as bytes (an empty list if there is no prefix).
+    """
+    expansions = [b""]
+    for token in tokenize(rule):
+        values, optional, repeated = _expandToken(token)
+        if values is None:
+            break
+        aux = [e + v for e in expansions for v in values]
+        if optional:
+            aux = expansions + aux
+        if len(aux) > MAX_EXPANSIONS:
+            break
+        expansions = aux
+        if repeated:
+            break
+    return [e for e in expansions if e]
+
+
+def _buildSkipPattern(node):
+    """
+    Function that builds a pattern matching any of the paths of a trie
+
+    Args:
+    -----
+        node: a dictionary where the keys are bytes (as integers) and the
+            values are the child nodes.
+
+    Returns:
+    --------
+        The pattern as bytes.
+    """
+    alternatives = [re.escape(bytes([b])) + _buildSkipPattern(child) for b, child in sorted(node.items())]
+    if len(alternatives) == 0:
+        return b""
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return b"(?:" + b"|".join(alternatives) + b")"
+
+
+class LiteralMatcher:
+    """
+    An Aho-Corasick automaton that finds several literals in a single pass
+
+    The automaton is built once and it can be used to find all the
+    occurrences of all the literals in a given text, including overlapping
+    ones, in time linear to the length of the text. If the pyahocorasick
+    package is installed, it will be used instead of the Python
+    implementation.
+
+    To speed up the Python implementation, the text between matches that
+    cannot start any literal is skipped with a regular expression built with
+    the first bytes of the literals.
+    """
+
+    def __init__(self, literals):
+        """
+        Constructor
+
+        Args:
+        -----
+            literals: a list of literals as bytes.
+        """
+        self.literals = list(collections.OrderedDict.fromkeys(literals))
+
+        if ahocorasick:
+            # Latin-1 maps each byte to a single character
+            self._automaton = ahocorasick.Automaton(ahocorasick.STORE_LENGTH)
+            for literal in self.literals:
+                self._automaton.add_word(literal.decode("latin-1"))
+            self._automaton.make_automaton()
+            return
+
+        # Goto function, failure function and outputs for each state
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for literal in self.literals:
+            state = 0
+            for b in literal:
+                if b not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][b] = len(self._goto) - 1
+                state = self._goto[state][b]
+            self._output[state].append(len(literal))
+
+        # Breadth first traversal to set the failure links
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for b, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and b not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(b, 0)
+                self._output[child] += self._output[self._fail[child]]
+
+        # Trie of the first bytes of the literals
+        trie = {}
+        for literal in self.literals:
+            node = trie
+            for b in literal[:SKIP_LENGTH]:
+                node = node.setdefault(b, {})
+        self._skip = re.compile(_buildSkipPattern(trie)) if trie else None
+
+    def findAll(self, data):
+        """
+        Method that finds all the occurrences of the literals
+
+        Args:
+        -----
+            data: the bytes to be scanned.
+
+        Returns:
+        --------
+            A list of tuples (start, literal) sorted by the end of each
+                occurrence.
+        """
+        results = []
+
+        if ahocorasick:
+            if self.literals:
+                for end, length in self._automaton.iter(data.decode("latin-1")):
+                    results.append((end - length + 1, bytes(data[end - length + 1:end + 1])))
+            return results
+
+        if self._skip is None:
+            return results
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        state = 0
+        i = 0
+        length = len(data)
+        while i < length:
+            if state == 0:
+                # Jump to the next place where a literal may start
+                m = self._skip.search(data, i)
+                if m is None:
+                    break
+                i = m.start()
+            b = data[i]
+            while state and b not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(b, 0)
+            for size in output[state]:
+                results.append((i - size + 1, data[i - size + 1:i + 1]))
+            i += 1
+
+        return results
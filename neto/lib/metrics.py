@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import bisect
+import threading
+
+# Upper bounds in seconds of the buckets of the histograms of durations
+DURATION_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+# Upper bounds in bytes of the buckets of the histograms of sizes
+SIZE_BUCKETS = [1024 * 2 ** i for i in range(0, 20, 2)]
+
+
+def _formatLabels(labelNames, labels, extra=None):
+    """
+    Formats the labels of a sample in the Prometheus text format
+
+    Args:
+    -----
+        labelNames: the names of the labels.
+        labels: a tuple with the values of the labels.
+        extra: an additional (name, value) tuple, like the le of a bucket.
+
+    Returns:
+    --------
+        A string like '{method="remote",status="ok"}' or '' if there are no
+            labels.
+    """
+    pairs = list(zip(labelNames, labels))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def _formatValue(value):
+    """
+    Formats a value in the Prometheus text format
+
+    Args:
+    -----
+        value: an int or a float.
+
+    Returns:
+    --------
+        A string.
+    """
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class Metric:
+    """
+    Base class of the metrics
+
+    Each metric has a fixed list of label names and keeps one value for each
+    combination of label values seen, given as a tuple in the same order.
+
+    Instead of being updated, counters and gauges can be calculated each time
+    they are rendered by a function returning either a number or a dictionary
+    where the key is the tuple of the values of the labels and the value the
+    number. It is useful to expose statistics already kept somewhere else.
+    """
+    type = "untyped"
+
+    def __init__(self, name, description, labelNames=(), function=None):
+        """
+        Constructor
+
+        Args:
+        -----
+            name: the name of the metric, like neto_rpc_requests_total.
+            description: the help text of the metric.
+            labelNames: a tuple with the names of the labels.
+            function: the function that calculates the values, if any.
+        """
+        self.name = name
+        self.description = description
+        self.labelNames = tuple(labelNames)
+        self.function = function
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def getSamples(self):
+        """
+        Returns the samples of the metric
+
+        Returns:
+        --------
+            A list of (suffix, labels, extra label, value) tuples.
+        """
+        if self.function is not None:
+            try:
+                values = self.function()
+            except Exception:
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [("", labels, None, value) for labels, value in sorted(values.items())]
+
+    def render(self):
+        """
+        Returns the metric in the Prometheus text format
+
+        Returns:
+        --------
+            A list of lines.
+        """
+        lines = [
+            "# HELP {} {}".format(self.name, self.description),
+            "# TYPE {} {}".format(self.name, self.type),
+        ]
+        for suffix, labels, extra, value in self.getSamples():
+            lines.append("{}{}{} {}".format(self.name, suffix, _formatLabels(self.labelNames, labels, extra), _formatValue(value)))
+        return lines
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, like the number of requests received
+    """
+    type = "counter"
+
+    def inc(self, labels=(), amount=1):
+        """
+        Increments the counter
+
+        Args:
+        -----
+            labels: a tuple with the values of the labels.
+            amount: the number to add.
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, like the number of jobs waiting
+    """
+    type = "gauge"
+
+    def set(self, value, labels=()):
+        """
+        Sets the value of the gauge
+
+        Args:
+        -----
+            value: the new value.
+            labels: a tuple with the values of the labels.
+        """
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """
+    The distribution of a value, like the duration of the requests
+
+    The buckets are fixed when the histogram is created, so observing a value
+    is just a binary search and an increment.
+    """
+    type = "histogram"
+
+    def __init__(self, name, description, labelNames=(), buckets=DURATION_BUCKETS):
+        """
+        Constructor
+
+        Args:
+        -----
+            name: the name of the metric.
+            description: the help text of the metric.
+            labelNames: a tuple with the names of the labels.
+            buckets: the sorted list of the upper bounds of the buckets. An
+                additional +Inf bucket is always added.
+        """
+        super().__init__(name, description, labelNames)
+        self.buckets = list(buckets)
+
+    def observe(self, value, labels=()):
+        """
+        Records a value
+
+        Args:
+        -----
+            value: the value observed.
+            labels: a tuple with the values of the labels.
+        """
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                # Counts of each bucket (not cumulative), sum and count
+                data = self._values[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            data[0][i] += 1
+            data[1] += value
+            data[2] += 1
+
+    def getSamples(self):
+        with self._lock:
+            values = [(labels, list(data[0]), data[1], data[2]) for labels, data in sorted(self._values.items())]
+
+        samples = []
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets + [float("inf")], counts):
+                cumulative += bucketCount
+                samples.append(("_bucket", labels, ("le", _formatValue(float(bound))), cumulative))
+            samples.append(("_sum", labels, None, float(total)))
+            samples.append(("_count", labels, None, count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    A collection of metrics that can be rendered together
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        """
+        Adds a metric unless one with the same name already exists
+
+        Modules that are reloaded define their metrics again, so the ones
+        already registered are reused to keep their values.
+
+        Args:
+        -----
+            metric: a Metric.
+
+        Returns:
+        --------
+            The Metric registered with that name.
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """
+        Returns all the metrics in the Prometheus text format
+
+        Returns:
+        --------
+            A string.
+        """
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+# The registry shared by the whole process
+REGISTRY = MetricsRegistry()
+
+
+def counter(name, description, labelNames=(), function=None):
+    """
+    Returns the counter registered with a name, creating it if needed
+
+    Returns:
+    --------
+        A Counter.
+    """
+    return REGISTRY.register(Counter(name, description, labelNames, function))
+
+
+def gauge(name, description, labelNames=(), function=None):
+    """
+    Returns the gauge registered with a name, creating it if needed
+
+    Returns:
+    --------
+        A Gauge.
+    """
+    return REGISTRY.register(Gauge(name, description, labelNames, function))
+
+
+def histogram(name, description, labelNames=(), buckets=DURATION_BUCKETS):
+    """
+    Returns the histogram registered with a name, creating it if needed
+
+    Returns:
+    --------
+        A Histogram.
+    """
+    return REGISTRY.register(Histogram(name, description, labelNames, buckets))
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import importlib
+import inspect
+import os
+import sys
+import threading
+
+import neto.lib.executors as executors
+import neto.lib.libraries as libraries
+import neto.lib.utils as utils
+
+
+class PluginRegistry:
+    """
+    A class that discovers the plugins once and keeps them for the process
+
+    Discovering the plugins means importing every module of the plugin
+    packages, inspecting them and, for the thirdparties, instantiating the
+    collectors. The registry does it the first time they are requested and
+    reuses the result afterwards.
+
+    The user plugins found in the appPathPlugins folder are the only ones
+    expected to change while Neto is running, so their modification times are
+    checked each time they are requested and the folder is loaded again if any
+    file has been added, removed or modified. Anything else is only loaded
+    again when reload() is called explicitly.
+    """
+
+    def __init__(self, analysisModule="neto.plugins.analysis", thirdpartiesModule="neto.plugins.thirdparties"):
+        """
+        Constructor
+
+        Args:
+        -----
+            analysisModule: the package containing the analysis plugins.
+            thirdpartiesModule: the package containing the thirdparty
+                collectors.
+        """
+        self.analysisModule = analysisModule
+        self.thirdpartiesModule = thirdpartiesModule
+
+        self._lock = threading.RLock()
+        self._analysis = None
+        self._thirdparties = None
+        self._userMethods = []
+        self._userSignature = None
+        self._versions = None
+
+    def getUserPluginsPath(self):
+        """
+        Returns the folder where the user plugins are stored
+
+        Returns:
+        --------
+            A string representing the absolute path of the folder.
+        """
+        return os.path.abspath(utils.getConfigPath()["appPathPlugins"])
+
+    def _getUserSignature(self, path):
+        """
+        Returns the modification times of the user plugins
+
+        Args:
+        -----
+            path: the folder where the user plugins are stored.
+
+        Returns:
+        --------
+            A tuple of (file name, modification time) tuples.
+        """
+        signature = []
+        for module in sorted(os.listdir(path)):
+            if module[-3:] == '.py':
+                try:
+                    signature.append((module, os.stat(os.path.join(path, module)).st_mtime_ns))
+                except OSError:
+                    # Removed while listing the folder
+                    pass
+        return tuple(signature)
+
+    def _loadUserMethods(self, path, signature):
+        """
+        Imports the user plugins, reloading the ones already imported
+
+        Args:
+        -----
+            path: the folder where the user plugins are stored.
+            signature: the signature returned by _getUserSignature.
+
+        Returns:
+        --------
+            A list of runAnalysis callables.
+        """
+        # Inserting in the System Path
+        if not path in sys.path:
+            sys.path.append(path)
+
+        previous = dict(self._userSignature or ())
+
+        userMethods = []
+        for module, mtime in signature:
+            current = module.replace('.py', '')
+            try:
+                if current in sys.modules and previous.get(module) != mtime:
+                    my_module = importlib.reload(sys.modules[current])
+                else:
+                    my_module = importlib.import_module(current)
+            except Exception as e:
+                print("[X] The user plugin '{}' could not be loaded: {}".format(module, str(e)))
+                continue
+
+            methodObj = getattr(my_module, "runAnalysis", None)
+            if inspect.isfunction(methodObj):
+                userMethods.append(methodObj)
+
+        return userMethods
+
+    def getUserAnalysisMethods(self):
+        """
+        Returns the runAnalysis methods of the user plugins
+
+        The folder is loaded again if any of the plugins has been added,
+        removed or modified since the last call.
+
+        Returns:
+        --------
+            A list of runAnalysis callables.
+        """
+        path = self.getUserPluginsPath()
+        signature = self._getUserSignature(path)
+
+        with self._lock:
+            if signature != self._userSignature:
+                self._userMethods = self._loadUserMethods(path, signature)
+                self._userSignature = signature
+            return list(self._userMethods)
+
+    def getAnalysisMethods(self):
+        """
+        Returns the runAnalysis methods of all the analysis plugins
+
+        Returns:
+        --------
+            A list of runAnalysis callables. The ones shipped with Neto come
+                first, followed by the user plugins.
+        """
+        with self._lock:
+            if self._analysis is None:
+                self._analysis = utils.getRunnableAnalysisFromModule(self.analysisModule)
+            analysis = list(self._analysis)
+        return analysis + self.getUserAnalysisMethods()
+
+    def getThirdparties(self):
+        """
+        Returns the instances of the thirdparty collectors
+
+        Returns:
+        --------
+            A list of neto.lib.thirdparties.ThirdpartyCollector instances.
+        """
+        with self._lock:
+            if self._thirdparties is None:
+                self._thirdparties = utils.getAllClassesFromModule(self.thirdpartiesModule, classesToAvoid=["ThirdpartyCollector"])
+            return list(self._thirdparties)
+
+    def getPluginVersions(self):
+        """
+        Returns the version of the code of each plugin
+
+        The version of a plugin is the SHA256 of the source of its module, so
+        it changes whenever the plugin is modified. It can be used to know
+        which plugins have to be run again on a previous analysis.
+
+        The plugins importing neto.lib.libraries skip the known libraries, so
+        the version of the database of known libraries is part of theirs.
+
+        Returns:
+        --------
+            A dictionary where the key is the name of the module of the plugin
+                and the value the SHA256 of its source (None if the source is
+                not available). The analysis plugins come first, in the order
+                in which they are run, followed by the thirdparties.
+        """
+        methods = self.getAnalysisMethods()
+        thirdparties = self.getThirdparties()
+        librariesVersion = libraries.getKnownLibraries().getVersion()
+
+        with self._lock:
+            key = (self._userSignature, librariesVersion)
+            if self._versions is not None and self._versions[0] == key:
+                return dict(self._versions[1])
+
+            modules = [inspect.getmodule(m) for m in methods]
+            modules += [inspect.getmodule(type(t)) for t in thirdparties]
+
+            versions = {}
+            for module in modules:
+                try:
+                    with open(inspect.getsourcefile(module), "rb") as iF:
+                        versions[module.__name__] = hashlib.sha256(iF.read()).hexdigest()
+                except (OSError, TypeError):
+                    # Source not available, only the name is considered
+                    versions[module.__name__] = None
+                    continue
+                if any(v is libraries for v in vars(module).values()):
+                    versions[module.__name__] = hashlib.sha256(
+                        (versions[module.__name__] + librariesVersion).encode()
+                    ).hexdigest()
+
+            self._versions = (key, versions)
+            return dict(versions)
+
+    def getFingerprint(self):
+        """
+        Returns a fingerprint of the code of all the plugins
+
+        The fingerprint changes whenever a plugin is added, removed or
+        modified, so it can be used to know if a previous analysis was
+        performed with the same plugins.
+
+        Returns:
+        --------
+            A string with the SHA256 of the names and the sources of the
+                plugins.
+        """
+        h = hashlib.sha256()
+        for name, version in self.getPluginVersions().items():
+            h.update(name.encode() + b"\0")
+            if version is not None:
+                h.update(bytes.fromhex(version))
+        return h.hexdigest()
+
+    def reload(self):
+        """
+        Loads again all the plugins, including the ones shipped with Neto
+
+        The pools used to run the plugins are also shut down so that new
+        workers get the new code.
+
+        Returns:
+        --------
+            A dictionary with the number of plugins of each type loaded.
+        """
+        with self._lock:
+            modules = set()
+            for methodObj in self._analysis or []:
+                modules.add(inspect.getmodule(methodObj))
+            for instance in self._thirdparties or []:
+                modules.add(inspect.getmodule(type(instance)))
+
+            for module in modules:
+                try:
+                    importlib.reload(module)
+                except Exception as e:
+                    print("[X] The plugin '{}' could not be reloaded: {}".format(module.__name__, str(e)))
+
+            self._analysis = None
+            self._thirdparties = None
+            self._versions = None
+            # Forces the user plugins to be reloaded
+            self._userSignature = ()
+
+            executors.shutdownPools()
+
+            return {
+                "analysis": len(self.getAnalysisMethods()),
+                "thirdparties": len(self.getThirdparties()),
+            }
+
+
+# The registry shared by the whole process
+_registry = None
+_registryLock = threading.Lock()
+
+
+def getRegistry():
+    """
+    Returns the registry shared by the whole process, creating it on first use
+
+    Returns:
+    --------
+        A PluginRegistry.
+    """
+    global _registry
+    with _registryLock:
+        if _registry is None:
+            _registry = PluginRegistry()
+        return _registry
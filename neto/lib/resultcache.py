@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Approximate number of bytes used by an entry besides its value
+ENTRY_OVERHEAD = 200
+
+
+class ResultCache:
+    """
+    A cache of the analysis returned by the daemon
+
+    Two kinds of entries are kept in the same LRU:
+        - ("sha256", <sha256>:<version>): the JSON representation of the
+            analysis of the extension with those contents performed by that
+            version of the analyser (see getVersion).
+        - ("uri", <uri>): the validators sent by the server (ETag and
+            Last-Modified) and the SHA256 of the extension downloaded.
+    So a URI requested again is answered without downloading it and an
+    extension found at several URIs or sent several times is analysed once.
+
+    Entries expire ttl seconds after being stored and the least recently used
+    ones are evicted when the approximate size of the entries in memory goes
+    over maxSize. If dbPath is set, they are also stored in a SQLite database
+    so that they survive a restart of the daemon.
+    """
+
+    def __init__(self, maxSize, ttl, dbPath=None, getVersion=None):
+        """
+        Constructor
+
+        Args:
+        -----
+            maxSize: the maximum number of bytes kept in memory. If 0, the
+                cache is disabled.
+            ttl: the number of seconds an entry is valid.
+            dbPath: the path of the SQLite database. If None, the entries are
+                only kept in memory.
+            getVersion: a function returning a string that identifies the
+                version of the analyser and its plugins. The analysis stored
+                with other versions are not found anymore.
+        """
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.dbPath = dbPath
+        self.getVersion = getVersion or (lambda: "")
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._stats = {kind: {"hits": 0, "misses": 0} for kind in ["uri", "sha256"]}
+        self._connection = None
+        self._pid = None
+
+    @property
+    def enabled(self):
+        return self.maxSize > 0
+
+    def _getConnection(self):
+        """
+        Returns the connection to the database, opening it if needed
+
+        Connections are not shared with the processes forked from this one.
+
+        Returns:
+        --------
+            A sqlite3.Connection.
+        """
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.dbPath, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    expires REAL NOT NULL,
+                    PRIMARY KEY (kind, key)
+                );
+                CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+            """)
+            with connection:
+                connection.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _remember(self, key, value, expires, size=None):
+        """
+        Adds an entry to the memory evicting the least recently used ones. It
+        requires the lock.
+
+        Args:
+        -----
+            key: a (kind, key) tuple.
+            value: the value to store.
+            expires: the timestamp when the entry expires.
+            size: the approximate number of bytes of the value.
+        """
+        size = ENTRY_OVERHEAD + (size if size is not None else len(json.dumps(value)))
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[1]
+        self._entries[key] = (expires, size, value)
+        self._size += size
+        while self._size > self.maxSize and self._entries:
+            _, (_, oldSize, _) = self._entries.popitem(last=False)
+            self._size -= oldSize
+
+    def _get(self, key):
+        """
+        Recovers an entry from the memory or, if not found, from the disk. It
+        requires the lock.
+
+        Args:
+        -----
+            key: a (kind, key) tuple.
+
+        Returns:
+        --------
+            The value stored or None if it is not found or it has expired.
+        """
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry:
+            if entry[0] >= now:
+                self._entries.move_to_end(key)
+                return entry[2]
+            self._size -= self._entries.pop(key)[1]
+
+        if self.dbPath:
+            try:
+                row = self._getConnection().execute(
+                    "SELECT data, expires FROM entries WHERE kind = ? AND key = ? AND expires >= ?", key + (now,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print("[X] The result cache could not be read: {}".format(str(e)))
+                row = None
+            if row:
+                text = zlib.decompress(row[0]).decode("utf-8")
+                value = json.loads(text)
+                self._remember(key, value, row[1], len(text))
+                return value
+        return None
+
+    def _put(self, key, value, expires):
+        """
+        Stores an entry in the memory and on disk. It requires the lock.
+
+        Args:
+        -----
+            key: a (kind, key) tuple.
+            value: the value to store. It must be serializable as JSON.
+            expires: the timestamp when the entry expires.
+        """
+        text = json.dumps(value)
+        self._remember(key, value, expires, len(text))
+        if self.dbPath:
+            try:
+                with self._getConnection() as connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                        key + (zlib.compress(text.encode("utf-8")), expires)
+                    )
+            except sqlite3.Error as e:
+                print("[X] The result cache could not be updated: {}".format(str(e)))
+
+    def _getDigestKey(self, sha256):
+        """
+        Returns the key of the analysis of some contents with this version
+
+        Args:
+        -----
+            sha256: the SHA256 of the extension.
+
+        Returns:
+        --------
+            A (kind, key) tuple.
+        """
+        return ("sha256", "{}:{}".format(sha256, self.getVersion()))
+
+    def getByDigest(self, sha256):
+        """
+        Recovers the analysis of some contents
+
+        Args:
+        -----
+            sha256: the SHA256 of the extension.
+
+        Returns:
+        --------
+            The JSON representation of the analysis or None if not found.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            result = self._get(self._getDigestKey(sha256))
+            self._stats["sha256"]["hits" if result is not None else "misses"] += 1
+            return result
+
+    def getByURI(self, uri):
+        """
+        Recovers what is known about a URI
+
+        Args:
+        -----
+            uri: the URI of the extension.
+
+        Returns:
+        --------
+            A (validators, sha256, result) tuple or None if not found.
+                validators is a dictionary with the etag and last_modified
+                received and result is the JSON representation of the analysis
+                or None if it is not found anymore or it was performed by
+                another version.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._get(("uri", uri))
+            result = self._get(self._getDigestKey(entry["sha256"])) if entry else None
+            self._stats["uri"]["hits" if result is not None else "misses"] += 1
+            if entry is None:
+                return None
+            return entry["validators"], entry["sha256"], result
+
+    def put(self, sha256, result, uri=None, validators=None):
+        """
+        Stores the analysis of an extension
+
+        Args:
+        -----
+            sha256: the SHA256 of the extension.
+            result: the JSON representation of the analysis.
+            uri: the URI where the extension was downloaded from, if any.
+            validators: a dictionary with the etag and last_modified received
+                with the extension.
+        """
+        if not self.enabled:
+            return
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._put(self._getDigestKey(sha256), result, expires)
+            if uri:
+                self._put(("uri", uri), {"validators": validators or {}, "sha256": sha256}, expires)
+
+    def getStats(self):
+        """
+        Returns the statistics of the cache since the daemon was started
+
+        Returns:
+        --------
+            A dictionary with the number of entries and bytes in memory and the
+                hits and misses of each kind of lookup.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size": self._size,
+                "uri": dict(self._stats["uri"]),
+                "sha256": dict(self._stats["sha256"]),
+            }
+
+    def clear(self):
+        """
+        Removes all the entries, in memory and on disk.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            if self.dbPath:
+                with self._getConnection() as connection:
+                    connection.execute("DELETE FROM entries")
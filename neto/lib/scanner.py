@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import hashlib
+import re
+import threading
+
+import neto.lib.literals as literals
+
+# Number of combined patterns kept compiled by each scanner
+COMBINED_CACHE_SIZE = 256
+
+
+class RuleScanner:
+    """
+    A class that scans a buffer looking for several regular expressions
+
+    Instead of running re.findall once per expression, all the expressions are
+    compiled into a combined pattern where each of them is an alternative. The
+    combined pattern is used to find which of the expressions appear in the
+    buffer in a single pass and re.findall is only run for those ones, so the
+    results are exactly the same as running each expression on its own.
+
+    As an alternation only reports one alternative per position, once an
+    expression is found it is removed from the combined pattern and the search
+    is resumed from the position where it was found. Thus, expressions that
+    match at the same place than others are never missed.
+
+    The combined pattern is built as a trie of the tokens of the expressions,
+    so common prefixes such as "://.+\." are only evaluated once for all the
+    expressions sharing them.
+
+    Expressions starting with a literal prefix (e.g. b"coin-?hive.com" always
+    starts with b"coinhive" or b"coin-hive") are not part of the combined
+    pattern. Instead, the prefixes of all of them are looked for in a single
+    pass with a neto.lib.literals.LiteralMatcher and each expression is only
+    tried at the places where one of its prefixes was found.
+    """
+
+    def __init__(self, rules):
+        """
+        Constructor
+
+        Args:
+        -----
+            rules: a list of regular expressions as bytes. Repeated expressions
+                are only scanned once.
+        """
+        self.rules = list(collections.OrderedDict.fromkeys(rules))
+        # Compiled lazily as big lists of literals are rarely matched at all
+        self._compiled = {}
+
+        # Expressions that cannot be combined are always run on their own
+        self.combinable = []
+        self.standalone = []
+        # Literal prefixes and the indexes of the expressions starting with them
+        self.prefixes = collections.OrderedDict()
+        for i, r in enumerate(self.rules):
+            expansions = literals.expandPrefix(r)
+            if expansions and min(len(e) for e in expansions) >= literals.MIN_LENGTH:
+                for e in expansions:
+                    self.prefixes.setdefault(e, []).append(i)
+            elif RuleScanner.isCombinable(r):
+                self.combinable.append(i)
+            else:
+                self.standalone.append(i)
+
+        self._literals = literals.LiteralMatcher(self.prefixes.keys())
+        self._combined = collections.OrderedDict()
+        # Plugins may be run from several threads at the same time
+        self._lock = threading.Lock()
+
+    @classmethod
+    def isCombinable(self, rule):
+        """
+        Method that checks if an expression can be part of a combined pattern
+
+        Expressions using backreferences, named groups or inline flags depend
+        on their own group numbering or on being the whole pattern.
+
+        Args:
+        -----
+            rule: a regular expression as bytes.
+
+        Returns:
+        --------
+            A boolean.
+        """
+        if re.search(rb"\\[1-9]|\(\?P[<=]|\(\?[aiLmsux>]|[*+?}]\+", rule):
+            return False
+        try:
+            re.compile(rule + b"|" + rule)
+        except re.error:
+            return False
+        return True
+
+    def getFingerprint(self):
+        """
+        Returns a fingerprint of the expressions of the scanner
+
+        Returns:
+        --------
+            A string with the SHA256 of the expressions.
+        """
+        return hashlib.sha256(b"\0".join(self.rules)).hexdigest()
+
+    def getCompiled(self, i):
+        """
+        Returns an expression compiled, compiling it on first use
+
+        Args:
+        -----
+            i: the index of the expression.
+
+        Returns:
+        --------
+            A compiled regular expression.
+        """
+        compiled = self._compiled.get(i)
+        if compiled is None:
+            compiled = self._compiled[i] = re.compile(self.rules[i])
+        return compiled
+
+    def _getCombined(self, pending):
+        """
+        Returns the combined pattern for a set of expressions, compiling it if
+        needed
+
+        Args:
+        -----
+            pending: a tuple with the indexes of the expressions.
+
+        Returns:
+        --------
+            A compiled regular expression where the empty group "r<index>" is
+                matched at the end of the expression with that index.
+        """
+        with self._lock:
+            pattern = self._combined.get(pending)
+            if pattern is not None:
+                self._combined.move_to_end(pending)
+                return pattern
+
+        trie = {}
+        for i in pending:
+            node = trie
+            for token in literals.tokenize(self.rules[i]):
+                node = node.setdefault(token, {})
+            node.setdefault(None, []).append(i)
+        pattern = re.compile(_buildFromTrie(trie))
+
+        with self._lock:
+            self._combined[pending] = pattern
+            if len(self._combined) > COMBINED_CACHE_SIZE:
+                self._combined.popitem(last=False)
+        return pattern
+
+    def findMatchingRules(self, data):
+        """
+        Method that finds which of the expressions without a literal prefix
+        match the data
+
+        Args:
+        -----
+            data: the bytes to be scanned.
+
+        Returns:
+        --------
+            A set with the indexes of the expressions found in data.
+        """
+        found = set()
+        pending = list(self.combinable)
+        pos = 0
+
+        while pending:
+            m = self._getCombined(tuple(pending)).search(data, pos)
+            if m is None:
+                break
+            i = int(m.lastgroup[1:])
+            found.add(i)
+            pending.remove(i)
+            # Other expressions may match at the same position
+            pos = m.start()
+
+        for i in self.standalone:
+            if self.getCompiled(i).search(data):
+                found.add(i)
+
+        return found
+
+    def findCandidates(self, data):
+        """
+        Method that finds where the expressions with a literal prefix may match
+
+        Args:
+        -----
+            data: the bytes to be scanned.
+
+        Returns:
+        --------
+            A dictionary where the key is the index of the expression and the
+                value is the sorted list of positions where one of its
+                prefixes starts.
+        """
+        candidates = {}
+        for start, literal in self._literals.findAll(data):
+            for i in self.prefixes[literal]:
+                candidates.setdefault(i, set()).add(start)
+        return {i: sorted(starts) for i, starts in candidates.items()}
+
+    def findAllAt(self, i, data, starts):
+        """
+        Method that emulates re.findall trying the expression only at some
+        positions
+
+        As any match of the expression starts at one of the given positions,
+        the result is the same as running re.findall on the whole data.
+
+        Args:
+        -----
+            i: the index of the expression.
+            data: the bytes to be scanned.
+            starts: the sorted list of positions to be tried.
+
+        Returns:
+        --------
+            The list that re.findall would have returned.
+        """
+        compiled = self.getCompiled(i)
+        results = []
+        end = 0
+        for start in starts:
+            # Matches found by re.findall do not overlap
+            if start < end:
+                continue
+            m = compiled.match(data, start)
+            if m is None:
+                continue
+            if compiled.groups == 0:
+                results.append(m.group(0))
+            elif compiled.groups == 1:
+                results.append(m.groups(b"")[0])
+            else:
+                results.append(m.groups(b""))
+            end = m.end()
+        return results
+
+    def scan(self, data):
+        """
+        Method that scans the data looking for all the expressions
+
+        Args:
+        -----
+            data: the bytes to be scanned.
+
+        Returns:
+        --------
+            A dictionary where the key is the expression and the value is the
+                list returned by re.findall for that expression.
+                {
+                    b"eval\\(": [b"eval("],
+                    b"atob": [],
+                    …
+                }
+        """
+        found = self.findMatchingRules(data)
+        candidates = self.findCandidates(data) if self.prefixes else {}
+
+        results = {}
+        for i, r in enumerate(self.rules):
+            if i in found:
+                results[r] = self.getCompiled(i).findall(data)
+            elif i in candidates:
+                results[r] = self.findAllAt(i, data, candidates[i])
+            else:
+                results[r] = []
+        return results
+
+
+def _buildFromTrie(node):
+    """
+    Function that builds a pattern from a trie of tokens
+
+    Args:
+    -----
+        node: a dictionary where the keys are tokens and the values are the
+            child nodes. The key None contains the indexes of the expressions
+            ending in that node.
+
+    Returns:
+    --------
+        The pattern as bytes.
+    """
+    alternatives = []
+    for token, child in node.items():
+        if token is None:
+            alternatives += [b"(?P<r" + str(i).encode() + b">)" for i in child]
+        else:
+            alternatives.append(token + _buildFromTrie(child))
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return b"(?:" + b"|".join(alternatives) + b")"
+
+
+def flattenRules(table):
+    """
+    Function that gets the list of expressions in a table of rules
+
+    Args:
+    -----
+        table: a dictionary where the key is the category and the value is
+            either an expression or a list of them.
+
+    Returns:
+    --------
+        A list of expressions.
+    """
+    rules = []
+    for value in table.values():
+        if isinstance(value, list):
+            rules += value
+        else:
+            rules.append(value)
+    return rules
@@ -19,24 +19,778 @@
 #
 ################################################################################
 
+import datetime as dt
 import json
 import os
-from os import listdir
-from os.path import isfile, join
+import re
+import sqlite3
+import threading
+import urllib.parse
+import zlib
 
+import neto.lib.crypto.multiple_hashes as hasher
 import neto.lib.utils as utils
 
-def getExtensionList(analysisFolder=None):
+# Name of the database created in the analysis folder
+STORE_NAME = "analysis.sqlite"
+
+# Summary columns, in the order in which they are stored
+SUMMARY = [
+    "md5",
+    "sha256",
+    "filename",
+    "manifest_name",
+    "manifest_version",
+    "date_analysis",
+    "analyser_version",
+    "plugins_fingerprint",
+    "analysis_path",
+]
+
+# Version of the inverted index. The index is built again when it changes.
+INDEX_VERSION = 1
+
+# Words made of letters, digits, underscores and hyphens joined by dots
+TOKEN = re.compile(r"[a-z0-9_\-]+(?:\.[a-z0-9_\-]+)*")
+
+# Fields that can be used to scope a search, in addition to the entities
+FIELDS = ["comments", "domain", "filename", "manifest", "permissions"]
+
+# Columns of the analysis table
+COLUMNS = SUMMARY + ["document"]
+
+
+def tokenize(text):
+    """
+    Function that splits a text into the tokens used by the inverted index
+
+    Compound words such as domains are kept as a whole as well as split in
+    their parts, so "coinhive.min.js" can be found searching for
+    "coinhive.min.js" or just for "coinhive".
+
+    Args:
+    -----
+        text: a string.
+
+    Returns:
+    --------
+        A set of lowercase strings of at least two characters.
+    """
+    tokens = set()
+    for t in TOKEN.findall(str(text).lower()):
+        tokens.add(t)
+        if "." in t or "-" in t:
+            tokens.update(re.split(r"[\.\-]", t))
+    return set(t for t in tokens if len(t) > 1)
+
+
+def _getStrings(value):
+    """
+    Function that collects the strings found in a JSON value
+
+    Args:
+    -----
+        value: a dictionary, list or scalar.
+
+    Returns:
+    --------
+        A generator of strings.
+    """
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _getStrings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _getStrings(v)
+    elif isinstance(value, str):
+        yield value
+
+
+def _getDict(value):
+    """
+    Function that returns a section of an analysis if it is a dictionary
+
+    Args:
+    -----
+        value: the section found in the document.
+
+    Returns:
+    --------
+        The value itself or an empty dictionary if it is not a dictionary.
+    """
+    return value if isinstance(value, dict) else {}
+
+
+def _getValues(found):
+    """
+    Function that returns the values of a list of features
+
+    Args:
+    -----
+        found: a list of dictionaries with a "value" key, as the comments or
+            each type of entity are stored.
+
+    Returns:
+    --------
+        A list with the values of the items that are dictionaries.
+    """
+    if not isinstance(found, list):
+        return []
+    return [f.get("value") for f in found if isinstance(f, dict)]
+
+
+def getTokens(document):
+    """
+    Function that extracts the tokens of an analysis for each field
+
+    The fields indexed are the entities found (url, email, ipv4…), the domains
+    of the URLs and emails, the permissions, all the values of the manifest,
+    the comments and the name of the file.
+
+    Args:
+    -----
+        document: the dictionary representing the analysis of an extension as
+            found in its JSON file.
+
+    Returns:
+    --------
+        A set of tuples (token, field).
+    """
+    features = _getDict(document.get("_features"))
+    manifest = _getDict(document.get("_manifest"))
+
+    values = {
+        "comments": _getValues(features.get("comments")),
+        "domain": [],
+        "filename": [document.get("_filename")],
+        "manifest": list(_getStrings(manifest)),
+        "permissions": list(_getStrings([manifest.get("permissions"), manifest.get("optional_permissions")])),
+    }
+
+    for entity, found in _getDict(features.get("entities")).items():
+        values[entity] = _getValues(found)
+    for url in values.get("url", []):
+        try:
+            values["domain"].append(urllib.parse.urlsplit(str(url)).hostname)
+        except ValueError:
+            pass
+    for email in values.get("email", []):
+        values["domain"].append(str(email).split("@")[-1])
+
+    tokens = set()
+    for field, texts in values.items():
+        for text in texts:
+            if isinstance(text, str):
+                tokens.update((t, field) for t in tokenize(text))
+    return tokens
+
+
+def getSummary(document, analysisPath=None):
+    """
+    Function that extracts the summary columns from an analysis
+
+    Args:
+    -----
+        document: the dictionary representing the analysis of an extension as
+            found in its JSON file.
+        analysisPath: the path of the JSON file of the analysis.
+
+    Returns:
+    --------
+        A dictionary with the keys found in SUMMARY.
+    """
+    digest = _getDict(document.get("_digest"))
+    manifest = _getDict(document.get("_manifest"))
+    return {
+        "md5": digest.get("md5"),
+        # The SHA1 stored as sha256 by old versions is not kept as a SHA256
+        "sha256": None if hasher.isLegacyDigest(digest) else digest.get("sha256"),
+        "filename": document.get("_filename"),
+        "manifest_name": manifest.get("name"),
+        "manifest_version": manifest.get("version"),
+        "date_analysis": document.get("_date_analysis"),
+        "analyser_version": document.get("_analyser_version"),
+        "plugins_fingerprint": document.get("_plugins_fingerprint"),
+        "analysis_path": analysisPath,
+    }
+
+
+class AnalysisStore:
+    """
+    An indexed store of the analysis performed
+
+    Listing the analysis used to require reading and parsing every JSON file
+    of the analysis folder. The store keeps in a SQLite database a row per
+    extension with the summary columns found in SUMMARY, which are indexed,
+    and the full JSON document compressed, so the list can be recovered with
+    a single query and a document without looking for its file.
+
+    An inverted index maps the tokens of the entities, domains, permissions,
+    manifest, comments and file name of each analysis (see getTokens) to the
+    extensions where they are found. It is updated in the same transaction as
+    the analysis, so searching them does not require reading the documents.
+
+    The validators (ETag and Last-Modified) of the URIs downloaded are kept
+    too, so that monitored URIs are requested conditionally and the analysis
+    of the extensions that did not change is reused without downloading them.
+
+    The JSON files are still written next to the database so that they can be
+    used by other tools.
+    """
+
+    def __init__(self, dbPath):
+        """
+        Constructor
+
+        Args:
+        -----
+            dbPath: the path of the SQLite database. It is created if it does
+                not exist.
+        """
+        self.dbPath = dbPath
+
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _getConnection(self):
+        """
+        Returns the connection to the database, opening it if needed
+
+        Connections are not shared with the processes forked from this one.
+
+        Returns:
+        --------
+            A sqlite3.Connection.
+        """
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.dbPath, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS analysis (
+                    id INTEGER PRIMARY KEY,
+                    md5 TEXT UNIQUE NOT NULL,
+                    sha256 TEXT,
+                    filename TEXT,
+                    manifest_name TEXT,
+                    manifest_version TEXT,
+                    date_analysis TEXT,
+                    analyser_version TEXT,
+                    plugins_fingerprint TEXT,
+                    analysis_path TEXT,
+                    document BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS analysis_sha256 ON analysis (sha256);
+                CREATE INDEX IF NOT EXISTS analysis_filename ON analysis (filename);
+                CREATE INDEX IF NOT EXISTS analysis_manifest_name ON analysis (manifest_name);
+                CREATE TABLE IF NOT EXISTS tokens (
+                    token TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    PRIMARY KEY (token, field, id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS tokens_id ON tokens (id);
+                CREATE TABLE IF NOT EXISTS uris (
+                    uri TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    md5 TEXT NOT NULL,
+                    sha256 TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+            if connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                self._buildIndex(connection)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _buildIndex(self, connection):
+        """
+        Builds the inverted index from the documents stored
+
+        It is only needed for stores created before the index existed or by
+        another version of it.
+
+        Args:
+        -----
+            connection: the connection to the database.
+        """
+        with connection:
+            connection.execute("DELETE FROM tokens")
+            for rowid, document in connection.execute("SELECT id, document FROM analysis").fetchall():
+                try:
+                    tokens = getTokens(json.loads(zlib.decompress(document).decode("utf-8")))
+                except ValueError:
+                    continue
+                connection.executemany("INSERT INTO tokens VALUES (?, ?, ?)", [(t, f, rowid) for t, f in tokens])
+            connection.execute("PRAGMA user_version = {}".format(INDEX_VERSION))
+
+    def __len__(self):
+        with self._lock:
+            return self._getConnection().execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+
+    def getSignature(self):
+        """
+        Returns the modification times and sizes of the files of the database
+
+        Any write changes the signature, so it can be used to know if a list
+        recovered before is still valid without querying the database.
+
+        Returns:
+        --------
+            A tuple of (modification time, size) tuples.
+        """
+        signature = []
+        for path in [self.dbPath, self.dbPath + "-wal"]:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _getRow(self, text, analysisPath):
+        """
+        Builds the row of an analysis and its tokens
+
+        Args:
+        -----
+            text: the JSON representation of the analysis.
+            analysisPath: the path of the JSON file of the analysis.
+
+        Returns:
+        --------
+            A list with the values of the columns of the table followed by the
+                tokens returned by getTokens.
+
+        Raises:
+        -------
+            ValueError: if the text is not a valid analysis.
+        """
+        document = json.loads(text)
+        if not isinstance(document, dict):
+            raise ValueError("The analysis is not a JSON object.")
+        summary = getSummary(document, analysisPath)
+        if not summary["md5"]:
+            raise ValueError("The analysis does not contain the hashes of the extension.")
+        return [summary[c] for c in SUMMARY] + [zlib.compress(text.encode("utf-8")), getTokens(document)]
+
+    def _putRows(self, rows):
+        """
+        Stores several rows in a single transaction
+
+        Args:
+        -----
+            rows: a list of rows as returned by _getRow.
+        """
+        with self._lock:
+            connection = self._getConnection()
+            with connection:
+                # Locked for writing before looking for the previous rows so
+                # that another process storing the same extension cannot
+                # insert it in between
+                connection.execute("BEGIN IMMEDIATE")
+                for row in rows:
+                    previous = connection.execute("SELECT id FROM analysis WHERE md5 = ?", (row[0],)).fetchone()
+                    if previous:
+                        rowid = previous[0]
+                        connection.execute("UPDATE analysis SET {} WHERE id = ?".format(", ".join(c + " = ?" for c in COLUMNS)), row[:-1] + [rowid])
+                        connection.execute("DELETE FROM tokens WHERE id = ?", (rowid,))
+                    else:
+                        rowid = connection.execute("INSERT INTO analysis ({}) VALUES ({})".format(", ".join(COLUMNS), ",".join("?" * len(COLUMNS))), row[:-1]).lastrowid
+                    connection.executemany("INSERT INTO tokens VALUES (?, ?, ?)", [(t, f, rowid) for t, f in row[-1]])
+
+    def put(self, text, analysisPath=None):
+        """
+        Stores the analysis of an extension, replacing any previous one
+
+        Args:
+        -----
+            text: the JSON representation of the analysis.
+            analysisPath: the path of the JSON file of the analysis.
+
+        Returns:
+        --------
+            The MD5 of the extension.
+
+        Raises:
+        -------
+            ValueError: if the text is not a valid analysis.
+        """
+        row = self._getRow(text, analysisPath)
+        self._putRows([row])
+        return row[0]
+
+    def getText(self, md5):
+        """
+        Recovers the JSON representation of an analysis
+
+        Args:
+        -----
+            md5: the MD5 of the extension.
+
+        Returns:
+        --------
+            A string or None if the extension is not found.
+        """
+        with self._lock:
+            row = self._getConnection().execute("SELECT document FROM analysis WHERE md5 = ?", (md5,)).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def getValidators(self, uri):
+        """
+        Recovers the validators of the last version downloaded from a URI
+
+        Args:
+        -----
+            uri: the URI of the extension.
+
+        Returns:
+        --------
+            A (validators, digest) tuple or None if the URI is not found.
+                validators is a dictionary with the etag and last_modified
+                received and digest a dictionary with the md5 and sha256 of
+                the extension downloaded.
+        """
+        with self._lock:
+            row = self._getConnection().execute(
+                "SELECT etag, last_modified, md5, sha256 FROM uris WHERE uri = ?", (uri,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1]}, {"md5": row[2], "sha256": row[3]}
+
+    def putValidators(self, uri, validators, digest):
+        """
+        Stores the validators of the version downloaded from a URI
+
+        If the server did not send any, the URI is forgotten since it cannot
+        be requested conditionally.
+
+        Args:
+        -----
+            uri: the URI of the extension.
+            validators: a dictionary with the etag and last_modified received.
+            digest: a dictionary with the md5 and sha256 of the extension.
+        """
+        with self._lock:
+            connection = self._getConnection()
+            with connection:
+                if validators.get("etag") or validators.get("last_modified"):
+                    connection.execute(
+                        "INSERT OR REPLACE INTO uris VALUES (?, ?, ?, ?, ?)",
+                        (uri, validators.get("etag"), validators.get("last_modified"), digest["md5"], digest["sha256"])
+                    )
+                else:
+                    connection.execute("DELETE FROM uris WHERE uri = ?", (uri,))
+
+    def iterSummaries(self, batchSize=1000):
+        """
+        Iterates over the summary of the analysis stored in batches
+
+        Args:
+        -----
+            batchSize: the number of analysis returned in each batch.
+
+        Returns:
+        --------
+            A generator of lists of dictionaries with the keys found in SUMMARY
+                sorted by the name of the file.
+        """
+        lastId = 0
+        while True:
+            with self._lock:
+                rows = self._getConnection().execute(
+                    "SELECT id, {} FROM analysis WHERE id > ? ORDER BY id LIMIT ?".format(", ".join(SUMMARY)), (lastId, batchSize)
+                ).fetchall()
+            if not rows:
+                return
+            lastId = rows[-1][0]
+            yield [dict(zip(SUMMARY, row[1:])) for row in rows]
+
+    def list(self, **filters):
+        """
+        Returns the summary of the analysis stored
+
+        Args:
+        -----
+            filters: summary columns and the values they must be equal to.
+
+        Returns:
+        --------
+            A list of dictionaries with the keys found in SUMMARY sorted by the
+                name of the file.
+        """
+        query = "SELECT {} FROM analysis".format(", ".join(SUMMARY))
+        for column in filters:
+            if column not in SUMMARY:
+                raise ValueError("Unknown column '{}'.".format(column))
+        if filters:
+            query += " WHERE " + " AND ".join("{} = ?".format(c) for c in filters)
+        query += " ORDER BY filename, md5"
+
+        with self._lock:
+            rows = self._getConnection().execute(query, list(filters.values())).fetchall()
+        return [dict(zip(SUMMARY, row)) for row in rows]
+
+    def iterTexts(self, md5s=None):
+        """
+        Iterates over the JSON representations of the analysis
+
+        Args:
+        -----
+            md5s: a list of MD5 of the extensions to be recovered. If None, all
+                of them are returned.
+
+        Returns:
+        --------
+            A generator of tuples (md5, text).
+        """
+        with self._lock:
+            if md5s is None:
+                rows = self._getConnection().execute("SELECT md5 FROM analysis ORDER BY filename, md5").fetchall()
+                md5s = [r[0] for r in rows]
+        for md5 in md5s:
+            text = self.getText(md5)
+            if text is not None:
+                yield md5, text
+
+    def delete(self, md5):
+        """
+        Removes the analysis of an extension
+
+        Args:
+        -----
+            md5: the MD5 of the extension.
+
+        Returns:
+        --------
+            True if the analysis was found.
+        """
+        with self._lock:
+            connection = self._getConnection()
+            with connection:
+                connection.execute("DELETE FROM tokens WHERE id IN (SELECT id FROM analysis WHERE md5 = ?)", (md5,))
+                cursor = connection.execute("DELETE FROM analysis WHERE md5 = ?", (md5,))
+        return cursor.rowcount > 0
+
+    def search(self, query):
+        """
+        Finds the extensions containing all the tokens of a query
+
+        The query can be scoped to a field using "field:text", where field is
+        one of FIELDS or an entity such as url or email. A trailing "*" looks
+        for the tokens starting with the last word.
+
+            search("coinhive")
+            search("permissions:tabs")
+            search("domain:example.com")
+            search("comments:minify*")
+
+        Args:
+        -----
+            query: the text to be found.
+
+        Returns:
+        --------
+            A set with the MD5 of the extensions found or None if the query
+                does not contain any token, so it cannot be answered using the
+                index.
+        """
+        field = None
+        match = re.match(r"([a-z_0-9]+):(?!//)", query.lower())
+        if match:
+            # URLs such as http://… are not scoped
+            field, query = match.group(1), query[match.end():]
+
+        prefix = None
+        if query.rstrip().endswith("*"):
+            # The last word is looked for as a prefix
+            words = TOKEN.findall(query.lower())
+            if words:
+                prefix = words[-1]
+                query = " ".join(words[:-1])
+
+        # Compound words are indexed as a whole, so their parts are not needed
+        conditions = [("token = ?", [w]) for w in sorted(set(TOKEN.findall(query.lower()))) if len(w) > 1]
+        if prefix:
+            conditions.append(("token >= ? AND token < ?", [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]))
+        if not conditions:
+            return None
+
+        subqueries = []
+        params = []
+        for condition, values in conditions:
+            if field:
+                condition += " AND field = ?"
+                values = values + [field]
+            subqueries.append("SELECT id FROM tokens WHERE " + condition)
+            params += values
+
+        with self._lock:
+            rows = self._getConnection().execute(
+                "SELECT md5 FROM analysis WHERE id IN ({})".format(" INTERSECT ".join(subqueries)), params
+            ).fetchall()
+        return set(r[0] for r in rows)
+
+    def claimFolderImport(self):
+        """
+        Claims the import of the JSON files of the folder of the store
+
+        The claim is recorded in the database in a transaction that locks it
+        for writing, so only one of the processes sharing the store gets it.
+
+        Returns:
+        --------
+            True if the import had not been claimed before by any process.
+        """
+        with self._lock:
+            connection = self._getConnection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                claimed = connection.execute("SELECT value FROM meta WHERE key = 'folder_imported'").fetchone() is None
+                if claimed:
+                    connection.execute("INSERT INTO meta VALUES ('folder_imported', ?)", (str(dt.datetime.utcnow()),))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def importFolder(self, analysisFolder):
+        """
+        Imports the JSON files of an analysis folder
+
+        Args:
+        -----
+            analysisFolder: the folder where the JSON files generated by neto
+                are stored.
+
+        Returns:
+        --------
+            A tuple (imported, failed) with the number of files imported and
+                the list of the paths of the files that could not be imported.
+        """
+        imported = 0
+        failed = []
+        rows = []
+        for f in sorted(os.listdir(analysisFolder)):
+            filePath = os.path.join(analysisFolder, f)
+            if not f.endswith(".json") or not os.path.isfile(filePath):
+                continue
+            try:
+                with open(filePath) as iF:
+                    rows.append(self._getRow(iF.read(), os.path.abspath(filePath)))
+            except (OSError, ValueError):
+                failed.append(filePath)
+
+            # Inserting in batches is much faster than a transaction per file
+            if len(rows) >= 1000:
+                self._putRows(rows)
+                imported += len(rows)
+                rows = []
+
+        if rows:
+            self._putRows(rows)
+            imported += len(rows)
+        return imported, failed
+
+
+# The stores opened by this process, by path
+_stores = {}
+_storesLock = threading.Lock()
+
+
+def getStore(analysisFolder=None):
+    """
+    Returns the store of an analysis folder, opening it on first use
+
+    Args:
+    -----
+        analysisFolder: the folder where the JSON files generated by neto are
+            stored. The database is created inside it.
+
+    Returns:
+    --------
+        An AnalysisStore.
+    """
+    if not analysisFolder:
+        analysisFolder = utils.getConfigPath()["appPathDataAnalysis"]
+    dbPath = os.path.abspath(os.path.join(analysisFolder, STORE_NAME))
+
+    with _storesLock:
+        if dbPath not in _stores:
+            if not os.path.isdir(analysisFolder):
+                os.makedirs(analysisFolder)
+            _stores[dbPath] = AnalysisStore(dbPath)
+        return _stores[dbPath]
+
+
+def migrateFolder(analysisFolder=None):
+    """
+    Imports the JSON files of an analysis folder into its store only once
+
+    The analysis written by previous versions of Neto are only found as JSON
+    files, so they are imported the first time the store of the folder is
+    used. It is meant to be called by the process starting the work (e.g. the
+    analyser before creating its pool of processes or the daemon before
+    serving any request) and not by its workers. The first process to claim
+    the import does it, even if it is interrupted; the rest of them do not
+    wait for it. Use `neto analyser --import_analysis` to import it again.
+
+    Args:
+    -----
+        analysisFolder: the folder where the JSON files generated by neto are
+            stored.
+
+    Returns:
+    --------
+        A tuple (imported, failed) as returned by AnalysisStore.importFolder
+            or None if the folder had already been claimed.
+    """
+    store = getStore(analysisFolder)
+    if not store.claimFolderImport():
+        return None
+    folder = os.path.dirname(store.dbPath)
+    if not any(f.endswith(".json") for f in os.listdir(folder)):
+        return 0, []
+    print("[*] Importing the analysis found at '{}' into its store…".format(folder))
+    imported, failed = store.importFolder(folder)
+    print("[*] {} analysis imported. {} files could not be imported.".format(imported, len(failed)))
+    return imported, failed
+
+
+# The lists of extensions recovered by this process and the signature of the
+# store when they were read, by path
+_lists = {}
+
+
+def getExtensionList(analysisFolder=None, callback=None):
     """
     Method that gets the list of working analysis
 
     This file is a summary of the contents stored in the analysis folder. This
-    method is conceived to collect the currently available analysis.
+    method is conceived to collect the currently available analysis from the
+    store of the folder. The JSON files found in the folder are imported the
+    first time (see migrateFolder) and `neto analyser --import_analysis`
+    imports the ones of other folders.
+
+    The list is kept in memory and only read again when the files of the store
+    have been modified.
 
     Args:
     -----
         analysisFolder: the folder where the JSON files generated by neto are
             stored.
+        callback: a function called as callback(loaded, total) each time a
+            batch of extensions is read from the store.
 
     Returns:
     --------
@@ -45,30 +799,31 @@ def getExtensionList(analysisFolder=None):
             {
                 "name": "sample.xpi",
                 "analysis_path": "/…/0a0b0c….json",
-                "sha256": "/…/sample.xpi",
+                "sha256": "…",
+                "md5": "0a0b0c…",
             }
         ]
     """
-    if not analysisFolder:
-        analysisFolder = utils.getConfigPath()["appPathDataAnalysis"]
+    store = getStore(analysisFolder)
+    # Opening the database for the first time may modify its files
+    total = len(store)
+    signature = store.getSignature()
+    if store.dbPath in _lists and _lists[store.dbPath][0] == signature:
+        return list(_lists[store.dbPath][1])
 
     extensions = []
-    # List files inside the folder
-    filenames = [f for f in os.listdir(analysisFolder) if os.path.isfile(os.path.join(analysisFolder, f))]
+    for batch in store.iterSummaries():
+        for summary in batch:
+            aux = {
+                "name": summary["filename"],
+                "analysis_path": summary["analysis_path"],
+                "sha256": summary["sha256"],
+                "md5": summary["md5"],
+            }
+            extensions.append(aux)
+        if callback:
+            callback(len(extensions), total)
 
-    for f in os.listdir(analysisFolder):
-        filePath =  os.path.join(analysisFolder, f)
-        if os.path.isfile(filePath):
-            try:
-                with open(filePath) as iF:
-                    data = json.loads(iF.read())
-
-                aux = {
-                    "name": data["_filename"],
-                    "analysis_path": filePath,
-                    "sha256": filePath,
-                }
-                extensions.append(aux)
-            except:
-                pass
-    return extensions
+    extensions.sort(key=lambda e: (e["name"] or "", e["md5"]))
+    _lists[store.dbPath] = (signature, extensions)
+    return list(extensions)
@@ -278,3 +278,43 @@ def getConfigurationFor(util):
             break
 
     return VALUES
+
+
+def isProcessRunning(pid):
+    """
+    Auxiliar function that checks if a process is still running
+
+    Args:
+    -----
+        pid: the PID of the process.
+
+    Returns:
+    --------
+        A boolean. If it cannot be known, the process is assumed to be running.
+    """
+    if sys.platform == 'win32':
+        # os.kill would terminate the process on Windows
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            # Access denied means that it exists but belongs to another user
+            return ctypes.GetLastError() == 5
+        try:
+            exitCode = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exitCode)):
+                return True
+            return exitCode.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It exists but belongs to another user
+        return True
+    return True
@@ -23,6 +23,7 @@
 import os
 import timeout_decorator
 
+import neto.lib.archives as archives
 import neto.lib.crypto.pkcs7 as pkcs7
 import neto.plugins.analysis.entities as entities
 
@@ -48,6 +49,9 @@ def runAnalysis(**kwargs):
                     "manifest.json": "/tmp/extension/manifest.json"
                     …
                 }
+            - archive: A neto.lib.archives object to read the contents of the
+                files without needing their real path. Plugins should get it
+                using neto.lib.archives.getArchiveFromKwargs(kwargs).
     Returns:
     --------
         A dictionary where the key is the name given to the analysis and the
@@ -56,17 +60,19 @@ def runAnalysis(**kwargs):
     """
     results = {}
 
+    archive = archives.getArchiveFromKwargs(kwargs)
+
     # Iterate through all the files in the folder
-    for f, realPath in kwargs["unzippedFiles"].items():
-        if os.path.isfile(realPath):
-            fileType = f.split(".")[-1].lower()
+    for f in archive.namelist():
+        fileType = f.split(".")[-1].lower()
 
-            # Extract matching strings from text files
-            if fileType in ["rsa"]:
-                # Extract data from certificate
-                results["raw_data"] = pkcs7.getCertificateData(realPath)
+        # Extract matching strings from text files
+        if fileType in ["rsa"]:
+            # Extract data from certificate
+            results["raw_data"] = pkcs7.getCertificateData(archive.read(f))
 
-                # Extract entities if any
-                results["entities"] = entities.runAnalysis(unzippedFiles={f: realPath})
+            # Extract entities if any
+            subset = archives.SubsetArchive(archive, [f])
+            results["entities"] = entities.runAnalysis(unzippedFiles=archives.LazyPaths(subset), archive=subset)
 
     return {"certificate_info": results}
@@ -24,6 +24,9 @@ import os
 import re
 import timeout_decorator
 
+import neto.lib.archives as archives
+import neto.lib.libraries as libraries
+
 
 #@timeout_decorator.timeout(30, timeout_exception=StopIteration)
 def runAnalysis(**kwargs):
@@ -46,6 +49,12 @@ def runAnalysis(**kwargs):
                     "manifest.json": "/tmp/extension/manifest.json"
                     …
                 }
+            - archive: A neto.lib.archives object to read the contents of the
+                files without needing their real path. Plugins should get it
+                using neto.lib.archives.getArchiveFromKwargs(kwargs).
+            - knownLibraries: A dictionary where the key is the relative path
+                of the files recognised as well-known libraries and the value
+                the library as "name@version". Plugins may skip them.
     Returns:
     --------
         A dictionary where the key is the name given to the analysis and the
@@ -54,51 +63,52 @@ def runAnalysis(**kwargs):
     """
     results = []
 
-    # Iterate through all the files in the folder
-    for f, realPath in kwargs["unzippedFiles"].items():
-        if os.path.isfile(realPath):
-            fileType = f.split(".")[-1].lower()
-
-            # Extract entities from html files
-            if fileType in ["html", "htm"]:
-                # Read the data
-                raw_data = open(realPath, "rb").read()
-
-                values = re.findall(b"<!-- *(.+?) *-->", raw_data, re.DOTALL)
-
-                for v in values:
-                    try:
-                        # TODO: properly handle:
-                        #   UnicodeDecodeError: 'utf-8' codec can't decode byte 0xe9 in position 29: unexpected end of data
-                        aux = {
-                            "value": v.decode("utf-8"),
-                            "path": f
-                        }
-                    except:
-                        aux = {
-                            "value": v,
-                            "path": f
-                        }
-                    results.append(aux)
+    archive = archives.getArchiveFromKwargs(kwargs)
 
-            # Extract entities from JS and CSS
-            elif fileType in ["js", "css"]:
-                # Read the data
-                raw_data = open(realPath, "rb").read()
+    # Iterate through all the files in the folder skipping the known libraries
+    for f in libraries.excludeKnownLibraries(archive.namelist(), kwargs):
+        fileType = f.split(".")[-1].lower()
 
-                values = re.findall(b"\/\* *([^\"\']+?) *\*\/", raw_data, re.DOTALL)
-                values += re.findall(b"(^|[ \t]*)\/\/ *([^\r\n]+?)[\r\n]", raw_data)
+        # Extract entities from html files
+        if fileType in ["html", "htm"]:
+            # Read the data
+            raw_data = archive.read(f)
 
-                for v in values:
+            values = re.findall(b"<!-- *(.+?) *-->", raw_data, re.DOTALL)
+
+            for v in values:
+                try:
                     # TODO: properly handle:
                     #   UnicodeDecodeError: 'utf-8' codec can't decode byte 0xe9 in position 29: unexpected end of data
-                    try:
-                        aux = {
-                            "value": v.decode("utf-8"),
-                            "path": f
-                        }
-                        results.append(aux)
-                    except:
-                        pass
+                    aux = {
+                        "value": v.decode("utf-8"),
+                        "path": f
+                    }
+                except:
+                    aux = {
+                        "value": v,
+                        "path": f
+                    }
+                results.append(aux)
+
+        # Extract entities from JS and CSS
+        elif fileType in ["js", "css"]:
+            # Read the data
+            raw_data = archive.read(f)
+
+            values = re.findall(b"\/\* *([^\"\']+?) *\*\/", raw_data, re.DOTALL)
+            values += re.findall(b"(^|[ \t]*)\/\/ *([^\r\n]+?)[\r\n]", raw_data)
+
+            for v in values:
+                # TODO: properly handle:
+                #   UnicodeDecodeError: 'utf-8' codec can't decode byte 0xe9 in position 29: unexpected end of data
+                try:
+                    aux = {
+                        "value": v.decode("utf-8"),
+                        "path": f
+                    }
+                    results.append(aux)
+                except:
+                    pass
 
     return {"comments": results}
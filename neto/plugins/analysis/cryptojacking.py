@@ -20,10 +20,13 @@
 ################################################################################
 
 
-import os
-import re
 import timeout_decorator
 
+import neto.lib.archives as archives
+import neto.lib.filecache as filecache
+import neto.lib.libraries as libraries
+import neto.lib.scanner as scanner
+
 
 REGEXPS = {
     "known_mining_domains": [
@@ -149,6 +152,9 @@ REGEXPS = {
     ]
 }
 
+# Combined scanner for all the expressions, compiled once at import
+SCANNER = scanner.RuleScanner(scanner.flattenRules(REGEXPS))
+
 #@timeout_decorator.timeout(30, timeout_exception=StopIteration)
 def runAnalysis(**kwargs):
     """
@@ -170,6 +176,12 @@ def runAnalysis(**kwargs):
                     "manifest.json": "/tmp/extension/manifest.json"
                     …
                 }
+            - archive: A neto.lib.archives object to read the contents of the
+                files without needing their real path. Plugins should get it
+                using neto.lib.archives.getArchiveFromKwargs(kwargs).
+            - knownLibraries: A dictionary where the key is the relative path
+                of the files recognised as well-known libraries and the value
+                the library as "name@version". Plugins may skip them.
     Returns:
     --------
         A dictionary where the key is the name given to the analysis and the
@@ -178,39 +190,44 @@ def runAnalysis(**kwargs):
     """
     results = {}
 
+    archive = archives.getArchiveFromKwargs(kwargs)
+
+    # Scan each text file once looking for all the expressions, reusing the
+    # results of identical files found in other extensions. Well-known
+    # libraries are not scanned.
+    textFiles = [f for f in archive.namelist() if f.split(".")[-1].lower() in ["js", "html", "htm", "css", "txt"]]
+    textFiles = libraries.excludeKnownLibraries(textFiles, kwargs)
+    matches = filecache.scanFiles(SCANNER, archive, textFiles, "cryptojacking")
+
     # Iterate through all the regexps
     for e, valuesRe in REGEXPS.items():
         foundExpresions = []
         
         # Iterate through all the files in the folder
-        for f, realPath in kwargs["unzippedFiles"].items():
-            if os.path.isfile(realPath):
-                fileType = f.split(".")[-1].lower()
+        for f in archive.namelist():
+            fileType = f.split(".")[-1].lower()
                 
-                allTypes = {}
+            allTypes = {}
                 
-                # Extract matching strings from text files
-                if fileType in ["js", "html", "htm", "css", "txt"]:
-                    # Read the data
-                    raw_data = open(realPath, "rb").read()
-                    
-                    for exp in valuesRe:
-                        values = re.findall(exp, raw_data)
-                        for v in values:
-                            # TODO: properly handle:
-                            #   UnicodeDecodeError: 'utf-8' codec can't decode byte 0xe9 in position 29: unexpected end of data
-                            try:
-                                aux = {
-                                    "value": v.decode("utf-8"),
-                                    "path": f,
-                                    "regexp": exp.decode("utf-8")
-                                }
-                                foundExpresions.append(aux)
-                            except:
-                                pass
+            # Extract matching strings from text files
+            if fileType in ["js", "html", "htm", "css", "txt"] and f in matches:
+                for exp in valuesRe:
+                    values = matches[f][exp]
+                    for v in values:
+                        # TODO: properly handle:
+                        #   UnicodeDecodeError: 'utf-8' codec can't decode byte 0xe9 in position 29: unexpected end of data
+                        try:
+                            aux = {
+                                "value": v.decode("utf-8"),
+                                "path": f,
+                                "regexp": exp.decode("utf-8")
+                            }
+                            foundExpresions.append(aux)
+                        except:
+                            pass
 
-                    if len(foundExpresions) > 0:
-                        allTypes[e] = foundExpresions
+                if len(foundExpresions) > 0:
+                    allTypes[e] = foundExpresions
 
             if len(allTypes.keys()) > 0:
                 results[f] = allTypes
@@ -24,6 +24,8 @@ import os
 import json
 import timeout_decorator
 
+import neto.lib.archives as archives
+
 #@timeout_decorator.timeout(30, timeout_exception=StopIteration)
 def runAnalysis(**kwargs):
     """
@@ -45,6 +47,9 @@ def runAnalysis(**kwargs):
                     "manifest.json": "/tmp/extension/manifest.json"
                     …
                 }
+            - archive: A neto.lib.archives object to read the contents of the
+                files without needing their real path. Plugins should get it
+                using neto.lib.archives.getArchiveFromKwargs(kwargs).
     Returns:
     --------
         A dictionary where the key is the name given to the analysis and the
@@ -53,28 +58,28 @@ def runAnalysis(**kwargs):
     """
     results = {}
 
+    archive = archives.getArchiveFromKwargs(kwargs)
+
     # Iterate through all the files in the folder
-    for f, realPath in kwargs["unzippedFiles"].items():
-        if os.path.isfile(realPath):
-            # Extract localization
-            if f.split(os.sep)[0] == "_locales":
-                with open(realPath) as iF:
-                    lang = f.split(os.sep)[1].lower()
-                    aux = {
-                        lang: {}
+    for f in archive.namelist():
+        # Extract localization
+        if f.split(os.sep)[0] == "_locales":
+            lang = f.split(os.sep)[1].lower()
+            aux = {
+                lang: {}
+            }
+            try:
+                text = archive.read(f).decode("utf-8")
+                jText = json.loads(text)
+                # Minor refactor of the strings to put the message in each language as the key
+                for k, translated in jText.items():
+                    aux[lang][translated["message"]] = {
+                        "description": translated["description"],
+                        "placemark": k
                     }
-                    try:
-                        text = iF.read()
-                        jText = json.loads(text)
-                        # Minor refactor of the strings to put the message in each language as the key
-                        for k, translated in jText.items():
-                            aux[lang][translated["message"]] = {
-                                "description": translated["description"],
-                                "placemark": k
-                            }
-                    except:
-                        # If other format was found or the JSON crashes, just keep the lang
-                        pass
-                    results.update(aux)
+            except:
+                # If other format was found or the JSON crashes, just keep the lang
+                pass
+            results.update(aux)
 
     return {"locales": results}
@@ -23,6 +23,8 @@
 import os
 import timeout_decorator
 
+import neto.lib.archives as archives
+
 
 #@timeout_decorator.timeout(30, timeout_exception=StopIteration)
 def runAnalysis(**kwargs):
@@ -45,6 +47,9 @@ def runAnalysis(**kwargs):
                     "manifest.json": "/tmp/extension/manifest.json"
                     …
                 }
+            - archive: A neto.lib.archives object to read the contents of the
+                files without needing their real path. Plugins should get it
+                using neto.lib.archives.getArchiveFromKwargs(kwargs).
     Returns:
     --------
         A dictionary where the key is the name given to the analysis and the
@@ -53,14 +58,15 @@ def runAnalysis(**kwargs):
     """
     results = {}
 
+    archive = archives.getArchiveFromKwargs(kwargs)
+
     # Iterate through all the files in the folder
-    for f, realPath in kwargs["unzippedFiles"].items():
-        if os.path.isfile(realPath):
-            fileType = f.split(".")[-1].lower()
+    for f in archive.namelist():
+        fileType = f.split(".")[-1].lower()
 
-            # Extract matching strings from text files
-            if fileType in ["png", "jpg", "jpeg", "ico", "bmp", "svg", "mp3"]:
-                #TODO: Extract metadata
-                results[f] = {}
+        # Extract matching strings from text files
+        if fileType in ["png", "jpg", "jpeg", "ico", "bmp", "svg", "mp3"]:
+            #TODO: Extract metadata
+            results[f] = {}
 
     return {"metadata": results}
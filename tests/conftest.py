@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import http.server
+import re
+import socket
+import threading
+import time
+
+import pytest
+
+import neto.downloaders.http as downloader
+import neto.downloaders.ratelimit as ratelimit
+
+
+class StubState:
+    """
+    The resources served by the stub servers and what they have received
+
+    Each resource is a dictionary with:
+        body: the bytes served.
+        etag: the strong ETag sent, if any.
+        delay: the seconds waited before answering.
+        drops: the number of answers cut after a third of the body.
+        headers: other headers sent with the body.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resources = {}
+        self.requests = []
+        self.finished = []
+        self.active = {}
+        self.maxActive = {}
+        self.activeTotal = 0
+        self.maxActiveTotal = 0
+
+    def add(self, path, body, etag=None, delay=0, drops=0, headers=None):
+        self.resources[path] = {"body": body, "etag": etag, "delay": delay, "drops": drops, "headers": headers or {}}
+
+    def getStatuses(self, path):
+        with self.lock:
+            return [status for p, _, status in self.requests if p == path]
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the resources of a StubState supporting conditional and range requests
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        state = self.server.state
+        host = self.headers.get("Host")
+        with state.lock:
+            state.active[host] = state.active.get(host, 0) + 1
+            state.maxActive[host] = max(state.maxActive.get(host, 0), state.active[host])
+            state.activeTotal += 1
+            state.maxActiveTotal = max(state.maxActiveTotal, state.activeTotal)
+        try:
+            self.answer(state)
+        finally:
+            with state.lock:
+                state.active[host] -= 1
+                state.activeTotal -= 1
+                state.finished.append(self.path)
+
+    def answer(self, state):
+        resource = state.resources.get(self.path)
+        if resource is None:
+            return self.sendStatus(state, 404)
+
+        time.sleep(resource["delay"])
+        body = resource["body"]
+        etag = resource["etag"]
+
+        if etag and self.headers.get("If-None-Match") == etag:
+            return self.sendStatus(state, 304, {"ETag": etag})
+        # If-None-Match takes precedence over If-Modified-Since
+        lastModified = resource["headers"].get("Last-Modified")
+        if lastModified and "If-None-Match" not in self.headers and self.headers.get("If-Modified-Since") == lastModified:
+            return self.sendStatus(state, 304, {"Last-Modified": lastModified})
+
+        start = 0
+        rangeHeader = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        if rangeHeader and etag and self.headers.get("If-Range") == etag:
+            start = int(rangeHeader.group(1))
+            if start >= len(body):
+                return self.sendStatus(state, 416, {"Content-Range": "bytes */{}".format(len(body))})
+
+        status = 206 if start else 200
+        with state.lock:
+            state.requests.append((self.path, dict(self.headers), status))
+            drop = resource["drops"] > 0
+            if drop:
+                resource["drops"] -= 1
+
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        if start:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(body) - 1, len(body)))
+        self.send_header("Content-Length", str(len(body) - start))
+        for key, value in resource["headers"].items():
+            self.send_header(key, value)
+        self.end_headers()
+        if drop:
+            self.wfile.write(body[start:start + (len(body) - start) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+        else:
+            self.wfile.write(body[start:])
+
+    def sendStatus(self, state, status, headers=None):
+        with state.lock:
+            state.requests.append((self.path, dict(self.headers), status))
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, state):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.state = state
+
+    def getURI(self, path):
+        return "http://127.0.0.1:{}{}".format(self.server_address[1], path)
+
+
+@pytest.fixture
+def stubState():
+    return StubState()
+
+
+@pytest.fixture
+def startStubServer(stubState):
+    """
+    Returns a function that starts a new stub server. Each of them is seen as a
+    different host but all of them share the same state.
+    """
+    servers = []
+
+    def start():
+        server = StubServer(stubState)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def downloaderSettings(monkeypatch):
+    """
+    Uses a fresh session and rate controllers fast enough for the tests
+    """
+    settings = dict(
+        downloader.getDownloaderConfiguration(),
+        retries=2,
+        retry_backoff=0.01,
+        connect_timeout=5,
+        read_timeout=5,
+        initial_rate=1000.0,
+        max_rate=1000.0,
+    )
+    monkeypatch.setattr(downloader, "getDownloaderConfiguration", lambda: settings)
+    monkeypatch.setattr(downloader, "_session", None)
+    monkeypatch.setattr(ratelimit, "_controllers", {})
+    return settings
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import types
+import zipfile
+
+import pytest
+
+import neto
+import neto.analyser as analyser
+import neto.lib.crypto.multiple_hashes as hasher
+import neto.lib.registry as registry
+import neto.lib.storage as storage
+from neto.lib.extensions import Extension
+from neto.downloaders.bulk import BulkDownloader
+
+
+def getExtension(name="sample.xpi"):
+    return types.SimpleNamespace(
+        _filename=name,
+        filename=name,
+        _digest={"md5": "0" * 32, "sha256": "1" * 64},
+        digest={"md5": "0" * 32, "sha256": "1" * 64},
+    )
+
+
+def test_analysis_is_written_to_the_store_and_the_folder(tmp_path):
+    outputFile = analyser.writeAnalysis(getExtension(), str(tmp_path))
+
+    assert json.loads(open(outputFile).read())["_filename"] == "sample.xpi"
+    assert json.loads(storage.getStore(str(tmp_path)).getText("0" * 32))["_filename"] == "sample.xpi"
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".json")) == ["0" * 32 + ".json"]
+
+
+def test_nothing_is_written_if_the_store_fails(tmp_path, monkeypatch):
+    def fail(*args):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(storage.getStore(str(tmp_path)), "put", fail)
+
+    with pytest.raises(sqlite3.Error):
+        analyser.writeAnalysis(getExtension(), str(tmp_path))
+    assert not [f for f in os.listdir(tmp_path) if f.endswith((".json", ".tmp"))]
+
+
+def test_analysis_is_stored_even_if_the_file_cannot_be_written(tmp_path, capsys):
+    # A folder in the place of the file makes the replace fail
+    os.mkdir(tmp_path / ("0" * 32 + ".json"))
+
+    analyser.writeAnalysis(getExtension(), str(tmp_path))
+
+    assert "could not be written" in capsys.readouterr().out
+    assert storage.getStore(str(tmp_path)).getText("0" * 32) is not None
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+
+
+def getExtensionData(source="console.log('sample');"):
+    """
+    Returns the contents of a small extension
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zF:
+        zF.writestr("manifest.json", json.dumps({"name": "sample", "version": "1.0"}))
+        zF.writestr("main.js", source)
+    return buffer.getvalue()
+
+
+def getAnalysedExtension(tmp_path):
+    """
+    Analyses a small extension
+
+    Returns:
+    --------
+        A tuple (extensionFile, analysisPath, digest).
+    """
+    extensionFile = str(tmp_path / "sample.xpi")
+    with open(extensionFile, "wb") as oF:
+        oF.write(getExtensionData())
+    analysisPath = str(tmp_path / "analysis")
+    os.mkdir(analysisPath)
+    analyser.analyseExtensionFromFile(extensionFile, quiet=True, analysisPath=analysisPath, tmpPath=str(tmp_path))
+    return extensionFile, analysisPath, hasher.calculateHashFromFile(extensionFile)
+
+
+def getDocument(analysisPath, digest):
+    return json.loads(storage.getStore(analysisPath).getText(digest["md5"]))
+
+
+def putDocument(analysisPath, document):
+    text = json.dumps(document)
+    storage.getStore(analysisPath).put(text)
+    with open(os.path.join(analysisPath, document["_digest"]["md5"] + ".json"), "w") as oF:
+        oF.write(text)
+
+
+def test_legacy_analysis_are_rehashed_when_updated(tmp_path):
+    extensionFile, analysisPath, digest = getAnalysedExtension(tmp_path)
+    # Previous versions stored the SHA1 as sha256
+    legacy = getDocument(analysisPath, digest)
+    legacy["_digest"]["sha256"] = digest["sha1"]
+    for path in legacy["_files"]:
+        legacy["_files"][path]["sha256"] = legacy["_files"][path]["sha1"]
+    putDocument(analysisPath, legacy)
+
+    assert storage.getStore(analysisPath).list()[0]["sha256"] is None
+    assert analyser.getPreviousAnalysis(digest, analysisPath) is None
+
+    ext = analyser.analyseExtensionFromFile(extensionFile, quiet=True, analysisPath=analysisPath, tmpPath=str(tmp_path), reanalyseStale=True)
+
+    assert ext.digest["sha256"] == digest["sha256"]
+    assert ext.files["main.js"]["sha256"] == hashlib.sha256(b"console.log('sample');").hexdigest()
+    assert legacy["_files"]["main.js"]["sha256"] != ext.files["main.js"]["sha256"]
+    assert storage.getStore(analysisPath).list()[0]["sha256"] == digest["sha256"]
+    assert analyser.getPreviousAnalysis(digest, analysisPath) is not None
+
+
+@pytest.fixture
+def analysisLists(monkeypatch):
+    """
+    Records the modules of the plugins run by each analysis
+    """
+    runs = []
+    analyse = Extension.analyse
+
+    def record(*args, analysisList=None, **kwargs):
+        methods = registry.getRegistry().getAnalysisMethods() if analysisList is None else analysisList
+        runs.append(sorted(m.__module__ for m in methods))
+        return analyse(*args, analysisList=analysisList, **kwargs)
+    monkeypatch.setattr(Extension, "analyse", record)
+    return runs
+
+
+def test_only_the_stale_plugins_are_run_again(tmp_path, analysisLists):
+    extensionFile, analysisPath, digest = getAnalysedExtension(tmp_path)
+    document = getDocument(analysisPath, digest)
+    document["_plugins_fingerprint"] = "previous"
+    document["_plugins"]["neto.plugins.analysis.comments"]["version"] = "previous"
+    document["_features"]["comments"] = "previous"
+    document["_features"]["metadata"] = "kept"
+    document["_plugins"]["neto.plugins.analysis.removed"] = {"version": "previous", "features": ["removed"]}
+    document["_features"]["removed"] = "previous"
+    putDocument(analysisPath, document)
+
+    ext = analyser.analyseExtensionFromFile(extensionFile, quiet=True, analysisPath=analysisPath, tmpPath=str(tmp_path), reanalyseStale=True)
+
+    assert analysisLists[1:] == [["neto.plugins.analysis.comments"]]
+    assert isinstance(ext.features["comments"], list)
+    assert ext.features["metadata"] == "kept"
+    assert "removed" not in ext.features
+    assert "neto.plugins.analysis.removed" not in ext.plugins
+    assert analyser.isUpToDate(ext)
+    assert getDocument(analysisPath, digest)["_features"]["metadata"] == "kept"
+
+
+def test_up_to_date_analysis_are_not_updated(tmp_path, analysisLists):
+    extensionFile, analysisPath, digest = getAnalysedExtension(tmp_path)
+    hits = analyser.CACHE_STATS["hits"]
+
+    analyser.analyseExtensionFromFile(extensionFile, quiet=True, analysisPath=analysisPath, tmpPath=str(tmp_path), reanalyseStale=True)
+
+    # Only the first analysis ran the plugins
+    assert len(analysisLists) == 1
+    assert analyser.CACHE_STATS["hits"] == hits + 1
+
+
+def test_analysis_without_versions_run_all_the_plugins(tmp_path, analysisLists):
+    extensionFile, analysisPath, digest = getAnalysedExtension(tmp_path)
+    document = getDocument(analysisPath, digest)
+    # Analysis performed before the versions were recorded
+    del document["_plugins"]
+    document["_plugins_fingerprint"] = "previous"
+    putDocument(analysisPath, document)
+
+    analyser.analyseExtensionFromFile(extensionFile, quiet=True, analysisPath=analysisPath, tmpPath=str(tmp_path), reanalyseStale=True)
+
+    assert len(analysisLists) == 2
+    assert analysisLists[1] == analysisLists[0]
+
+
+@pytest.fixture
+def folders(tmp_path):
+    """
+    Returns the kwargs of analyseExtensionFromURI using temporary folders
+    """
+    options = {"quiet": True, "tmpPath": str(tmp_path)}
+    for name in ["analysisPath", "downloadPath"]:
+        options[name] = str(tmp_path / name)
+        os.mkdir(options[name])
+    return options
+
+
+def getConditionalHeaders(stubState, path):
+    return [
+        {k: v for k, v in headers.items() if k in ["If-None-Match", "If-Modified-Since"]}
+        for p, headers, _ in stubState.requests if p == path
+    ]
+
+
+def test_unchanged_uris_are_not_downloaded_again(startStubServer, stubState, folders):
+    uri = startStubServer().getURI("/sample.xpi")
+    stubState.add("/sample.xpi", getExtensionData(), etag='"1"')
+    first = analyser.analyseExtensionFromURI(uri, **folders)
+    hits = analyser.CACHE_STATS["hits"]
+
+    second = analyser.analyseExtensionFromURI(uri, **folders)
+
+    assert stubState.getStatuses("/sample.xpi") == [200, 304]
+    assert getConditionalHeaders(stubState, "/sample.xpi")[1] == {"If-None-Match": '"1"'}
+    assert second.digest == first.digest
+    assert analyser.CACHE_STATS["hits"] == hits + 1
+
+
+def test_last_modified_is_used_without_etag(startStubServer, stubState, folders):
+    uri = startStubServer().getURI("/sample.xpi")
+    lastModified = "Wed, 21 Oct 2015 07:28:00 GMT"
+    stubState.add("/sample.xpi", getExtensionData(), headers={"Last-Modified": lastModified})
+
+    for _ in range(2):
+        analyser.analyseExtensionFromURI(uri, **folders)
+
+    assert stubState.getStatuses("/sample.xpi") == [200, 304]
+    assert getConditionalHeaders(stubState, "/sample.xpi")[1] == {"If-Modified-Since": lastModified}
+
+
+def test_changed_uris_are_analysed_again(startStubServer, stubState, folders):
+    uri = startStubServer().getURI("/sample.xpi")
+    stubState.add("/sample.xpi", getExtensionData(), etag='"1"')
+    first = analyser.analyseExtensionFromURI(uri, **folders)
+    stubState.add("/sample.xpi", getExtensionData("console.log('changed');"), etag='"2"')
+
+    second = analyser.analyseExtensionFromURI(uri, **folders)
+    analyser.analyseExtensionFromURI(uri, **folders)
+
+    assert second.digest != first.digest
+    assert stubState.getStatuses("/sample.xpi") == [200, 200, 304]
+    assert [h.get("If-None-Match") for h in getConditionalHeaders(stubState, "/sample.xpi")] == [None, '"1"', '"2"']
+    validators, digest = storage.getStore(folders["analysisPath"]).getValidators(uri)
+    assert (validators["etag"], digest["md5"]) == ('"2"', second.digest["md5"])
+
+
+def test_uris_are_requested_unconditionally_without_a_valid_analysis(startStubServer, stubState, folders):
+    uri = startStubServer().getURI("/sample.xpi")
+    stubState.add("/sample.xpi", getExtensionData(), etag='"1"')
+    first = analyser.analyseExtensionFromURI(uri, **folders)
+
+    analyser.analyseExtensionFromURI(uri, force=True, **folders)
+    # The validators are kept but the analysis is not found anymore
+    storage.getStore(folders["analysisPath"]).delete(first.digest["md5"])
+    os.remove(os.path.join(folders["analysisPath"], first.digest["md5"] + ".json"))
+    analyser.analyseExtensionFromURI(uri, **folders)
+
+    assert stubState.getStatuses("/sample.xpi") == [200, 200, 200]
+    assert getConditionalHeaders(stubState, "/sample.xpi") == [{}, {}, {}]
+
+
+def test_unchanged_uris_of_a_batch_reuse_the_analysis(startStubServer, stubState, folders):
+    server = startStubServer()
+    uris = [server.getURI("/{}.xpi".format(i)) for i in range(3)]
+    for i in range(3):
+        stubState.add("/{}.xpi".format(i), getExtensionData(str(i)), etag='"{}"'.format(i))
+    analyser.runBatch("uri", uris[:2], folders, quiet=True, downloader=BulkDownloader())
+
+    summary = analyser.runBatch("uri", uris, folders, quiet=True, downloader=BulkDownloader())
+
+    assert [stubState.getStatuses("/{}.xpi".format(i)) for i in range(3)] == [[200, 304], [200, 304], [200]]
+    assert (summary["analysed"], summary["hits"], summary["misses"], summary["failures"]) == (3, 2, 1, [])
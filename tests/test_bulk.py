@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import os
+import time
+
+import requests
+
+from neto.downloaders.bulk import BulkDownloader
+
+
+def getItems(servers, stubState, tmp_path, count, delay):
+    """
+    Adds count resources spread among the servers and returns the items
+    """
+    items = []
+    for i in range(count):
+        path = "/{}.xpi".format(i)
+        stubState.add(path, os.urandom(1024), delay=delay)
+        items.append((servers[i % len(servers)].getURI(path), str(tmp_path / "{}.xpi".format(i)), None))
+    return items
+
+
+def test_global_and_host_limits(startStubServer, stubState, tmp_path):
+    servers = [startStubServer(), startStubServer()]
+    items = getItems(servers, stubState, tmp_path, 12, 0.2)
+
+    results = list(BulkDownloader(maxDownloads=3, maxPerHost=2).iterDownloads(items))
+
+    assert sorted(r[0] for r in results) == list(range(12))
+    assert all(error is None for *_, error in results)
+    assert stubState.maxActiveTotal == 3
+    assert set(stubState.maxActive.values()) == {2}
+
+
+def test_host_limit_with_a_single_host(startStubServer, stubState, tmp_path):
+    items = getItems([startStubServer()], stubState, tmp_path, 6, 0.2)
+
+    list(BulkDownloader(maxDownloads=6, maxPerHost=2).iterDownloads(items))
+
+    assert stubState.maxActiveTotal == 2
+
+
+def test_results_arrive_as_each_download_finishes(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    items = []
+    for i, delay in enumerate([0.8, 0.0, 0.4]):
+        path = "/{}.xpi".format(i)
+        stubState.add(path, str(i).encode(), delay=delay)
+        items.append((server.getURI(path), str(tmp_path / "{}.xpi".format(i)), None))
+
+    start = time.monotonic()
+    arrivals = []
+    for index, uri, path, digest, validators, error in BulkDownloader(maxDownloads=3).iterDownloads(items):
+        arrivals.append((index, time.monotonic() - start))
+        assert error is None
+        assert uri == items[index][0]
+        assert path == items[index][1]
+        assert digest["sha256"] == hashlib.sha256(str(index).encode()).hexdigest()
+
+    assert [index for index, _ in arrivals] == [1, 2, 0]
+    # The first one is not held back by the slowest one
+    assert arrivals[0][1] < 0.4
+
+
+def test_failed_downloads_are_returned_with_their_error(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    stubState.add("/found.xpi", b"found")
+    items = [
+        (server.getURI("/missing.xpi"), str(tmp_path / "missing.xpi"), None),
+        (server.getURI("/found.xpi"), str(tmp_path / "found.xpi"), None),
+    ]
+
+    results = sorted(BulkDownloader().iterDownloads(items))
+
+    assert isinstance(results[0][5], requests.HTTPError)
+    assert results[0][2] is None
+    assert results[1][5] is None
+    assert (tmp_path / "found.xpi").read_bytes() == b"found"
+    assert sorted(os.listdir(tmp_path)) == ["found.xpi"]
+
+
+def test_closing_the_generator_skips_the_pending_downloads(startStubServer, stubState, tmp_path):
+    items = getItems([startStubServer()], stubState, tmp_path, 6, 0.2)
+
+    downloads = BulkDownloader(maxDownloads=1).iterDownloads(items)
+    next(downloads)
+    downloads.close()
+    time.sleep(0.5)
+
+    assert len(stubState.requests) < 6
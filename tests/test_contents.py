@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import threading
+
+import neto.lib.contents as contents
+import neto.lib.executors as executors
+from neto.lib.archives import PathArchive
+
+
+def getProvider(tmp_path, maxSize=contents.DEFAULT_MAX_SIZE):
+    paths = {}
+    for name in ["a.js", "b.js"]:
+        (tmp_path / name).write_bytes(name.encode() * 100)
+        paths[name] = str(tmp_path / name)
+    return contents.ContentProvider(PathArchive(paths), maxSize=maxSize)
+
+
+def readAll(**kwargs):
+    for name in ["a.js", "b.js", "a.js"]:
+        kwargs["contents"].read(name)
+    return {}
+
+
+def test_reads_are_counted(tmp_path):
+    provider = getProvider(tmp_path)
+    before = contents.getTotals()
+
+    provider.read("a.js")
+    provider.read("a.js")
+    provider.getDigest("b.js")
+    provider.read("b.js")
+    provider.getDigest("a.js")
+
+    assert provider.getStats()["hits"] == 2
+    assert provider.getStats()["misses"] == 2
+    after = contents.getTotals()
+    assert after["hits"] - before["hits"] == 2
+    assert after["misses"] - before["misses"] == 2
+
+
+def test_concurrent_reads_are_counted(tmp_path):
+    provider = getProvider(tmp_path)
+    before = contents.getTotals()
+
+    def read():
+        for _ in range(1000):
+            provider.read("a.js")
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert provider.hits + provider.misses == 4000
+    after = contents.getTotals()
+    assert after["hits"] + after["misses"] - before["hits"] - before["misses"] == 4000
+
+
+def test_reads_of_a_process_pool_are_added(tmp_path):
+    provider = getProvider(tmp_path)
+    before = contents.getTotals()
+
+    executors.runPlugins([readAll, readAll], {"contents": provider}, executor="process", workers=2)
+
+    after = contents.getTotals()
+    # Each worker starts with an empty copy of the provider
+    assert after["hits"] - before["hits"] == 2
+    assert after["misses"] - before["misses"] == 4
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import base64
+import io
+import json
+import os
+import zipfile
+
+import pytest
+from jsonrpc.exceptions import JSONRPCDispatchException
+
+import neto.daemon as daemon
+import neto.lib.resultcache as resultcache
+
+
+@pytest.fixture
+def daemonFolders(tmp_path, monkeypatch):
+    downloads = tmp_path / "downloads"
+    analysis = tmp_path / "analysis"
+    downloads.mkdir()
+    analysis.mkdir()
+    monkeypatch.setattr(daemon, "DOWNLOADS_PATH", str(downloads))
+    monkeypatch.setattr(daemon, "ANALYSIS_PATH", str(analysis))
+    return downloads
+
+
+def getExtension():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zF:
+        zF.writestr("manifest.json", json.dumps({"name": "sample", "version": "1.0"}))
+        zF.writestr("main.js", "console.log('sample');")
+    return buffer.getvalue()
+
+
+def test_base64_is_decoded_in_chunks():
+    contents = os.urandom(100000)
+    reader = daemon.Base64Reader(base64.b64encode(contents).decode())
+
+    chunks = iter(lambda: reader.read(1000), b"")
+    sizes = [len(chunk) for chunk in chunks]
+
+    assert max(sizes) <= 1000
+    assert sum(sizes) == len(contents)
+
+
+def test_analyse_bytes(daemonFolders):
+    contents = getExtension()
+
+    result = daemon.analyse_bytes(base64.b64encode(contents).decode(), "sample.xpi")
+
+    assert result["duplicate"] is False
+    assert result["analysis"]["_size"] == len(contents)
+    assert os.listdir(daemonFolders) == ["upload_{}_sample.xpi".format(result["digest"]["md5"])]
+
+
+@pytest.mark.parametrize("data", ["not base64!", "QUJD=QUJD", "QUJDR", 1234])
+def test_invalid_base64_is_rejected(daemonFolders, data):
+    with pytest.raises(JSONRPCDispatchException) as e:
+        daemon.analyse_bytes(data)
+
+    assert e.value.error.code == daemon.INVALID_PARAMS_ERROR
+    assert os.listdir(daemonFolders) == []
+
+
+def test_big_extensions_are_rejected_before_decoding(daemonFolders, monkeypatch):
+    def fail(data):
+        raise AssertionError("The data should not be decoded")
+    monkeypatch.setattr(daemon, "MAX_UPLOAD_SIZE", 30)
+    monkeypatch.setattr(daemon, "Base64Reader", fail)
+
+    with pytest.raises(JSONRPCDispatchException) as e:
+        daemon.analyse_bytes(base64.b64encode(b"x" * 31).decode())
+
+    assert "bigger than the maximum" in e.value.error.message
+
+
+@pytest.mark.parametrize("cacheSize", [0, 1024 * 1024])
+def test_remote_uris_are_not_downloaded_again(startStubServer, stubState, daemonFolders, monkeypatch, cacheSize):
+    monkeypatch.setattr(daemon, "RESULTS", resultcache.ResultCache(cacheSize, 60, getVersion=daemon.getAnalysisVersion))
+    uri = startStubServer().getURI("/sample.xpi")
+    stubState.add("/sample.xpi", getExtension(), etag='"1"')
+
+    first = daemon.analyseRemote(uri)
+    second = daemon.analyseRemote(uri)
+
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["_digest"] == first["_digest"]
+    if cacheSize:
+        # Answered by the result cache without asking the server
+        assert stubState.getStatuses("/sample.xpi") == [200]
+    else:
+        assert stubState.getStatuses("/sample.xpi") == [200, 304]
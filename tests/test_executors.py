@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import neto.lib.executors as executors
+
+
+def slowPlugin(**kwargs):
+    time.sleep(0.2)
+    return {"slow": kwargs["value"], "shared": "slow"}
+
+
+def fastPlugin(**kwargs):
+    return {"fast": kwargs["value"], "shared": "fast"}
+
+
+def failingPlugin(**kwargs):
+    raise ValueError("broken plugin")
+
+
+def crashingPlugin(**kwargs):
+    os._exit(1)
+
+
+def recordingPlugin(**kwargs):
+    time.sleep(0.2)
+    kwargs["events"].append("pooled")
+    return {"pooled": True}
+
+
+UNSAFE_PLUGIN = """
+import threading
+import time
+
+PARALLEL_SAFE = False
+
+lock = threading.Lock()
+running = 0
+maxRunning = 0
+
+
+def runAnalysis(**kwargs):
+    global running, maxRunning
+    with lock:
+        running += 1
+        maxRunning = max(maxRunning, running)
+    time.sleep(0.1)
+    kwargs["events"].append("unsafe")
+    with lock:
+        running -= 1
+    return {"unsafe": True}
+"""
+
+
+def renamed(function, moduleName):
+    """
+    Returns a copy of a plugin that looks like it belongs to another module
+    """
+    def wrapper(**kwargs):
+        return function(**kwargs)
+    wrapper.__module__ = moduleName
+    return wrapper
+
+
+@pytest.mark.parametrize("executor", executors.EXECUTORS)
+def test_results_are_merged_in_the_order_of_the_list(executor):
+    results = executors.runPlugins([slowPlugin, fastPlugin], {"value": 1}, executor=executor, workers=2)
+
+    assert list(results) == ["slow", "shared", "fast"]
+    # The last plugin of the list wins whichever finishes first
+    assert results["shared"] == "fast"
+
+
+@pytest.mark.parametrize("executor", executors.EXECUTORS)
+def test_results_do_not_depend_on_the_executor(executor):
+    analysisList = [fastPlugin, slowPlugin]
+
+    expected = executors.runPlugins(analysisList, {"value": 2}, executor="serial", workers=1)
+    results = executors.runPlugins(analysisList, {"value": 2}, executor=executor, workers=2)
+
+    assert list(results.items()) == list(expected.items())
+
+
+@pytest.mark.parametrize("executor", ["serial", "thread"])
+def test_failing_plugins_are_recorded(executor):
+    analysisList = [
+        renamed(slowPlugin, "neto.plugins.analysis.first"),
+        renamed(failingPlugin, "neto.plugins.analysis.second"),
+        renamed(fastPlugin, "neto.plugins.analysis.third"),
+    ]
+    produced = {}
+
+    results = executors.runPlugins(analysisList, {"value": 3}, executor=executor, workers=3, produced=produced)
+
+    assert results["slow"] == 3
+    assert results["fast"] == 3
+    assert results["plugin_errors"] == {"second": "ValueError: broken plugin"}
+    assert produced == {
+        "neto.plugins.analysis.first": ["slow", "shared"],
+        "neto.plugins.analysis.third": ["fast", "shared"],
+    }
+
+
+def test_failing_plugins_are_recorded_by_a_process_pool():
+    results = executors.runPlugins([failingPlugin, fastPlugin], {"value": 4}, executor="process", workers=2)
+
+    assert results["fast"] == 4
+    assert results["plugin_errors"] == {"test_executors": "ValueError: broken plugin"}
+
+
+def test_a_dead_worker_does_not_break_the_next_analyses():
+    results = executors.runPlugins([crashingPlugin, fastPlugin], {"value": 5}, executor="process", workers=2)
+
+    assert "BrokenProcessPool" in results["plugin_errors"]["test_executors"]
+
+    for value in [6, 7]:
+        results = executors.runPlugins([fastPlugin, slowPlugin], {"value": value}, executor="process", workers=2)
+        assert "plugin_errors" not in results
+        assert results["fast"] == results["slow"] == value
+
+
+def test_plugins_not_parallel_safe_are_run_alone_and_last(monkeypatch):
+    module = types.ModuleType("neto_test_unsafe")
+    exec(UNSAFE_PLUGIN, module.__dict__)
+    module.runAnalysis.__module__ = module.__name__
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+    assert not executors.isParallelSafe(module.runAnalysis)
+
+    analyses = [[] for _ in range(4)]
+    threads = [
+        threading.Thread(
+            target=executors.runPlugins,
+            args=([module.runAnalysis, recordingPlugin], {"events": events}),
+            kwargs={"executor": "thread", "workers": 2}
+        )
+        for events in analyses
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert module.maxRunning == 1
+    assert analyses == [["pooled", "unsafe"]] * 4
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import re
+
+import pytest
+
+import neto.lib.filecache as filecache
+import neto.lib.scanner as scanner
+
+
+class Clock:
+    """
+    A clock that only moves when told to
+    """
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(filecache.time, "time", clock.time)
+    return clock
+
+
+def getCache(tmp_path, maxSize=1024 * 1024, minFileSize=0):
+    return filecache.FileResultCache(str(tmp_path / "files.db"), maxSize, minFileSize)
+
+
+def getTotalSize(cache):
+    return cache._getConnection().execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+
+def test_results_are_keyed_by_plugin_and_version(tmp_path):
+    cache = getCache(tmp_path)
+    cache.putMany("entities", "v1", {"a" * 64: {"0": ["x"]}})
+
+    assert cache.getMany("entities", "v1", ["a" * 64, "b" * 64]) == {"a" * 64: {"0": ["x"]}}
+    assert cache.getMany("entities", "v2", ["a" * 64]) == {}
+    assert cache.getMany("suspicious", "v1", ["a" * 64]) == {}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = getCache(tmp_path)
+    for i in range(10):
+        clock.now += 1
+        cache.putMany("entities", "v1", {str(i): {"0": [str(i) * 100]}})
+    entrySize = getTotalSize(cache) // 10
+    # The first entry is used again so the second one is the oldest
+    clock.now += filecache.TOUCH_INTERVAL + 1
+    cache.getMany("entities", "v1", ["0"])
+
+    cache.maxSize = entrySize * 8
+    clock.now += 1
+    cache.putMany("entities", "v1", {"10": {"0": ["10" * 50]}})
+
+    found = cache.getMany("entities", "v1", [str(i) for i in range(11)])
+    assert "0" in found and "10" in found
+    assert "1" not in found and "2" not in found
+    assert cache.getStats()["size"] <= cache.maxSize * 0.9
+
+
+def test_entries_read_recently_are_not_touched_again(tmp_path, clock):
+    cache = getCache(tmp_path)
+    cache.putMany("entities", "v1", {"a": {}})
+    lastUsed = "SELECT last_used FROM results"
+
+    clock.now += filecache.TOUCH_INTERVAL - 1
+    cache.getMany("entities", "v1", ["a"])
+    assert cache._getConnection().execute(lastUsed).fetchone()[0] == clock.now - filecache.TOUCH_INTERVAL + 1
+
+    clock.now += 2
+    cache.getMany("entities", "v1", ["a"])
+    assert cache._getConnection().execute(lastUsed).fetchone()[0] == clock.now
+
+
+def test_total_size_follows_replacements_and_evictions(tmp_path):
+    cache = getCache(tmp_path)
+    cache.putMany("entities", "v1", {"a": {"0": ["x"]}, "b": {"0": ["y" * 1000]}})
+    cache.putMany("entities", "v1", {"a": {"0": ["z" * 1000]}})
+    assert cache.getStats()["size"] == getTotalSize(cache)
+
+    cache.maxSize = 1
+    cache.putMany("entities", "v1", {"c": {}})
+    assert cache.getStats()["size"] == getTotalSize(cache) == 0
+
+    # Another cache sharing the database reads the same total
+    assert getCache(tmp_path).getStats()["size"] == 0
+
+
+def test_stats_are_kept_per_plugin_and_cleared(tmp_path):
+    cache = getCache(tmp_path)
+    cache.putMany("entities", "v1", {"a": {}}, hits=3, misses=1)
+    cache.putMany("entities", "v1", {}, hits=2)
+    cache.putMany("suspicious", "v1", {"a": {}}, misses=4)
+
+    stats = cache.getStats()
+    assert stats["plugins"] == {"entities": {"hits": 5, "misses": 1}, "suspicious": {"hits": 0, "misses": 4}}
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (5, 5, 2)
+
+    cache.clear()
+    stats = cache.getStats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["size"], stats["plugins"]) == (0, 0, 0, 0, {})
+
+
+class Archive:
+    def __init__(self, files):
+        self.files = files
+
+    def read(self, name):
+        return self.files[name]
+
+
+@pytest.mark.parametrize("minFileSize", [0, 100])
+def test_identical_files_are_scanned_once(tmp_path, monkeypatch, minFileSize):
+    cache = getCache(tmp_path, minFileSize=minFileSize)
+    monkeypatch.setattr(filecache, "_cache", cache)
+    ruleScanner = scanner.RuleScanner([b"coin(hive)", b"[a-z]+@example\\.com"])
+    archive = Archive({"a.js": b"coinhive admin@example.com", "b.js": b"coinhive admin@example.com", "c.js": b"nothing"})
+
+    results = filecache.scanFiles(ruleScanner, archive, ["a.js", "b.js", "c.js"], "plugin")
+    again = filecache.scanFiles(ruleScanner, archive, ["a.js", "c.js"], "plugin")
+
+    for rule in ruleScanner.rules:
+        assert results["a.js"][rule] == results["b.js"][rule] == again["a.js"][rule] == re.findall(rule, archive.files["a.js"])
+        assert again["c.js"][rule] == []
+    stats = cache.getStats()
+    if minFileSize:
+        # Small files are never looked for
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (0, 0, 0)
+    else:
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 2, 2)
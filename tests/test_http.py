@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import base64
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+
+import pytest
+import requests
+
+from neto.downloaders.http import HTTPResource
+
+
+def download(uri, targetFile):
+    # Small chunks so that everything received before a drop is kept
+    return HTTPResource(uri).downloadToFile(str(targetFile), chunkSize=1024)
+
+
+def test_concurrent_downloads_of_the_same_uri(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    body = os.urandom(256 * 1024)
+    # The first answer is cut so that the partial file is resumed meanwhile
+    stubState.add("/sample.xpi", body, etag='"v1"', delay=0.2, drops=1)
+    targetFile = tmp_path / "sample.xpi"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(download(server.getURI("/sample.xpi"), targetFile)))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(results) == 2
+    for path, digest in results:
+        assert digest["sha256"] == hashlib.sha256(body).hexdigest()
+    assert targetFile.read_bytes() == body
+    assert stubState.maxActiveTotal == 1
+    assert os.listdir(tmp_path) == ["sample.xpi"]
+
+
+def test_waits_for_the_lock_of_another_process(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    stubState.add("/sample.xpi", b"sample", etag='"v1"')
+    targetFile = tmp_path / "sample.xpi"
+    lockFile = tmp_path / "sample.xpi.part.lock"
+    lockFile.write_text(str(os.getppid()))
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(download(server.getURI("/sample.xpi"), targetFile)))
+    thread.start()
+    time.sleep(0.5)
+
+    assert results == []
+    assert stubState.requests == []
+
+    lockFile.unlink()
+    thread.join(5)
+
+    assert len(results) == 1
+    assert targetFile.read_bytes() == b"sample"
+    assert os.listdir(tmp_path) == ["sample.xpi"]
+
+
+def test_removes_the_lock_of_a_dead_process(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    stubState.add("/sample.xpi", b"sample", etag='"v1"')
+    targetFile = tmp_path / "sample.xpi"
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    (tmp_path / "sample.xpi.part.lock").write_text(str(process.pid))
+
+    download(server.getURI("/sample.xpi"), targetFile)
+
+    assert targetFile.read_bytes() == b"sample"
+    assert os.listdir(tmp_path) == ["sample.xpi"]
+
+
+def getRanges(stubState):
+    return [(headers.get("Range"), headers.get("If-Range"), status) for _, headers, status in stubState.requests]
+
+
+def test_interrupted_download_is_resumed_at_once(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    body = os.urandom(300 * 1024)
+    stubState.add("/sample.xpi", body, etag='"v1"', drops=1)
+
+    path, digest = download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+
+    assert digest["sha256"] == hashlib.sha256(body).hexdigest()
+    assert (tmp_path / "sample.xpi").read_bytes() == body
+    assert getRanges(stubState) == [(None, None, 200), ("bytes={}-".format(len(body) // 3), '"v1"', 206)]
+    assert os.listdir(tmp_path) == ["sample.xpi"]
+
+
+def test_interrupted_download_is_resumed_the_next_time(startStubServer, stubState, tmp_path, downloaderSettings):
+    server = startStubServer()
+    body = os.urandom(300 * 1024)
+    stubState.add("/sample.xpi", body, etag='"v1"', drops=downloaderSettings["retries"] + 1)
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+    assert sorted(os.listdir(tmp_path)) == ["sample.xpi.part", "sample.xpi.part.json"]
+    offset = os.path.getsize(tmp_path / "sample.xpi.part")
+    stubState.requests.clear()
+
+    path, digest = download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+
+    assert digest["sha256"] == hashlib.sha256(body).hexdigest()
+    assert (tmp_path / "sample.xpi").read_bytes() == body
+    assert getRanges(stubState) == [("bytes={}-".format(offset), '"v1"', 206)]
+    assert os.listdir(tmp_path) == ["sample.xpi"]
+
+
+def test_changed_resource_is_downloaded_from_the_beginning(startStubServer, stubState, tmp_path, downloaderSettings):
+    server = startStubServer()
+    stubState.add("/sample.xpi", os.urandom(300 * 1024), etag='"v1"', drops=downloaderSettings["retries"] + 1)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+    stubState.requests.clear()
+
+    body = os.urandom(200 * 1024)
+    stubState.add("/sample.xpi", body, etag='"v2"')
+    path, digest = download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+
+    assert digest["sha256"] == hashlib.sha256(body).hexdigest()
+    assert (tmp_path / "sample.xpi").read_bytes() == body
+    # The If-Range of the old version makes the server send the whole new one
+    assert getRanges(stubState)[0][1:] == ('"v1"', 200)
+    assert os.listdir(tmp_path) == ["sample.xpi"]
+
+
+def test_partial_file_without_validators_is_not_kept(startStubServer, stubState, tmp_path, downloaderSettings):
+    server = startStubServer()
+    stubState.add("/sample.xpi", os.urandom(300 * 1024), drops=downloaderSettings["retries"] + 1)
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+
+    assert len(stubState.requests) == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_unsatisfiable_range_starts_over(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    body = os.urandom(1024)
+    stubState.add("/sample.xpi", body, etag='"v1"')
+    # A partial file as long as the resource cannot be resumed
+    (tmp_path / "sample.xpi.part").write_bytes(body)
+    (tmp_path / "sample.xpi.part.json").write_text(json.dumps({
+        "uri": server.getURI("/sample.xpi"), "etag": '"v1"', "last_modified": None, "size": len(body)
+    }))
+
+    path, digest = download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+
+    assert digest["sha256"] == hashlib.sha256(body).hexdigest()
+    assert getRanges(stubState) == [("bytes=1024-", '"v1"', 416), (None, None, 200)]
+    assert os.listdir(tmp_path) == ["sample.xpi"]
+
+
+def test_not_modified_resource_is_not_written(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    stubState.add("/sample.xpi", b"sample", etag='"v1"')
+    resource = HTTPResource(server.getURI("/sample.xpi"))
+    resource.setValidators({"etag": '"v1"', "last_modified": None})
+
+    assert resource.downloadToFile(str(tmp_path / "sample.xpi")) == (None, None)
+    assert stubState.getStatuses("/sample.xpi") == [304]
+    assert os.listdir(tmp_path) == []
+
+
+def getZip(size):
+    """
+    Returns a zip file with a stored (not compressed) member of size bytes
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as zF:
+        zF.writestr("content.js", os.urandom(size))
+    return output.getvalue()
+
+
+def test_digest_announced_by_the_server_is_checked(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    body = os.urandom(1024)
+    stubState.add("/good.xpi", body, headers={"Repr-Digest": "sha-256=:{}:".format(base64.b64encode(hashlib.sha256(body).digest()).decode())})
+    stubState.add("/bad.xpi", body, headers={"Digest": "SHA-256={}".format(base64.b64encode(hashlib.sha256(b"other").digest()).decode())})
+
+    path, digest = download(server.getURI("/good.xpi"), tmp_path / "good.xpi")
+    assert digest["sha256"] == hashlib.sha256(body).hexdigest()
+
+    with pytest.raises(requests.RequestException, match="sha256"):
+        download(server.getURI("/bad.xpi"), tmp_path / "bad.xpi")
+    assert os.listdir(tmp_path) == ["good.xpi"]
+
+
+def test_corrupt_resumed_zip_is_downloaded_again(startStubServer, stubState, tmp_path, downloaderSettings):
+    server = startStubServer()
+    body = getZip(300 * 1024)
+    stubState.add("/sample.xpi", body, etag='"v1"', drops=downloaderSettings["retries"] + 1)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+
+    # Some of the bytes received before resuming are damaged
+    partFile = tmp_path / "sample.xpi.part"
+    damaged = bytearray(partFile.read_bytes())
+    damaged[-100:] = b"\x00" * 100
+    partFile.write_bytes(bytes(damaged))
+    stubState.requests.clear()
+
+    path, digest = download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+
+    assert digest["sha256"] == hashlib.sha256(body).hexdigest()
+    assert (tmp_path / "sample.xpi").read_bytes() == body
+    assert [status for *_, status in getRanges(stubState)] == [206, 200]
+    assert os.listdir(tmp_path) == ["sample.xpi"]
+
+
+def test_interruptions_without_new_data_are_not_resumed(startStubServer, stubState, tmp_path):
+    server = startStubServer()
+    # A third of two bytes: the answers are cut before sending anything
+    stubState.add("/sample.xpi", b"ab", etag='"v1"', drops=10)
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download(server.getURI("/sample.xpi"), tmp_path / "sample.xpi")
+
+    assert len(stubState.requests) == 1
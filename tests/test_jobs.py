@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import threading
+
+import pytest
+
+import neto.lib.jobs as jobs
+
+
+def waitFor(job, timeout=5):
+    """
+    Waits for a job to finish. Its future is removed once it has finished.
+    """
+    future = job.future
+    if future is not None:
+        future.result(timeout=timeout)
+    return job
+
+
+@pytest.fixture
+def blockedQueue():
+    """
+    A queue with a single worker busy until the event is set
+    """
+    queue = jobs.JobQueue(workers=1, maxQueued=2, retention=2)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+        return "blocker"
+
+    blocker = queue.submit("test", "blocker", block)
+    started.wait(5)
+    yield queue, blocker, release
+    release.set()
+    queue.shutdown()
+
+
+def test_job_result_and_failure():
+    queue = jobs.JobQueue(workers=1)
+    ok = waitFor(queue.submit("test", "ok", lambda x: x * 2, 21))
+    ko = waitFor(queue.submit("test", "ko", lambda: 1 / 0))
+    queue.shutdown()
+
+    assert ok.status == jobs.DONE
+    assert ok.result == 42
+    assert ko.status == jobs.FAILED
+    assert ko.error.startswith("ZeroDivisionError")
+    assert queue.getJob(ok.id).getStatus()["status"] == jobs.DONE
+
+
+def test_cancel_a_queued_job(blockedQueue):
+    queue, blocker, release = blockedQueue
+    called = []
+    job = queue.submit("test", "queued", called.append, 1)
+
+    assert queue.getDepth() == 1
+    assert queue.cancel(job.id) is True
+    assert job.status == jobs.CANCELLED
+    assert queue.getDepth() == 0
+    # Cancelling twice still reports it as cancelled
+    assert queue.cancel(job.id) is True
+
+    release.set()
+    waitFor(blocker)
+    assert called == []
+
+
+def test_cancel_a_running_job(blockedQueue):
+    queue, blocker, release = blockedQueue
+
+    assert blocker.status == jobs.RUNNING
+    assert queue.cancel(blocker.id) is False
+
+    release.set()
+    waitFor(blocker)
+    assert blocker.status == jobs.DONE
+    assert queue.cancel(blocker.id) is False
+
+
+def test_queue_full(blockedQueue):
+    queue, blocker, release = blockedQueue
+    queue.submit("test", "first", lambda: None)
+    queue.submit("test", "second", lambda: None)
+
+    with pytest.raises(jobs.QueueFullError):
+        queue.submit("test", "third", lambda: None)
+
+
+def test_unknown_job():
+    queue = jobs.JobQueue(workers=1)
+    with pytest.raises(KeyError):
+        queue.getJob("unknown")
+    with pytest.raises(KeyError):
+        queue.cancel("unknown")
+    queue.shutdown()
+
+
+def test_only_the_most_recent_finished_jobs_are_retained():
+    queue = jobs.JobQueue(workers=1, retention=2)
+    submitted = [waitFor(queue.submit("test", str(i), lambda i=i: i)) for i in range(4)]
+    queue.shutdown()
+
+    with pytest.raises(KeyError):
+        queue.getJob(submitted[0].id)
+    with pytest.raises(KeyError):
+        queue.getJob(submitted[1].id)
+    assert queue.getJob(submitted[2].id).result == 2
+    assert queue.getJob(submitted[3].id).result == 3
+
+
+def test_cancelled_jobs_count_towards_the_retention(blockedQueue):
+    queue, blocker, release = blockedQueue
+    cancelled = [queue.submit("test", str(i), lambda: None) for i in range(2)]
+    for job in cancelled:
+        queue.cancel(job.id)
+
+    # The blocker is still running so it is not affected
+    assert queue.getJob(blocker.id) is blocker
+    release.set()
+    waitFor(blocker)
+
+    with pytest.raises(KeyError):
+        queue.getJob(cancelled[0].id)
+    assert queue.getJob(cancelled[1].id).status == jobs.CANCELLED
+    assert queue.getJob(blocker.id).status == jobs.DONE
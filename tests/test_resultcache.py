@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import pytest
+
+import neto.lib.resultcache as resultcache
+
+
+class Clock:
+    """
+    A clock that only moves when told to
+    """
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resultcache.time, "time", clock.time)
+    return clock
+
+
+def getResult(name, size=0):
+    return {"_filename": name, "padding": "x" * size}
+
+
+def test_disabled_cache_stores_nothing():
+    cache = resultcache.ResultCache(0, 60)
+    cache.put("a" * 64, getResult("a.xpi"), uri="http://example.com/a.xpi")
+
+    assert cache.getByDigest("a" * 64) is None
+    assert cache.getByURI("http://example.com/a.xpi") is None
+    assert cache.getStats()["entries"] == 0
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = resultcache.ResultCache(1024 * 1024, 60)
+    cache.put("a" * 64, getResult("a.xpi"))
+
+    clock.now += 60
+    assert cache.getByDigest("a" * 64) == getResult("a.xpi")
+    clock.now += 1
+    assert cache.getByDigest("a" * 64) is None
+    assert cache.getStats() == {"entries": 0, "size": 0, "uri": {"hits": 0, "misses": 0}, "sha256": {"hits": 1, "misses": 1}}
+
+
+def test_least_recently_used_entries_are_evicted():
+    entrySize = resultcache.ENTRY_OVERHEAD + len('{"_filename": "a.xpi", "padding": ""}') + 1000
+    cache = resultcache.ResultCache(entrySize * 2, 60)
+    cache.put("a" * 64, getResult("a.xpi", 1000))
+    cache.put("b" * 64, getResult("b.xpi", 1000))
+    cache.getByDigest("a" * 64)
+
+    cache.put("c" * 64, getResult("c.xpi", 1000))
+
+    assert cache.getByDigest("b" * 64) is None
+    assert cache.getByDigest("a" * 64) is not None
+    assert cache.getByDigest("c" * 64) is not None
+    assert cache.getStats()["size"] == entrySize * 2
+
+
+def test_analysis_are_keyed_by_version():
+    version = ["1"]
+    cache = resultcache.ResultCache(1024 * 1024, 60, getVersion=lambda: version[0])
+    cache.put("a" * 64, getResult("a.xpi"), uri="http://example.com/a.xpi", validators={"etag": '"1"'})
+
+    version[0] = "2"
+    assert cache.getByDigest("a" * 64) is None
+    # The validators of the URI are kept, but not the analysis
+    assert cache.getByURI("http://example.com/a.xpi") == ({"etag": '"1"'}, "a" * 64, None)
+
+    version[0] = "1"
+    assert cache.getByURI("http://example.com/a.xpi") == ({"etag": '"1"'}, "a" * 64, getResult("a.xpi"))
+    assert cache.getStats()["uri"] == {"hits": 1, "misses": 1}
+
+
+def test_entries_are_kept_on_disk(tmp_path, clock):
+    dbPath = str(tmp_path / "results.db")
+    cache = resultcache.ResultCache(1024 * 1024, 60, dbPath)
+    cache.put("a" * 64, getResult("a.xpi"))
+    clock.now += 30
+    cache.put("b" * 64, getResult("b.xpi"))
+
+    clock.now += 31
+    restarted = resultcache.ResultCache(1024 * 1024, 60, dbPath)
+    assert restarted.getByDigest("a" * 64) is None
+    assert restarted.getByDigest("b" * 64) == getResult("b.xpi")
+    # Entries read from the disk are kept in memory
+    assert restarted.getStats()["entries"] == 1
+
+    restarted.clear()
+    assert resultcache.ResultCache(1024 * 1024, 60, dbPath).getByDigest("b" * 64) is None
+
+
+def test_entries_evicted_from_memory_are_read_from_disk(tmp_path):
+    cache = resultcache.ResultCache(resultcache.ENTRY_OVERHEAD + 100, 60, str(tmp_path / "results.db"))
+    cache.put("a" * 64, getResult("a.xpi", 50))
+    cache.put("b" * 64, getResult("b.xpi", 50))
+
+    assert cache.getStats()["entries"] == 1
+    assert cache.getByDigest("a" * 64) == getResult("a.xpi", 50)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import re
+
+import pytest
+
+import neto.lib.scanner as scanner
+import neto.plugins.analysis.cryptojacking as cryptojacking
+import neto.plugins.analysis.entities as entities
+import neto.plugins.analysis.suspicious as suspicious
+
+SAMPLE = b"""
+var miner = new CoinHive.Anonymous("key"); // https://coin-hive.com/lib/coinhive.min.js
+eval(atob("ZG9jdW1lbnQ=")); document.write(unescape("%3C"));
+contact: admin@example.com, support@example.org. Visit http://www.example.com/path?x=1
+ftp://files.example.net/file.zip 192.168.1.1 10.0.0.1:8080 bitcoin:1BoatSLRHtKNngkdXEeobR76b53LETtpyT
+window.location = "https://evil.example"; new WebSocket("wss://pool.example:3333");
+"""
+
+
+@pytest.mark.parametrize("module", [cryptojacking, entities, suspicious])
+def test_scan_equals_findall_for_plugin_rules(module):
+    rules = scanner.flattenRules(module.REGEXPS)
+    results = module.SCANNER.scan(SAMPLE)
+
+    for rule in rules:
+        assert results[rule] == re.findall(rule, SAMPLE), rule
+
+
+def test_scan_finds_rules_matching_at_the_same_position():
+    rules = [b"coin", b"coinhive", b"coin(hive)", b"c(o)(i)n", b"(?:xyz)?coin\\w+"]
+    data = b"coinhive coin coinhive2"
+
+    results = scanner.RuleScanner(rules).scan(data)
+
+    for rule in rules:
+        assert results[rule] == re.findall(rule, data), rule
+
+
+def test_scan_literal_prefixes():
+    rules = [b"coin-?hive\\.com", b"crypto-?loot\\.(com|net)", b"nothing[0-9]+here"]
+    data = b"coinhive.com coin-hive.com cryptoloot.net crypto-loot.com"
+
+    results = scanner.RuleScanner(rules).scan(data)
+
+    for rule in rules:
+        assert results[rule] == re.findall(rule, data), rule
+
+
+def test_scan_repeated_rules_and_empty_data():
+    rules = [b"eval\\(", b"eval\\(", b"atob"]
+    rs = scanner.RuleScanner(rules)
+
+    assert rs.rules == [b"eval\\(", b"atob"]
+    assert rs.scan(b"") == {b"eval\\(": [], b"atob": []}
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#   Copyright 2017-2018 ElevenPaths
+#
+#   Neto is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import concurrent.futures
+import hashlib
+import json
+import os
+
+import neto.lib.storage as storage
+
+
+def getAnalysis(name, **features):
+    """
+    Returns a minimal analysis of an extension named name
+    """
+    return {
+        "_filename": name,
+        "_digest": {
+            "md5": hashlib.md5(name.encode()).hexdigest(),
+            "sha256": hashlib.sha256(name.encode()).hexdigest(),
+        },
+        "_manifest": {"name": name, "version": "1.0", "permissions": ["tabs"]},
+        "_features": features,
+    }
+
+
+def writeAnalysis(folder, document):
+    path = folder / (document["_digest"]["md5"] + ".json")
+    path.write_text(json.dumps(document))
+    return path
+
+
+def getStore(tmp_path):
+    return storage.AnalysisStore(str(tmp_path / storage.STORE_NAME))
+
+
+def getSearchable(tmp_path):
+    """
+    Returns a store with two analysis that share some of their tokens
+    """
+    store = getStore(tmp_path)
+    miner = getAnalysis(
+        "miner.xpi",
+        entities={"url": [{"value": "https://coinhive.com/lib/coinhive.min.js"}], "email": [{"value": "dev@example.org"}]},
+        comments=[{"value": "Minified by the build"}],
+    )
+    miner["_manifest"]["permissions"] = ["tabs", "storage"]
+    clean = getAnalysis("clean.xpi", entities={"url": [{"value": "https://example.org/storage"}]})
+    for document in [miner, clean]:
+        store.put(json.dumps(document))
+    return store, miner["_digest"]["md5"], clean["_digest"]["md5"]
+
+
+def test_compound_words_are_indexed_whole_and_split():
+    assert storage.tokenize("Coinhive.min.js a") == {"coinhive.min.js", "coinhive", "min", "js"}
+
+
+def test_analysis_are_stored_compressed_with_their_summary(tmp_path):
+    store = getStore(tmp_path)
+    document = getAnalysis("a.xpi")
+    text = json.dumps(document)
+
+    md5 = store.put(text, analysisPath="/analysis/a.json")
+
+    assert store.getText(md5) == text
+    summary = store.list(filename="a.xpi")[0]
+    assert summary["sha256"] == document["_digest"]["sha256"]
+    assert summary["manifest_name"] == "a.xpi"
+    assert summary["analysis_path"] == "/analysis/a.json"
+    assert store.getText("0" * 32) is None
+
+
+def test_analysis_are_replaced_and_deleted_with_their_tokens(tmp_path):
+    store = getStore(tmp_path)
+    document = getAnalysis("a.xpi", entities={"url": [{"value": "http://old.example.com"}]})
+    md5 = store.put(json.dumps(document))
+    document["_features"]["entities"]["url"][0]["value"] = "http://new.example.com"
+    store.put(json.dumps(document))
+
+    assert len(store) == 1
+    assert store.search("old") == set()
+    assert store.search("new") == {md5}
+
+    assert store.delete(md5) is True
+    assert store.delete(md5) is False
+    assert store.search("new") == set()
+
+
+def test_search_requires_all_the_tokens(tmp_path):
+    store, miner, clean = getSearchable(tmp_path)
+
+    assert store.search("example.org") == {miner, clean}
+    assert store.search("coinhive example") == {miner}
+    assert store.search("coinhive unknown") == set()
+
+
+def test_search_can_be_scoped_to_a_field(tmp_path):
+    store, miner, clean = getSearchable(tmp_path)
+
+    assert store.search("storage") == {miner, clean}
+    assert store.search("permissions:storage") == {miner}
+    assert store.search("domain:example.org") == {miner, clean}
+    assert store.search("email:example.org") == {miner}
+    assert store.search("comments:minif*") == {miner}
+    assert store.search("filename:minif*") == set()
+
+
+def test_urls_are_not_taken_as_fields(tmp_path):
+    store, miner, clean = getSearchable(tmp_path)
+
+    assert store.search("https://coinhive.com") == {miner}
+
+
+def test_queries_without_tokens_cannot_be_answered(tmp_path):
+    store, _, _ = getSearchable(tmp_path)
+
+    assert store.search("a") is None
+    assert store.search("domain:") is None
+
+
+def test_index_is_built_again_when_its_version_changes(tmp_path, monkeypatch):
+    store, miner, _ = getSearchable(tmp_path)
+    connection = store._getConnection()
+    with connection:
+        connection.execute("DELETE FROM tokens")
+
+    monkeypatch.setattr(storage, "INDEX_VERSION", storage.INDEX_VERSION + 1)
+    store = getStore(tmp_path)
+
+    assert store.search("coinhive") == {miner}
+    assert store._getConnection().execute("PRAGMA user_version").fetchone()[0] == storage.INDEX_VERSION
+
+
+def test_folder_is_migrated_only_once(tmp_path):
+    for name in ["a.xpi", "b.xpi"]:
+        writeAnalysis(tmp_path, getAnalysis(name))
+
+    assert storage.migrateFolder(str(tmp_path)) == (2, [])
+    store = storage.getStore(str(tmp_path))
+    assert len(store) == 2
+
+    # An empty store is not enough to import the folder again
+    for summary in store.list():
+        store.delete(summary["md5"])
+    assert storage.migrateFolder(str(tmp_path)) is None
+    assert len(store) == 0
+
+
+def test_migration_is_claimed_by_a_single_process(tmp_path):
+    dbPath = str(tmp_path / storage.STORE_NAME)
+    first = storage.AnalysisStore(dbPath)
+    second = storage.AnalysisStore(dbPath)
+
+    assert first.claimFolderImport() is True
+    assert second.claimFolderImport() is False
+    assert first.claimFolderImport() is False
+
+
+def test_opening_a_store_does_not_import_the_folder(tmp_path):
+    writeAnalysis(tmp_path, getAnalysis("a.xpi"))
+
+    assert len(storage.getStore(str(tmp_path))) == 0
+
+
+def test_sections_of_unexpected_types_are_ignored(tmp_path):
+    document = getAnalysis("a.xpi", entities="not a dictionary", comments={"value": "not a list"})
+    document["_manifest"] = ["not", "a", "dictionary"]
+    store = storage.AnalysisStore(str(tmp_path / storage.STORE_NAME))
+
+    assert set(field for _, field in storage.getTokens(document)) == {"filename"}
+    assert store.put(json.dumps(document)) == document["_digest"]["md5"]
+
+
+def test_entities_of_unexpected_types_are_ignored():
+    document = getAnalysis("a.xpi", entities={"url": "http://example.com", "email": [{"value": "me@example.org"}, "x"]})
+
+    tokens = storage.getTokens(document)
+
+    assert ("example.org", "email") in tokens
+    assert ("example.org", "domain") in tokens
+    assert not [t for t in tokens if t[1] == "url"]
+
+
+def test_invalid_files_are_reported_when_importing(tmp_path):
+    folder = tmp_path / "folder"
+    folder.mkdir()
+    writeAnalysis(folder, getAnalysis("a.xpi"))
+    (folder / "list.json").write_text("[1, 2]")
+    (folder / "broken.json").write_text("{")
+    (folder / "nohashes.json").write_text("{}")
+    store = storage.AnalysisStore(str(tmp_path / storage.STORE_NAME))
+
+    imported, failed = store.importFolder(str(folder))
+
+    assert imported == 1
+    assert sorted(os.path.basename(f) for f in failed) == ["broken.json", "list.json", "nohashes.json"]
+
+
+def putRepeatedly(dbPath, text, times):
+    store = storage.AnalysisStore(dbPath)
+    for _ in range(times):
+        store.put(text)
+
+
+def test_concurrent_processes_storing_the_same_extension(tmp_path):
+    dbPath = str(tmp_path / storage.STORE_NAME)
+    text = json.dumps(getAnalysis("a.xpi"))
+    storage.AnalysisStore(dbPath).put(json.dumps(getAnalysis("b.xpi")))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(putRepeatedly, dbPath, text, 50) for _ in range(4)]
+        for future in futures:
+            future.result()
+
+    assert len(storage.AnalysisStore(dbPath)) == 2